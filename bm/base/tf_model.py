@@ -139,19 +139,28 @@ class TensorFlowModel(BaseModel, DtypeMixin):
                             global_step=global_step)
 
     @classmethod
-    def load_model(cls, model_path):
+    def from_params(cls, params, model_path):
+        """Create a model from params as saved by `_save_model` (e.g. those of
+        another model), working in `model_path`. The tf model is not loaded."""
         paths = TensorFlowModel.compute_working_paths(model_path)
-
-        # load params
-        with open(paths['params_filepath'], 'r') as params_file:
-            params = json.load(params_file)
-            #print(params)
+        params = dict(params)
         class_name = params.pop('__class_name__')
         if class_name != cls.__name__:
             raise RuntimeError("attempt to load {0} with class {1}".format(class_name, cls.__name__))
         model = cls(paths=paths, **{k: params[k] for k in params if is_param_name(k)})
         params = model._deserialize(params)
         model.set_params(**params)  # set attributes and deserialized params
+        return model
+
+    @classmethod
+    def load_model(cls, model_path):
+        paths = TensorFlowModel.compute_working_paths(model_path)
+
+        # load params
+        with open(paths['params_filepath'], 'r') as params_file:
+            params = json.load(params_file)
+            #print(params)
+        model = cls.from_params(params, model_path)
 
         # restore random state if needed
         if os.path.isfile(model._random_state_filepath):
@@ -181,15 +190,9 @@ class TensorFlowModel(BaseModel, DtypeMixin):
         self._save_model()
         return self
 
-    @run_in_tf_session()
-    def get_tf_params(self, scope=None):
-        """Get tf params of the model.
-        Returns
-        -------
-        params : dict[str] = np.ndarray
-            Evaluated parameters of the model.
-        """
-        weights = {}
+    def _get_tf_vars(self, scope=None):
+        """Get tf variables of the current graph, by the same keys as `get_tf_params`."""
+        tf_vars = {}
         for var in tf.compat.v1.get_collection(tf.GraphKeys.GLOBAL_VARIABLES, scope=scope):
             key = var.name
             if scope and scope in key:
@@ -198,8 +201,18 @@ class TensorFlowModel(BaseModel, DtypeMixin):
                 key = key[1:]
             if key.endswith(':0'):
                 key = key[:-2]
-            weights[key] = var.eval()
-        return weights
+            tf_vars[key] = var
+        return tf_vars
+
+    @run_in_tf_session()
+    def get_tf_params(self, scope=None):
+        """Get tf params of the model.
+        Returns
+        -------
+        params : dict[str] = np.ndarray
+            Evaluated parameters of the model.
+        """
+        return {key: var.eval() for key, var in self._get_tf_vars(scope).items()}
 
 
 if __name__ == '__main__':
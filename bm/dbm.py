@@ -1,4 +1,6 @@
+import re
 import numpy as np
+from copy import copy
 import tensorflow as tf
 from tensorflow.core.framework import summary_pb2
 from tensorflow.contrib.distributions import Bernoulli
@@ -6,11 +8,36 @@ from tensorflow.contrib.distributions import Bernoulli
 from .base.tf_model import run_in_tf_session
 from .ebm import EnergyBasedModel
 from .layers import BernoulliLayer
+from .utils.fisher import FisherAccumulator, sequential_fi, rao_blackwellize, running_fi_estimates
+from .utils.pruning import remove_units, restrict_state
 from .utils.utils import (make_list_from, write_during_training,
                    batch_iter, epoch_iter,
                    log_sum_exp, log_diff_exp, log_mean_exp, log_std_exp)
 
 
+def _per_layer(params, name, n_layers):
+    """Collect the tf params `name`, `name`_1, ... of all layers."""
+    return [params[name if i == 0 else '{0}_{1}'.format(name, i)] for i in range(n_layers)]
+
+
+# weights-shaped variables, stored as their active entries only in local layers
+_LOCAL_VAR_NAME = re.compile(r'^(weights/W|grads_accumulators/dW|fi_statistics/coactivations)(?:_(\d+))?:0$')
+
+
+def _densify(values, indices, shape):
+    """Scatter the active entries `values` of a local layer at `indices` into a dense matrix."""
+    T = np.zeros(shape, dtype=values.dtype)
+    T[tuple(indices.T)] = values
+    return T
+
+
+def _observe(blocks, callback):
+    """Pass each of `blocks` to `callback` before yielding it."""
+    for block in blocks:
+        callback(block)
+        yield block
+
+
 class DBM(EnergyBasedModel):
     """Deep Boltzmann Machine with EM-like learning algorithm
     based on PCD and mean-field variational inference [1].
@@ -27,6 +54,11 @@ class DBM(EnergyBasedModel):
         otherwise initialize using resp. stochastic layer initializer.
     h_particles_init : None or iterable of None or (n_particles, n_hiddens[i]) np.ndarray
         Same semantics as for `v_particle_init`, but for hidden particles for all layers
+    warm_start : None or dict
+        If provided, initialize momentum buffers ('dvb', 'dW', 'dhb') and running
+        means of hidden activations ('q_means', 'mu_means') from it instead of zeros,
+        e.g. from the training state of a previous DBM restricted to the units
+        of this one (see `get_training_state`).
     n_gibbs_steps : positive int or iterable
         Number of Gibbs steps for PCD. Values are updated after each epoch.
     max_mf_updates : positive int
@@ -59,6 +91,12 @@ class DBM(EnergyBasedModel):
         Controls the amount of sparsity penalty (for different hidden layers).
     sparsity_damping : float in (0, 1)
         Decay rate for hidden activations probs.
+    fi_damping : float in (0, 1)
+        Decay rate of the running means of unit states and co-activations
+        of the persistent particles, from which FI estimates are streamed
+        during training (see `fit` with a pruning schedule). The running
+        means start at zero and are bias-corrected by the number of updates
+        (see `running_fi_estimates`).
     train_metrics_every_iter, val_metrics_every_epoch : positive int
         Control frequency of logging progress
     verbose : bool
@@ -71,6 +109,17 @@ class DBM(EnergyBasedModel):
         Number of hidden activations to display during training (in TensorBoard).
     v_shape : (H, W) or (H, W, C) positive integer tuple
         Shape for displaying filters during training. C should be in {1, 3, 4}.
+    sparse_layers : None or (n_layers,) bool
+        Whether to multiply by the weights of each layer as a sparse matrix
+        of its active weights (`rf_mask` * `prune_mask`) during sampling and
+        mean-field updates. Pays off for heavily pruned layers.
+    local_layers : None or (n_layers,) bool
+        Whether to store only the active weights of each layer (e.g. the
+        receptive fields of the first one), together with a table of their
+        indices, instead of dense matrices. Weights, their momentum and
+        co-activation statistics then take memory and FLOPs proportional to
+        the number of active weights, and the layer is multiplied as a sparse
+        matrix (implies `sparse_layers`). `get_tf_params` still returns them dense.
 
     References
     ----------
@@ -89,16 +138,16 @@ class DBM(EnergyBasedModel):
         Systems, pp. 2447-2455, 2012.
     """
     def __init__(self, rbms=None,
-                 n_particles=100, v_particle_init=None, h_particles_init=None,
+                 n_particles=100, v_particle_init=None, h_particles_init=None, warm_start=None,
                  n_gibbs_steps=5, max_mf_updates=10, mf_tol=1e-7, n_layers=2,
                  learning_rate=0.0005, momentum=0.9, max_epoch=10, batch_size=100,
                  l2=0., max_norm=np.inf,
                  sample_v_states=True, sample_h_states=None,
-                 sparsity_target=0.1, sparsity_cost=0., sparsity_damping=0.9,
+                 sparsity_target=0.1, sparsity_cost=0., sparsity_damping=0.9, fi_damping=0.99,
                  train_metrics_every_iter=10, val_metrics_every_epoch=1,
                  verbose=False, save_after_each_epoch=True,
                  display_filters=0, display_particles=0, v_shape=(28, 28),
-                 model_path='dbm_model/', *args, **kwargs):
+                 sparse_layers=None, local_layers=None, model_path='dbm_model/', *args, **kwargs):
         super(DBM, self).__init__(model_path=model_path, *args, **kwargs)
         self.n_layers = n_layers # added this parameter without _ in the end, otherwise it doesn't find it when loading the model
         self.n_layers_ = n_layers
@@ -109,6 +158,8 @@ class DBM(EnergyBasedModel):
         self.n_particles = n_particles
         self._v_particle_init = v_particle_init
         self._h_particles_init = h_particles_init
+        self._warm_start = warm_start
+        self._params_init = None
 
         self.n_gibbs_steps = make_list_from(n_gibbs_steps)
         self.max_mf_updates = max_mf_updates
@@ -131,6 +182,7 @@ class DBM(EnergyBasedModel):
                 if len(x) == 1:
                     x *= self.n_layers_
         self.sparsity_damping = sparsity_damping
+        self.fi_damping = fi_damping
 
         self.train_metrics_every_iter = train_metrics_every_iter
         self.val_metrics_every_epoch = val_metrics_every_epoch
@@ -148,6 +200,9 @@ class DBM(EnergyBasedModel):
         if len(self.v_shape) == 2:
             self.v_shape = (self.v_shape[0], self.v_shape[1], 1)
 
+        self.sparse_layers = [bool(s) for s in sparse_layers] if sparse_layers is not None else [False] * self.n_layers_
+        self.local_layers = [bool(l) for l in local_layers] if local_layers is not None else [False] * self.n_layers_
+
         # additional attributes
         self.epoch_ = 0
         self.iter_ = 0
@@ -163,6 +218,7 @@ class DBM(EnergyBasedModel):
         self._sparsity_targets = []
         self._sparsity_costs = []
         self._sparsity_damping = None
+        self._fi_damping = None
 
         self._batch_size = None
         self._l2 = None
@@ -185,6 +241,7 @@ class DBM(EnergyBasedModel):
 
         self._rf_mask = []                            
         self._prune_mask = []                           
+        self._active_indices = []
 
         self._dW = []
         self._dvb = None
@@ -194,6 +251,8 @@ class DBM(EnergyBasedModel):
         self._mu_new = []
         self._q_means = []
         self._mu_means = []
+        self._fi_means = []
+        self._fi_coactivations = []
 
         self._v = None
         self._v_new = None
@@ -210,6 +269,7 @@ class DBM(EnergyBasedModel):
         self._log_Z = None
         self._log_proba = None
         self._sample_full = None                                # added this for full sampling from DBM!
+        self._fi_moments = None
 
     def load_rbms(self, rbms):
         if rbms is not None:
@@ -268,6 +328,7 @@ class DBM(EnergyBasedModel):
                 C = tf.constant(self.sparsity_cost[i], dtype=self._tf_dtype, name='sparsity_cost')
                 self._sparsity_costs.append(C)
             self._sparsity_damping = tf.constant(self.sparsity_damping, dtype=self._tf_dtype, name='sparsity_damping')
+            self._fi_damping = tf.constant(self.fi_damping, dtype=self._tf_dtype, name='fi_damping')
 
             self._batch_size = tf.constant(self.batch_size, dtype=tf.int32, name='batch_size')
             self._l2 = tf.constant(self.l2, dtype=self._tf_dtype, name='L2_coef')
@@ -285,20 +346,16 @@ class DBM(EnergyBasedModel):
             self._n_ais_runs = tf.placeholder(tf.int32, [], name='n_ais_runs')
             self._n_runs = tf.placeholder(tf.int32, [], name='n_runs') # added this for sampling from full DBM
 
-    def _make_vars(self):
-        # compose weights and biases of DBM from trained RBMs' ones
-        # and account double-counting evidence problem [1]
+    def _compose_params(self):
+        """Compose weights and biases of DBM from trained RBMs' ones
+        and account double-counting evidence problem [1]."""
         W_init, hb_init = [], []
         vb_init = self._vb_init[0]
-        pruning_masks, rf_masks = [], []                                                            
         for i in range(self.n_layers_):
             W = self._W_init[i]
             vb = self._vb_init[i]
             hb = self._hb_init[i]
 
-            pruning_masks.append(self._prune_masks[i])
-            rf_masks.append(self._rf_masks[i])
-
             # halve weights and biases of intermediate RBMs
             if 0 < i < self.n_layers_ - 1:
                 W *= 0.5
@@ -315,6 +372,20 @@ class DBM(EnergyBasedModel):
             else:  # i > 0
                 hb_init[i - 1] += 0.5 * vb
                 hb_init.append(0.5 * hb if i < self.n_layers_ - 1 else hb)
+        return W_init, vb_init, hb_init
+
+    def _make_vars(self):
+        if self._params_init is not None:
+            # already parameters of a DBM (see `prune`)
+            W_init, vb_init, hb_init = self._params_init
+        else:
+            W_init, vb_init, hb_init = self._compose_params()
+        pruning_masks, rf_masks = self._prune_masks, self._rf_masks
+        # masks are fixed, so are the positions of active weights of sparse and local layers
+        active_indices = [np.argwhere(rf_masks[i] * pruning_masks[i]).astype(np.int64)
+                          if self.sparse_layers[i] or self.local_layers[i] else np.zeros((0, 2), dtype=np.int64)
+                          for i in range(self.n_layers_)]
+        W_init = [W[tuple(active_indices[i].T)] if self.local_layers[i] else W for i, W in enumerate(W_init)]
 
         # initialize weights and biases
         with tf.name_scope('weights'):
@@ -341,14 +412,17 @@ class DBM(EnergyBasedModel):
                 self._rf_mask.append(RF)
                 P = tf.Variable(pruning_masks[i], dtype=self._tf_dtype, name='prune_mask', trainable=False)
                 self._prune_mask.append(P)
+                # a variable in every layer, to be found by name after restoring the graph
+                indices = tf.Variable(active_indices[i], dtype=tf.int64, name='active_indices', trainable=False)
+                self._active_indices.append(indices if self.sparse_layers[i] or self.local_layers[i] else None)
 
         # visualize filters
         if self.display_filters:
             with tf.name_scope('filters_visualization'):
-                W = self._W[0]
+                W = self._dense_W(0)
                 for i in range(self.n_layers_):
                     if i > 0:
-                        W = tf.matmul(W, self._W[i])
+                        W = tf.matmul(W, self._dense_W(i))
                     W_display = tf.transpose(W, [1, 0])
                     W_display = tf.reshape(W_display, [self.n_hiddens_[i], self.v_shape[2],
                                                        self.v_shape[0], self.v_shape[1]])
@@ -357,18 +431,19 @@ class DBM(EnergyBasedModel):
 
         # initialize gradients accumulators
         with tf.name_scope('grads_accumulators'):
-            t = tf.zeros(vb_init.shape, dtype=self._tf_dtype, name='dvb_init')
+            t = self._make_accumulator_init('dvb', vb_init.shape, name='dvb_init')
             self._dvb = tf.Variable(t, name='dvb')
             tf.summary.histogram('dvb_hist', self._dvb)
 
             for i in range(self.n_layers_):
-                T = tf.zeros(W_init[i].shape, dtype=self._tf_dtype, name='dW_init')
+                T = self._make_accumulator_init('dW', W_init[i].shape, i, name='dW_init',
+                                                indices=active_indices[i] if self.local_layers[i] else None)
                 dW = tf.Variable(T, name='dW')
                 tf.summary.histogram('dW_hist', dW)
                 self._dW.append(dW)
 
             for i in range(self.n_layers_):
-                t = tf.zeros(hb_init[i].shape, dtype=self._tf_dtype, name='dhb_init')
+                t = self._make_accumulator_init('dhb', hb_init[i].shape, i, name='dhb_init')
                 dhb = tf.Variable(t, name='dhb')
                 tf.summary.histogram('dhb_hist', dhb)
                 self._dhb.append(dhb)
@@ -387,11 +462,21 @@ class DBM(EnergyBasedModel):
         # initialize running means of hidden activations means
         with tf.name_scope('hidden_means_accumulators'):
             for i in range(self.n_layers_):
-                T = tf.Variable(tf.zeros([self.n_hiddens_[i]], dtype=self._tf_dtype), name='q_means')
+                T = tf.Variable(self._make_accumulator_init('q_means', [self.n_hiddens_[i]], i), name='q_means')
                 self._q_means.append(T)
-                S = tf.Variable(tf.zeros([self.n_hiddens_[i]], dtype=self._tf_dtype), name='mu_means')
+                S = tf.Variable(self._make_accumulator_init('mu_means', [self.n_hiddens_[i]], i), name='mu_means')
                 self._mu_means.append(S)
 
+        # initialize running means of particles' states and co-activations (for streaming FI)
+        with tf.name_scope('fi_statistics'):
+            n_units = [self.n_visible_] + self.n_hiddens_
+            for i in range(self.n_layers_ + 1):
+                t = tf.Variable(tf.zeros([n_units[i]], dtype=self._tf_dtype), name='means')
+                self._fi_means.append(t)
+            for i in range(self.n_layers_):
+                T = tf.Variable(tf.zeros(W_init[i].shape, dtype=self._tf_dtype), name='coactivations')
+                self._fi_coactivations.append(T)
+
         # initialize negative particles
         with tf.name_scope('negative_particles'):
             if self._v_particle_init is not None:
@@ -416,15 +501,44 @@ class DBM(EnergyBasedModel):
                     self._H.append(h)
                     self._H_new.append(h_new)
 
+    def _make_accumulator_init(self, key, shape, i=None, name=None, indices=None):
+        """Zeros, or the resp. values from `warm_start` if provided
+        (only those at `indices`, for local layers)."""
+        if self._warm_start is None:
+            return tf.zeros(shape, dtype=self._tf_dtype, name=name)
+        value = self._warm_start[key] if i is None else self._warm_start[key][i]
+        if indices is not None:
+            value = np.asarray(value)[tuple(indices.T)]
+        return tf.constant(value, shape=shape, dtype=self._tf_dtype, name=name)
+
+    def _weights_shape(self, i):
+        return [([self.n_visible_] + self.n_hiddens_)[i], self.n_hiddens_[i]]
+
+    def _dense_W(self, i):
+        """Weights of layer `i` as a dense matrix."""
+        if not self.local_layers[i]:
+            return self._W[i]
+        return tf.scatter_nd(self._active_indices[i], self._W[i], self._weights_shape(i))
+
+    def _matmul(self, x, i, transpose=False):
+        """Compute `x` W_i (or `x` W_i^T), using only the active weights of sparse and local layers."""
+        indices = self._active_indices[i]
+        if indices is None:
+            return tf.matmul(x, self._W[i], transpose_b=transpose)
+        values = self._W[i] if self.local_layers[i] else tf.gather_nd(self._W[i], indices)
+        W = tf.SparseTensor(indices, values, self._weights_shape(i))
+        # x W = (W^T x^T)^T, x W^T = (W x^T)^T
+        return tf.transpose(tf.sparse.sparse_dense_matmul(W, x, adjoint_a=not transpose, adjoint_b=True))
+
     def _make_gibbs_step(self, v, H, v_new, H_new, update_v=True, sample=True):
         """Compute one Gibbs step."""
         with tf.name_scope('gibbs_step'):
 
             # update first hidden layer
             with tf.name_scope('means_h0_hat_given_v_h1'):
-                T = tf.matmul(v, self._W[0])
+                T = self._matmul(v, 0)
                 if self.n_layers_ >= 2:
-                    T += tf.matmul(a=H[1], b=self._W[1], transpose_b=True)
+                    T += self._matmul(H[1], 1, transpose=True)
                 H_new[0] = self._h_layers[0].activation(T, self._hb[0])
             if sample and self.sample_h_states[0]:
                 with tf.name_scope('sample_h0_hat_given_v_h1'):
@@ -433,8 +547,8 @@ class DBM(EnergyBasedModel):
             # update the intermediate hidden layers if any
             for i in range(1, self.n_layers_ - 1):
                 with tf.name_scope('means_h{0}_hat_given_h{1}_hat_h{2}'.format(i, i - 1, i + 1)):
-                    T1 = tf.matmul(H_new[i - 1], self._W[i])
-                    T2 = tf.matmul(a=H[i + 1], b=self._W[i + 1], transpose_b=True)
+                    T1 = self._matmul(H_new[i - 1], i)
+                    T2 = self._matmul(H[i + 1], i + 1, transpose=True)
                     H_new[i] = self._h_layers[i].activation(T1 + T2, self._hb[i])
                 if sample and self.sample_h_states[i]:
                     with tf.name_scope('sample_h{0}_hat_given_h{1}_hat_h{2}'.format(i, i - 1, i + 1)):
@@ -443,7 +557,7 @@ class DBM(EnergyBasedModel):
             # update last hidden layer
             if self.n_layers_ >= 2:
                 with tf.name_scope('means_h{0}_hat_given_h{1}_hat'.format(self.n_layers_ - 1, self.n_layers_ - 2)):
-                    T = tf.matmul(H_new[-2], self._W[-1])
+                    T = self._matmul(H_new[-2], -1)
                     H_new[-1] = self._h_layers[-1].activation(T, self._hb[-1])
                 if sample and self.sample_h_states[-1]:
                     with tf.name_scope('sample_h{0}_hat_given_h{1}_hat'.format(self.n_layers_ - 1, self.n_layers_ - 2)):
@@ -452,7 +566,7 @@ class DBM(EnergyBasedModel):
             # update visible layer if needed
             if update_v:
                 with tf.name_scope('means_v_hat_given_h0_hat'):
-                    T = tf.matmul(a=H_new[0], b=self._W[0], transpose_b=True)
+                    T = self._matmul(H_new[0], 0, transpose=True)
                     v_new = self._v_layer.activation(T, self._vb)
                 if sample and self.sample_v_states:
                     with tf.name_scope('sample_v_hat_given_h_hat'):
@@ -472,9 +586,9 @@ class DBM(EnergyBasedModel):
             T = None
             for i in range(self.n_layers_):
                 if i == 0:
-                    T = 2. * tf.matmul(self._X_batch, self._W[0])
+                    T = 2. * self._matmul(self._X_batch, 0)
                 else:
-                    T = tf.matmul(T, self._W[i])
+                    T = self._matmul(T, i)
                     if i < self.n_layers_ - 1:
                         T *= 2.
                 T = self._h_layers[i].activation(T, self._hb[i])
@@ -545,9 +659,36 @@ class DBM(EnergyBasedModel):
             H_new_updates = [self._H_new[i].assign(H_new[i]) for i in range(self.n_layers_)]
         return v_update, H_updates, v_new_update, H_new_updates
 
-    def _apply_max_norm(self, T):
-        T_norm = tf.norm(T, axis=0)
-        return T * tf.minimum(T_norm, self._max_norm) / tf.maximum(T_norm, 1e-8), T_norm
+    def _apply_max_norm(self, T, i=None):
+        if i is None or not self.local_layers[i]:
+            T_norm = tf.norm(T, axis=0)
+            return T * tf.minimum(T_norm, self._max_norm) / tf.maximum(T_norm, 1e-8), T_norm
+        # norms of the columns of a local layer
+        cols = self._active_indices[i][:, 1]
+        T_norm = tf.sqrt(tf.unsorted_segment_sum(tf.square(T), cols, self.n_hiddens_[i]))
+        scale = tf.minimum(T_norm, self._max_norm) / tf.maximum(T_norm, 1e-8)
+        return T * tf.gather(scale, cols), T_norm
+
+    def _outer_mean(self, x, y, n, i):
+        """Mean outer product `x`^T `y` / `n` of the states of layers `i` and `i` + 1
+        (only at the active weights, for local layers)."""
+        if not self.local_layers[i]:
+            return tf.matmul(a=x, b=y, transpose_a=True) / n
+        indices = self._active_indices[i]
+        return tf.reduce_sum(tf.gather(x, indices[:, 0], axis=1) * tf.gather(y, indices[:, 1], axis=1), axis=0) / n
+
+    def _per_weight(self, t, i):
+        """Broadcast per hidden unit values `t` of layer `i` over its weights."""
+        if not self.local_layers[i]:
+            return t
+        return tf.gather(t, self._active_indices[i][:, 1])
+
+    def _weights_mask(self, i):
+        """Product of receptive field and prune mask of layer `i`, like its weights."""
+        mask = self._rf_mask[i] * self._prune_mask[i]
+        if not self.local_layers[i]:
+            return mask
+        return tf.gather_nd(mask, self._active_indices[i])
 
     def _make_train_op(self):
         # run mean-field updates for current mini-batch
@@ -592,18 +733,20 @@ class DBM(EnergyBasedModel):
                 dW = []
                 # first layer of weights
                 with tf.name_scope('dW'):
-                    dW_0_positive = tf.matmul(a=self._X_batch, b=self._mu[0], transpose_a=True) / self._N
-                    dW_0_negative = tf.matmul(a=self._v, b=self._H[0], transpose_a=True) / self._M
+                    dW_0_positive = self._outer_mean(self._X_batch, self._mu[0], self._N, 0)
+                    dW_0_negative = self._outer_mean(self._v, self._H[0], self._M, 0)
                     dW_0 = (dW_0_positive - dW_0_negative) - self._l2 * self._W[0]
                     dW.append(dW_0)
+                    coactivations = [dW_0_negative]
 
                 # ... rest of them
                 for i in range(1, self.n_layers_):
                     with tf.name_scope('dW'):
-                        dW_i_positive = tf.matmul(a=self._mu[i - 1], b=self._mu[i], transpose_a=True) / self._N
-                        dW_i_negative = tf.matmul(a=self._H[i - 1], b=self._H[i], transpose_a=True) / self._M
+                        dW_i_positive = self._outer_mean(self._mu[i - 1], self._mu[i], self._N, i)
+                        dW_i_negative = self._outer_mean(self._H[i - 1], self._H[i], self._M, i)
                         dW_i = (dW_i_positive - dW_i_negative) - self._l2 * self._W[i]
                         dW.append(dW_i)
+                        coactivations.append(dW_i_negative)
 
                 dhb = []
                 # hidden biases
@@ -623,7 +766,7 @@ class DBM(EnergyBasedModel):
                                                         (1 - self._sparsity_damping) * mu_means[i])
                     sparsity_penalty = self._sparsity_costs[i] * (q_update - self._sparsity_targets[i])
                     sparsity_penalty += self._sparsity_costs[i] * (mu_update - self._sparsity_targets[i])
-                    dW[i] -= sparsity_penalty
+                    dW[i] -= self._per_weight(sparsity_penalty, i)
                     dhb[i] -= sparsity_penalty
 
             # update parameters
@@ -638,19 +781,18 @@ class DBM(EnergyBasedModel):
                     with tf.name_scope('dW'):
 
                         # multiply with both boolean masks!                                                             
-                        masked1 = tf.multiply(dW[i], self._rf_mask[i])
-                        masked2 = tf.multiply(masked1, self._prune_mask[i])
+                        mask = self._weights_mask(i)
+                        masked2 = tf.multiply(dW[i], mask)
 
                         dW_update = self._dW[i].assign(self._learning_rate * (self._momentum * self._dW[i] + masked2))  
                         #dW_update = self._dW[i].assign(self._learning_rate * (self._momentum * self._dW[i] + dW[i]))
 
                         W_update = self._W[i] + dW_update
                         with tf.name_scope('max_norm'):
-                            W_new, W_norm = self._apply_max_norm(W_update)
+                            W_new, W_norm = self._apply_max_norm(W_update, i)
 
                         # multiply with both boolean masks!                                                           
-                        W_new1 = tf.multiply(W_new, self._rf_mask[i])
-                        W_new2 = tf.multiply(W_new1, self._prune_mask[i])
+                        W_new2 = tf.multiply(W_new, mask)
 
                         W_update = self._W[i].assign(W_new2)                                                        
 
@@ -665,16 +807,25 @@ class DBM(EnergyBasedModel):
                         hb_update = self._hb[i].assign_add(dhb_update)
                         hb_updates.append(hb_update)
 
+            # update running means of the particles' statistics
+            with tf.name_scope('fi_statistics'):
+                fi_updates = []
+                for t, x in zip(self._fi_means, [self._v] + self._H):
+                    fi_updates.append(t.assign(self._fi_damping * t + (1 - self._fi_damping) * tf.reduce_mean(x, axis=0)))
+                for T, C in zip(self._fi_coactivations, coactivations):
+                    fi_updates.append(T.assign(self._fi_damping * T + (1 - self._fi_damping) * C))
+
             # assemble train_op
             with tf.name_scope('training_step'):
                 train_op = tf.group(vb_update,
                                     tf.group(*W_updates),
-                                    tf.group(*hb_updates))
+                                    tf.group(*hb_updates),
+                                    tf.group(*fi_updates))
                 tf.add_to_collection('train_op', train_op)
 
             # compute metrics
             with tf.name_scope('mean_squared_reconstruction_error'):
-                T = tf.matmul(a=self._mu[0], b=self._W[0], transpose_b=True)
+                T = self._matmul(self._mu[0], 0, transpose=True)
                 v_means = self._v_layer.activation(T, self._vb)
                 v_means = tf.identity(v_means, name='x_reconstruction')
                 msre = tf.reduce_mean(tf.square(self._X_batch - v_means))
@@ -702,10 +853,10 @@ class DBM(EnergyBasedModel):
         T1 = tf.einsum('ij,j->i', x, self._hb[0])
         T1 *= beta
         log_p = T1
-        T2 = tf.matmul(x, b=self._W[0], transpose_b=True) + self._vb
+        T2 = self._matmul(x, 0, transpose=True) + self._vb
         T2 *= beta
         log_p += tf.reduce_sum(tf.nn.softplus(T2), axis=1)
-        T3 = tf.matmul(x, self._W[1]) + self._hb[1]
+        T3 = self._matmul(x, 1) + self._hb[1]
         T3 *= beta
         log_p += tf.reduce_sum(tf.nn.softplus(T3), axis=1)
         return log_p
@@ -716,20 +867,20 @@ class DBM(EnergyBasedModel):
 
         def body(step, max_step, x):
             # v_hat <- P(v|h=x)
-            T1 = tf.matmul(a=x, b=self._W[0], transpose_b=True)
+            T1 = self._matmul(x, 0, transpose=True)
             v = self._v_layer.activation(beta * T1, beta * self._vb)
             if self.sample_v_states:
                 v = self._v_layer.sample(means=v)
 
             # h2_hat <- P(h2|h=x)
-            T2 = tf.matmul(x, self._W[1])
+            T2 = self._matmul(x, 1)
             h2 = self._h_layers[1].activation(beta * T2, beta * self._hb[1])
             if self.sample_h_states[1]:
                 h2 = self._h_layers[1].sample(means=h2)
 
             # x_hat <- P(h|v=v_hat, h2=h2_hat)
-            T3 = tf.matmul(v, self._W[0])
-            T4 = tf.matmul(a=h2, b=self._W[1], transpose_b=True)
+            T3 = self._matmul(v, 0)
+            T4 = self._matmul(h2, 1, transpose=True)
             x_hat = self._h_layers[0].activation(beta * (T3 + T4), beta * self._hb[0])
             if self.sample_h_states[0]:
                 x_hat = self._h_layers[0].sample(means=x_hat)
@@ -791,9 +942,9 @@ class DBM(EnergyBasedModel):
 
             n_mf_updates, mu_updates = self._make_mf()
             with tf.control_dependencies(mu_updates):
-                t1 = tf.matmul(self._X_batch, self._W[0])
+                t1 = self._matmul(self._X_batch, 0)
                 minus_E = tf.reduce_sum(t1 * self._mu[0], axis=1)
-                t2 = tf.matmul(self._mu[0], self._W[1])
+                t2 = self._matmul(self._mu[0], 1)
                 minus_E += tf.reduce_sum(t2 * self._mu[1], axis=1)
                 minus_E += tf.einsum('ij,j->i', self._X_batch, self._vb)
                 minus_E += tf.einsum('ij,j->i', self._mu[0], self._hb[0])
@@ -845,7 +996,7 @@ class DBM(EnergyBasedModel):
             feed_dict['input_data/{0}:0'.format(k)] = v
         return feed_dict
 
-    def _train_epoch(self, X):
+    def _train_epoch(self, X, pruning_schedule=None):
         train_msres, train_n_mf_updates = [], []
         for X_batch in batch_iter(X, self.batch_size, verbose=self.verbose):
             self.iter_ += 1
@@ -859,6 +1010,8 @@ class DBM(EnergyBasedModel):
             else:
                 self._tf_session.run(self._train_op,
                                      feed_dict=self._make_tf_feed_dict(X_batch))
+            if pruning_schedule is not None and pruning_schedule.step(self.iter_) is not None:
+                self._apply_pruning_schedule(pruning_schedule)
         return (np.mean(train_msres) if train_msres else None,
                 np.mean(train_n_mf_updates) if train_n_mf_updates else None)
 
@@ -878,7 +1031,44 @@ class DBM(EnergyBasedModel):
         #self._tf_val_writer.add_summary(s, self.iter_)
         return mean_msre, mean_n_mf_updates
 
-    def _fit(self, X, X_val=None, *args, **kwargs):
+    def _apply_pruning_schedule(self, pruning_schedule):
+        """Prune weights according to the FI streamed from the particles so far,
+        zero them together with their momentum and update the prune masks."""
+        n = self.n_layers_
+        weights, grads = self._get_tf_vars('weights'), self._get_tf_vars('grads_accumulators')
+        masks, stats = self._get_tf_vars('masks'), self._get_tf_vars('fi_statistics')
+        W_vars, dW_vars = _per_layer(weights, 'W', n), _per_layer(grads, 'dW', n)
+        rf_vars, prune_vars = _per_layer(masks, 'rf_mask', n), _per_layer(masks, 'prune_mask', n)
+        W, dW, rf, prune, means, coactivations, indices = self._tf_session.run(
+            [W_vars, dW_vars, rf_vars, prune_vars,
+             _per_layer(stats, 'means', n + 1), _per_layer(stats, 'coactivations', n),
+             _per_layer(masks, 'active_indices', n)])
+
+        # criteria work on dense matrices, local layers are stored compactly
+        def dense(T, i):
+            return _densify(T, indices[i], rf[i].shape) if self.local_layers[i] else T
+
+        def compact(T, i):
+            return T[tuple(indices[i].T)] if self.local_layers[i] else T
+
+        W = [dense(T, i) for i, T in enumerate(W)]
+        dW = [dense(T, i) for i, T in enumerate(dW)]
+        coactivations = [dense(T, i) for i, T in enumerate(coactivations)]
+
+        # the running means are updated once per training step since they were created
+        fi = running_fi_estimates(means, coactivations, self.fi_damping, self.iter_)
+        keeps = pruning_schedule(self.iter_, W, [R * P for R, P in zip(rf, prune)], fi)
+        for i, K in enumerate(keeps):
+            prune_vars[i].load(prune[i] * K, self._tf_session)
+            W_vars[i].load(compact(W[i] * K, i), self._tf_session)
+            dW_vars[i].load(compact(dW[i] * K, i), self._tf_session)
+        if self.verbose:
+            write_during_training("iter {0}: pruning step {1}, active weights: {2}".format(
+                self.iter_, pruning_schedule.step(self.iter_), [int(np.count_nonzero(K)) for K in keeps]))
+
+    def _fit(self, X, X_val=None, pruning_schedule=None, *args, **kwargs):
+        """Train the DBM, pruning it gradually on the fly if a
+        `bm.utils.pruning.PruningSchedule` is given."""
         # load ops requested
         self._train_op = tf.get_collection('train_op')[0]
         self._msre = tf.get_collection('msre')[0]
@@ -888,7 +1078,7 @@ class DBM(EnergyBasedModel):
         val_msre, val_n_mf_updates = None, None
         for self.epoch_ in epoch_iter(start_epoch=self.epoch_, max_epoch=self.max_epoch,
                                       verbose=self.verbose):
-            train_msre, train_n_mf_updates = self._train_epoch(X)
+            train_msre, train_n_mf_updates = self._train_epoch(X, pruning_schedule=pruning_schedule)
 
             # run validation metrics if needed
             if X_val is not None and self.epoch_ % self.val_metrics_every_epoch == 0:
@@ -911,6 +1101,127 @@ class DBM(EnergyBasedModel):
             if self.save_after_each_epoch:
                 self._save_model(global_step=self.epoch_)
 
+    def get_training_state(self):
+        """Get the state of training beyond weights and biases.
+
+        Returns
+        -------
+        state : dict
+            Persistent particles 'v' (n_particles, n_visible) and 'H' (per hidden
+            layer), momentum buffers 'dvb', 'dW' and 'dhb', and running means
+            of hidden activations 'q_means' and 'mu_means', e.g. to warm-start
+            a pruned DBM (see `warm_start`).
+        """
+        n = self.n_layers_
+        grads = self.get_tf_params(scope='grads_accumulators')
+        means = self.get_tf_params(scope='hidden_means_accumulators')
+        particles = self.get_tf_params(scope='negative_particles')
+        return dict(v=particles['v'],
+                    H=[particles['h_particle/h' if i == 0 else 'h_particle_{0}/h'.format(i)] for i in range(n)],
+                    dvb=grads['dvb'], dW=_per_layer(grads, 'dW', n), dhb=_per_layer(grads, 'dhb', n),
+                    q_means=_per_layer(means, 'q_means', n), mu_means=_per_layer(means, 'mu_means', n))
+
+    def prune(self, masks=None, keep_units=None, model_path=None, warm_start=True,
+              storage=None, params=None, state=None):
+        """Prune weights and remove units of the DBM in place.
+
+        Weights, biases and receptive fields of the remaining units are carried
+        over exactly, without composing them from RBMs again. The graph of the
+        smaller DBM is built and saved once. Epoch and iteration counters are
+        reset, so that `fit` retrains the pruned DBM for `max_epoch` epochs.
+
+        Parameters
+        ----------
+        masks : None or iterable of None or (n_i, n_{i+1}) array-like
+            Weights to keep in each layer, from the visible layer upwards,
+            on top of the current prune masks. None keeps all weights.
+        keep_units : None or iterable of None or (n_i,) bool array-like
+            Units to keep in each layer, starting with the visible one,
+            e.g. from `bm.utils.pruning.surviving_units`. None keeps all units.
+        model_path : None or str
+            Where to save the pruned DBM (default: replace the current one).
+        warm_start : bool
+            Whether to continue the persistent particles, momentum buffers and
+            running means of hidden activations on the remaining units, or to
+            start them anew.
+        storage : None or iterable of {'dense', 'sparse', 'local'}
+            Storage of the weights of each layer of the pruned DBM, e.g. from
+            `bm.utils.pruning.choose_storage` (default: unchanged). The current
+            graph is read with the current storage before switching.
+        params : None or dict
+            Weights ('W', 'vb', 'hb', ...) and masks ('rf_mask', 'prune_mask', ...)
+            of the current DBM as dense arrays, e.g. already in memory
+            (default: read from the current graph).
+        state : None or dict
+            Training state of the current DBM as from `get_training_state`,
+            e.g. already in memory (default: read from the current graph).
+            Only used if `warm_start`.
+
+        Returns
+        -------
+        self
+        """
+        n = self.n_layers_
+        if params is None:
+            params = dict(self.get_tf_params(scope='weights'), **self.get_tf_params(scope='masks'))
+        if not warm_start:
+            state = None
+        elif state is None:
+            state = self.get_training_state()
+        if storage is not None:
+            storage = list(storage)
+            if len(storage) != n or not set(storage) <= {'dense', 'sparse', 'local'}:
+                raise ValueError("`storage` must be one of 'dense', 'sparse' or 'local' "
+                                 "for each of {0} layers, got {1}".format(n, storage))
+            self.local_layers = [st == 'local' for st in storage]
+            self.sparse_layers = [st == 'sparse' for st in storage]
+
+        weights = _per_layer(params, 'W', n)
+        biases = [params['vb']] + _per_layer(params, 'hb', n)
+        rf_masks = _per_layer(params, 'rf_mask', n)
+        prune_masks = _per_layer(params, 'prune_mask', n)
+        if masks is not None:
+            prune_masks = [P if M is None else P * (np.asarray(M) != 0)
+                           for P, M in zip(prune_masks, masks)]
+        keeps = [R * P for R, P in zip(rf_masks, prune_masks)]
+        if keep_units is None:
+            keep_units = [None] * (n + 1)
+        alive = [np.ones(len(b), dtype=bool) if a is None else np.asarray(a, dtype=bool)
+                 for b, a in zip(biases, keep_units)]
+
+        weights, _, biases = remove_units(weights, keeps, biases, alive)
+        self._rf_masks = [R[np.ix_(alive[i], alive[i + 1])] for i, R in enumerate(rf_masks)]
+        self._prune_masks = [P[np.ix_(alive[i], alive[i + 1])] for i, P in enumerate(prune_masks)]
+        self._params_init = (weights, biases[0], biases[1:])
+
+        self.n_visible_ = len(biases[0])
+        self.n_hiddens_ = [len(b) for b in biases[1:]]
+        layers = [getattr(self, '_v_layer', None)] + (getattr(self, '_h_layers', None) or [None] * n)
+        layers = [copy(l) if l is not None else BernoulliLayer(n_units=None, dtype=self.dtype) for l in layers]
+        for l, b in zip(layers, biases):
+            l.n_units = len(b)
+        self._v_layer, self._h_layers = layers[0], layers[1:]
+
+        if state is not None:
+            state = restrict_state(state, keeps, alive)
+            self._v_particle_init, self._h_particles_init = state['v'], state['H']
+        else:
+            self._v_particle_init, self._h_particles_init = None, None
+        self._warm_start = state
+
+        # forget the tf objects of the old graph, `init` builds the new one from scratch
+        for name in ('_n_hiddens', '_sparsity_targets', '_sparsity_costs',
+                     '_W', '_hb', '_rf_mask', '_prune_mask', '_active_indices', '_dW', '_dhb',
+                     '_mu', '_mu_new', '_q_means', '_mu_means', '_fi_means', '_fi_coactivations',
+                     '_H', '_H_new'):
+            setattr(self, name, [])
+        self.epoch_ = 0
+        self.iter_ = 0
+        if model_path is not None:
+            self.update_working_paths(model_path=model_path)
+        self.initialized_ = False
+        return self.init()
+
     @run_in_tf_session()
     def transform(self, X, np_dtype=None):
         """Compute hidden units' (from last layer) activation probabilities."""
@@ -920,7 +1231,7 @@ class DBM(EnergyBasedModel):
         G = np.zeros((len(X), self.n_hiddens_[-1]), dtype=np_dtype)
         start = 0
         for X_b in batch_iter(X, batch_size=self.batch_size,
-                              verbose=self.verbose, desc='transform'):
+                              verbose=self.verbose, desc='transform', keep_order=True):
             G_b = self._transform_op.eval(feed_dict=self._make_tf_feed_dict(X_b))
             G[start:(start + self.batch_size)] = G_b
             start += self.batch_size
@@ -1007,7 +1318,7 @@ class DBM(EnergyBasedModel):
         self._log_proba = tf.get_collection('log_proba')[0]
         P = np.zeros(len(X_test))
         start = 0
-        for X_b in batch_iter(X_test, batch_size=self.batch_size, verbose=self.verbose):
+        for X_b in batch_iter(X_test, batch_size=self.batch_size, verbose=self.verbose, keep_order=True):
             P_b = self._log_proba.eval(feed_dict=self._make_tf_feed_dict(X_b))
             P[start:(start + self.batch_size)] = P_b
             start += self.batch_size
@@ -1031,26 +1342,226 @@ class DBM(EnergyBasedModel):
 
 
 
-    # added this function to make the sampling from the DBM work!                
-    @run_in_tf_session(update_seed=True)
-    def sample_gibbs(self, n_gibbs_steps=100, save_model=False, n_runs=1000):
-
+    def _iter_full_samples(self, n_gibbs_steps, n_runs, rao_blackwell=False):
+        """Yield (n_particles, n_visible + sum(n_hiddens)) blocks of samples
+        until at least `n_runs` samples are drawn. Must be called inside a TF session.
+        If `rao_blackwell`, states of odd hidden layers are replaced by their
+        conditional means (see `rao_blackwellize`).
+        """
         # number of times we call the Gibbs sampler
         n_call = int(np.ceil(n_runs/self.n_particles))
 
-        # list for all the "full" samples from all hidden layers
-        all_full = []
-
+        self._sample_full = tf.get_collection('sample_full')[0]
+        if rao_blackwell:
+            weights, biases = self._eval_weights()
         for i in range(n_call):
-            self._sample_full = tf.get_collection('sample_full')[0]
             full = self._sample_full.eval(feed_dict=self._make_tf_feed_dict(n_gibbs_steps=n_gibbs_steps)) #n_runs=n_runs))
-            all_full.append(full)
+            if rao_blackwell:
+                full = rao_blackwellize(full, [self.n_visible_] + list(self.n_hiddens_), weights, biases)
+            yield full
+
+    def _eval_weights(self):
+        """Evaluate weight matrices and biases (visible ones first)
+        by name, so that it also works for models loaded from disk.
+        Must be called inside a TF session.
+        """
+        graph = tf.get_default_graph()
+        suffixes = [''] + ['_{0}'.format(i) for i in range(1, self.n_layers_)]
+        W = [graph.get_tensor_by_name('weights/W{0}:0'.format(x)) for x in suffixes]
+        b = [graph.get_tensor_by_name('weights/vb:0')]
+        b += [graph.get_tensor_by_name('weights/hb{0}:0'.format(x)) for x in suffixes]
+        if not any(self.local_layers):
+            return self._tf_session.run([W, b])
+        indices = [graph.get_tensor_by_name('masks/active_indices{0}:0'.format(x)) for x in suffixes]
+        W, b, indices = self._tf_session.run([W, b, indices])
+        W = [_densify(T, indices[i], self._weights_shape(i)) if self.local_layers[i] else T
+             for i, T in enumerate(W)]
+        return W, b
+
+    @run_in_tf_session()
+    def get_tf_params(self, scope=None):
+        """Get tf params of the model, with the weights, their momentum and
+        co-activation statistics of local layers (see `local_layers`) as dense matrices.
+
+        Returns
+        -------
+        params : dict[str] = np.ndarray
+            Evaluated parameters of the model.
+        """
+        tf_vars = self._get_tf_vars(scope)
+        params = {key: var.eval() for key, var in tf_vars.items()}
+        if any(self.local_layers):
+            indices = _per_layer(self._get_tf_vars('masks'), 'active_indices', self.n_layers_)
+            for key, var in tf_vars.items():
+                match = _LOCAL_VAR_NAME.match(var.name)
+                i = int(match.group(2) or 0) if match else None
+                if i is not None and self.local_layers[i]:
+                    params[key] = _densify(params[key], indices[i].eval(), self._weights_shape(i))
+        return params
+
+    # added this function to make the sampling from the DBM work!                
+    @run_in_tf_session(update_seed=True)
+    def sample_gibbs(self, n_gibbs_steps=100, save_model=False, n_runs=1000):
+
+        # list for all the "full" samples from all hidden layers
+        all_full = list(self._iter_full_samples(n_gibbs_steps, n_runs))
 
         # number of all units in the machine (visible + hidden)
         n_units_all = sum(np.asarray(self.n_hiddens_)) + self.n_visible_
 
-        return np.asarray(all_full).reshape(n_call*self.n_particles,n_units_all )
+        return np.asarray(all_full).reshape(len(all_full)*self.n_particles,n_units_all )
+
+    def _restore_tf_handles(self):
+        """Rebind the tensors used to build Gibbs steps to the graph restored
+        from disk, so that new ops can be added to it. Must be called inside a TF session."""
+        graph = tf.get_default_graph()
+        tf_vars = self._get_tf_vars()
+        suffixes = [''] + ['_{0}'.format(i) for i in range(1, self.n_layers_)]
+        self._n_visible = graph.get_tensor_by_name('constants/n_visible:0')
+        self._n_hiddens = [graph.get_tensor_by_name('constants/n_hidden{0}:0'.format(x)) for x in suffixes]
+        self._n_particles = graph.get_tensor_by_name('constants/n_particles:0')
+        self._n_gibbs_steps = graph.get_tensor_by_name('input_data/n_gibbs_steps:0')
+        self._n_runs = graph.get_tensor_by_name('input_data/n_runs:0')
+        self._W = [tf_vars['weights/W' + x] for x in suffixes]
+        self._vb = tf_vars['weights/vb']
+        self._hb = [tf_vars['weights/hb' + x] for x in suffixes]
+        self._active_indices = [tf_vars['masks/active_indices' + x]
+                                if self.sparse_layers[i] or self.local_layers[i] else None
+                                for i, x in enumerate(suffixes)]
+        self._v = tf_vars['negative_particles/v']
+        self._v_new = tf_vars['negative_particles/v_new']
+        self._H = [tf_vars['negative_particles/h_particle{0}/h'.format(x)] for x in suffixes]
+        self._H_new = [tf_vars['negative_particles/h_particle{0}/h_new'.format(x)] for x in suffixes]
+        if getattr(self, '_v_layer', None) is None: # loaded without RBMs
+            self._v_layer = BernoulliLayer(n_units=self.n_visible_, dtype=self.dtype)
+            self._h_layers = [BernoulliLayer(n_units=n, dtype=self.dtype) for n in self.n_hiddens_]
+
+    def _make_fi_moments(self):
+        """Accumulate the moments needed for the diagonal FI of all weight matrices
+        (sums of unit states and co-activations of adjacent layers) inside
+        the Gibbs sampling loop, so that samples never leave the graph.
+
+        Each block runs the same 2 * `n_gibbs_steps` sampled Gibbs steps as
+        `_make_full_sample`, and the moments are sums over the sampled states,
+        i.e. the same samples `sample_gibbs` would return. Co-activations of
+        local layers are accumulated at their active weights only.
+        """
+        with tf.name_scope('fi_moments'):
+            n_blocks = (self._n_runs + self._n_particles - 1) // self._n_particles
+
+            def cond(block, v, H, v_new, H_new, sums, coactivations):
+                return block < n_blocks
+
+            def body(block, v, H, v_new, H_new, sums, coactivations):
+                def step_cond(step, v, H, v_new, H_new):
+                    return step < 2 * self._n_gibbs_steps
+
+                def step_body(step, v, H, v_new, H_new):
+                    v, H, v_new, H_new = self._make_gibbs_step(v, H, v_new, H_new,
+                                                               update_v=True, sample=True)
+                    return step + 1, v_new, H_new, v, H  # swap particles
 
+                _, v, H, v_new, H_new = \
+                    tf.while_loop(cond=step_cond, body=step_body,
+                                  loop_vars=[tf.constant(0), v, H, v_new, H_new],
+                                  parallel_iterations=1,
+                                  back_prop=False)
+
+                layers = [v] + list(H)
+                sums = [s + tf.reduce_sum(L, axis=0) for s, L in zip(sums, layers)]
+                coactivations = [c + self._outer_mean(layers[i], layers[i + 1], 1., i)
+                                 for i, c in enumerate(coactivations)]
+                return block + 1, v, H, v_new, H_new, sums, coactivations
+
+            _, v, H, v_new, H_new, sums, coactivations = \
+                tf.while_loop(cond=cond, body=body,
+                              loop_vars=[tf.constant(0),
+                                         self._v, self._H,
+                                         self._v_new, self._H_new,
+                                         [tf.zeros_like(self._vb)] + [tf.zeros_like(hb) for hb in self._hb],
+                                         [tf.zeros_like(W) for W in self._W]],
+                              parallel_iterations=1,
+                              back_prop=False)
+
+            # keep the chains where they are, same as the other samplers
+            particles_updates = [self._v.assign(v), self._v_new.assign(v_new)]
+            particles_updates += [self._H[i].assign(H[i]) for i in range(self.n_layers_)]
+            particles_updates += [self._H_new[i].assign(H_new[i]) for i in range(self.n_layers_)]
+            with tf.control_dependencies(particles_updates):
+                n_samples = tf.identity(n_blocks * self._n_particles, name='n_samples')
+                sums = [tf.identity(s, name='sums') for s in sums]
+                coactivations = [tf.identity(c, name='coactivations') for c in coactivations]
+        return n_samples, sums, coactivations
+
+    @run_in_tf_session(update_seed=True)
+    def estimate_fi(self, n_gibbs_steps=100, n_runs=1000, in_graph=False, masks=None, rao_blackwell=False,
+                    on_block=None):
+        """Estimate the diagonal of the Fisher information of all weight matrices
+        by streaming samples from the Gibbs sampler into a `FisherAccumulator`,
+        so that the full (`n_runs`, n_units) sample matrix is never materialized.
+
+        Parameters
+        ----------
+        in_graph : bool
+            If True, accumulate the moments of the same samples inside the
+            sampling loop, in ops added to the restored graph for this call only,
+            and transfer only arrays of weight size to the host.
+        masks : None or iterable of None or mask of each weight matrix
+            If provided, only active weights are estimated (see `FisherAccumulator`).
+        rao_blackwell : bool
+            If True, use conditional means of odd hidden layers instead of their
+            sampled states, which gives lower variance estimates from the same
+            number of samples. Not available with `in_graph`.
+        on_block : None or callable
+            Called with each block of samples, e.g. to evaluate them
+            on the fly. Not available with `in_graph`.
+
+        Returns
+        -------
+        acc : FisherAccumulator
+            Use `acc.estimates()` for (variance, heuristic) estimates of each
+            weight matrix and `acc.means()` for mean activities of each layer.
+        """
+        if in_graph and (rao_blackwell or on_block is not None):
+            raise ValueError('`rao_blackwell` and `on_block` are not supported with `in_graph`')
+        acc = FisherAccumulator([self.n_visible_] + list(self.n_hiddens_), masks=masks)
+        if in_graph:
+            self._restore_tf_handles()
+            self._fi_moments = self._make_fi_moments()
+            indices = [tf.zeros([0, 2], dtype=tf.int64) if T is None else T for T in self._active_indices]
+            (n_samples, sums, coactivations), indices = \
+                self._tf_session.run([self._fi_moments, indices],
+                                     feed_dict=self._make_tf_feed_dict(n_gibbs_steps=n_gibbs_steps, n_runs=n_runs))
+            coactivations = [_densify(C, indices[i], self._weights_shape(i)) if self.local_layers[i] else C
+                             for i, C in enumerate(coactivations)]
+            return acc.add_moments(sums, coactivations, n_samples)
+        for full in self._iter_full_samples(n_gibbs_steps, n_runs, rao_blackwell=rao_blackwell):
+            acc.update(full)
+            if on_block is not None:
+                on_block(full)
+        return acc
+
+
+    @run_in_tf_session(update_seed=True)
+    def estimate_fi_sequential(self, percentile, n_gibbs_steps=100, max_runs=60000, round_runs=5000,
+                               tol=0.01, masks=None, scales=None, use_var=True, rao_blackwell=False,
+                               on_block=None):
+        """Estimate the diagonal of the Fisher information of all weight matrices,
+        drawing samples in rounds of `round_runs` only until the set of weights
+        below the `percentile` threshold is stable within `tol` (see `sequential_fi`).
+        `masks`, `rao_blackwell` and `on_block` are as in `estimate_fi`.
+
+        Returns
+        -------
+        acc : FisherAccumulator
+            `acc.n_samples_` is the number of samples drawn (at most `max_runs`
+            rounded up to a multiple of `n_particles`).
+        """
+        blocks = self._iter_full_samples(n_gibbs_steps, max_runs, rao_blackwell=rao_blackwell)
+        if on_block is not None:
+            blocks = _observe(blocks, on_block)
+        return sequential_fi(blocks, [self.n_visible_] + list(self.n_hiddens_), percentile,
+                             round_size=round_runs, tol=tol, masks=masks, scales=scales, use_var=use_var)
 
 
     # added this function to make the sampling from the DBM work!                                        
@@ -309,13 +309,22 @@ def init_dbm(X_train, X_val, rbms, Q, G, args):
     else:
         print("\nInitializing DBM ...\n\n")
 
+        # continue the chains of a previous DBM if given, otherwise start them from data
+        warm_start = getattr(args, 'warm_start', None)
+        if warm_start is not None:
+            v_particle_init, h_particles_init = warm_start['v'], warm_start['H']
+        else:
+            v_particle_init = X_train[:args.n_particles].copy()
+            h_particles_init = (Q[:args.n_particles].copy(),
+                                G[:args.n_particles].copy())
+                                #D[:args.n_particles].copy()),
+
         dbm = DBM(rbms=rbms,
                   n_layers = args.n_layers,
                   n_particles=args.n_particles,
-                  v_particle_init=X_train[:args.n_particles].copy(),
-                  h_particles_init=(Q[:args.n_particles].copy(),
-                                    G[:args.n_particles].copy()),
-                                    #D[:args.n_particles].copy()),
+                  v_particle_init=v_particle_init,
+                  h_particles_init=h_particles_init,
+                  warm_start=warm_start,
                   n_gibbs_steps=args.n_gibbs_steps[2],
                   max_mf_updates=args.max_mf_updates,
                   mf_tol=args.mf_tol,
@@ -337,6 +346,8 @@ def init_dbm(X_train, X_val, rbms, Q, G, args):
                   display_filters=0,
                   display_particles=0,
                   v_shape=(20, 20),
+                  sparse_layers=getattr(args, 'sparse_layers', None),
+                  local_layers=getattr(args, 'local_layers', None),
                   dtype='float32',
                   tf_saver_params=dict(max_to_keep=1),
                   model_path=args.dbm_dirpath)
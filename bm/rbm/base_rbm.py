@@ -9,6 +9,8 @@ from bm.base.basef import is_attribute_name
 from bm.utils.utilsf import (make_list_from, batch_iter, epoch_iter,
                       write_during_training)
 from bm.utils.testing import assert_len, assert_shape
+from bm.utils.fisher import FisherAccumulator, running_fi_estimates
+from bm.utils.receptive_fields import receptive_field_mask
 
 
 class BaseRBM(EnergyBasedModel):
@@ -48,6 +50,18 @@ class BaseRBM(EnergyBasedModel):
         Controls the amount of sparsity penalty.
     sparsity_damping : float in (0, 1)
         Decay rate for hidden activations probs.
+    fi_damping : float in (0, 1)
+        Decay rate of the running means of unit states and co-activations
+        of the negative phase, from which FI estimates are streamed during
+        training (see `_fit` with a pruning schedule). The running means
+        start at zero and are bias-corrected by the number of updates
+        (see `running_fi_estimates`). Unlike `DBM`, which averages the
+        sampled states of its persistent particles, these are CD statistics:
+        visible states at the end of each chain started from the data, the
+        conditional means of the hidden units given them and their
+        co-activations (`dW_negative` / N), i.e. the FI is that of the
+        reconstruction distribution, which is close to the model's only for
+        well-mixing chains.
     dbm_first, dbm_last : bool
         Flag whether RBM is first or last in a stack of RBMs used
         for DBM pre-training to address "double counting evidence" problem [4].
@@ -64,6 +78,12 @@ class BaseRBM(EnergyBasedModel):
         the center of the receptive field once. That's why, at the moment, only works if the number
         of visible and hidden units are equal.
     double_rf : if set to true, each receptive fields will be duplicated in first layer: each hidden unit has two times the receptive field.
+    rf_stride : positive int
+        Distance between the receptive fields of neighbouring hidden units.
+    rf_padding : 'same' or 'valid'
+        Whether receptive fields are centered on the pixels and clipped at
+        the borders, or lie completely inside the image;
+        see `bm.utils.receptive_fields.receptive_field_mask`.
     metrics_config : dict
         Parameters that controls which metrics and how often they are computed.
         Possible (optional) commands:
@@ -111,8 +131,9 @@ class BaseRBM(EnergyBasedModel):
                  W_init=0.01, vb_init=0., hb_init=0., n_gibbs_steps=1,
                  learning_rate=0.01, momentum=0.9, max_epoch=10, batch_size=10, l2=1e-4,
                  sample_v_states=True, sample_h_states=True, dropout=None,
-                 sparsity_target=0.1, sparsity_cost=0., sparsity_damping=0.9,
+                 sparsity_target=0.1, sparsity_cost=0., sparsity_damping=0.9, fi_damping=0.99,
                  dbm_first=False, dbm_last=False, prune=False, freeze_weights=None, filter_shape=None, rf_mask=None, double_rf = False,
+                 rf_stride=1, rf_padding='same',
                  metrics_config=None, verbose=True, save_after_each_epoch=False,
                  display_filters=0, display_hidden_activations=0, v_shape=(28, 28),
                  model_path='rbm_model/', *args, **kwargs):
@@ -145,6 +166,9 @@ class BaseRBM(EnergyBasedModel):
             self.freeze_weights = np.ones((self.n_visible, self.n_hidden), dtype=bool)
             self.prune=False
 
+        self.rf_stride = rf_stride
+        self.rf_padding = rf_padding
+
         #if filter_shape parameter exists and is a tuple, create weight masks that lead to "receptive fields", i.e.
         #each hidden unit is only connected to a defined number of visible unit, that cover a specific part of the input.
         #if (filter_shape is not None and self.n_visible == self.n_hidden and isinstance(filter_shape, tuple)
@@ -152,45 +176,12 @@ class BaseRBM(EnergyBasedModel):
         and filter_shape[0] < v_shape[0] and filter_shape[1] < v_shape[1]):
             self.filter_shape = filter_shape
             print(("Receptive fields active, shape ({},{}) as indicated by filter_shape parameter.".format(*self.filter_shape)))
-            v_2d_x = v_shape[0]
-            v_2d_y = v_shape[1]
-
-            filter_x = self.filter_shape[0]
-            filter_y = self.filter_shape[1]
-
-            # augment image (pad it with zeros)
-            augmented_image = np.zeros((v_2d_x+2*(filter_x//2), v_2d_y+2*(filter_y//2)))
-            # put ones in the center of the augmented image, with shape (nv_2d, nv_2d)
-            augmented_image[(filter_x//2):v_2d_x+(filter_x//2), filter_y//2:v_2d_y+(filter_x//2)] = 1
-
-            # now we make an appropriate weight mask for each hidden unit
-            # (each hidden unit just has a small window it sees of the image, all other weights to it are 0)
-            h_masks = [] # a list of masks, one for each hidden unit
-
-            # each idx/idy tuple points to the center of a receptive field
-            # start at index (filter_x//2, filter_y//2), i.e. the leftmost pixel of the actual image
-            for idx in range(filter_x//2,v_2d_x+filter_x//2): # for each row
-                for idy in range(filter_y//2,v_2d_y+filter_y//2): # for each column
-                    len_x = filter_x//2 + filter_x%2 # +1 for the center of the receptive field if it is an odd number
-                    len_y = filter_y//2 + filter_y%2 # +1 for the center of the receptive field if it is an odd number
-                    # cut out the filters from the augmented image
-                    h_filter = augmented_image[idx-filter_x//2:idx+len_x, idy-filter_y//2:idy+len_y] # +1 for the center of the receptive field
-                    # now make an augmented image of zeros again
-                    h_mask = np.zeros(augmented_image.shape, dtype=bool)
-                    # set the filter in this augmented image, so all but the ones just identified are set to 0, (idx, idy) gives center
-                    h_mask[idx-filter_x//2:idx+len_x, idy-filter_y//2:idy+len_y] = h_filter
-                    # cut out the image part from the augmented image again
-                    h_mask = h_mask[filter_x//2:filter_x//2+v_shape[0], filter_y//2:filter_y//2+v_shape[1]]
-                    h_masks.append(h_mask)
-
-                    if double_rf == True:
-                        h_masks.append(h_mask)
-
-            #  now create the final weight mask
-            self.rf_mask = np.ones((self.n_visible, self.n_hidden), dtype=bool)
-            for i in range(self.n_hidden): # for each hidden/visible unit
-                self.rf_mask[:,i] *= h_masks[i].flatten() # mask the input accordingly
-            self.rf_mask = np.array(self.rf_mask, dtype=bool)
+            # each hidden unit only sees a small window of the image, all other weights to it are 0
+            mask = receptive_field_mask(v_shape, self.filter_shape, stride=self.rf_stride, padding=self.rf_padding,
+                                        double_rf=double_rf)
+            assert mask.shape[0] == self.n_visible and mask.shape[1] >= self.n_hidden, \
+                "{0} receptive fields for {1} visible units, but {2} hidden units".format(mask.shape[1], mask.shape[0], self.n_hidden)
+            self.rf_mask = np.array(mask[:, :self.n_hidden], dtype=bool)
 
         else:
             # otherwise just make an array of ones, so the weights will stay unaffected:
@@ -247,6 +238,7 @@ class BaseRBM(EnergyBasedModel):
         self.sparsity_target = sparsity_target
         self.sparsity_cost = sparsity_cost
         self.sparsity_damping = sparsity_damping
+        self.fi_damping = fi_damping
 
         self.dbm_first = dbm_first
         self.dbm_last = dbm_last
@@ -300,6 +292,7 @@ class BaseRBM(EnergyBasedModel):
         self._sparsity_target = None
         self._sparsity_cost = None
         self._sparsity_damping = None
+        self._fi_damping = None
         self._dbm_first = None
         self._dbm_last = None
         self._propup_multiplier = None
@@ -327,6 +320,8 @@ class BaseRBM(EnergyBasedModel):
         self._dvb = None
 
         self._q_means = None
+        self._fi_means = []
+        self._fi_coactivations = None
 
         self._v = None
         self._v_new = None
@@ -354,6 +349,7 @@ class BaseRBM(EnergyBasedModel):
             self._sparsity_target = tf.constant(self.sparsity_target, dtype=self._tf_dtype, name='sparsity_target')
             self._sparsity_cost = tf.constant(self.sparsity_cost, dtype=self._tf_dtype, name='sparsity_cost')
             self._sparsity_damping = tf.constant(self.sparsity_damping, dtype=self._tf_dtype, name='sparsity_damping')
+            self._fi_damping = tf.constant(self.fi_damping, dtype=self._tf_dtype, name='fi_damping')
 
             self._dbm_first = tf.constant(self.dbm_first, dtype=tf.bool, name='is_dbm_first')
             self._dbm_last = tf.constant(self.dbm_last, dtype=tf.bool, name='is_dbm_last')
@@ -474,6 +470,13 @@ class BaseRBM(EnergyBasedModel):
         with tf.name_scope('hidden_activations_means'):
             self._q_means = tf.Variable(tf.zeros([self._n_hidden], dtype=self._tf_dtype), name='q_means')
 
+        # initialize running means of negative states and co-activations (for streaming FI)
+        with tf.name_scope('fi_statistics'):
+            self._fi_means = [tf.Variable(tf.zeros([self._n_visible], dtype=self._tf_dtype), name='means'),
+                              tf.Variable(tf.zeros([self._n_hidden], dtype=self._tf_dtype), name='means')]
+            self._fi_coactivations = tf.Variable(tf.zeros([self._n_visible, self._n_hidden], dtype=self._tf_dtype),
+                                                 name='coactivations')
+
     def _propup(self, v):
         with tf.name_scope('prop_up'):
 
@@ -645,9 +648,16 @@ class BaseRBM(EnergyBasedModel):
         #         dhb_update = self._dhb.assign(self._learning_rate * dhb)
         #         hb_update = self._hb.assign_add(dhb_update)
 
+        # update running means of the negative statistics
+        with tf.name_scope('fi_statistics'):
+            d = self._fi_damping
+            fi_updates = [self._fi_means[0].assign(d * self._fi_means[0] + (1 - d) * tf.reduce_mean(v_states, axis=0)),
+                          self._fi_means[1].assign(d * self._fi_means[1] + (1 - d) * tf.reduce_mean(h_means, axis=0)),
+                          self._fi_coactivations.assign(d * self._fi_coactivations + (1 - d) * dW_negative / N)]
+
         # assemble train_op
         with tf.name_scope('training_step'):
-            train_op = tf.group(W_update, vb_update, hb_update)
+            train_op = tf.group(W_update, vb_update, hb_update, *fi_updates)
             tf.compat.v1.add_to_collection('train_op', train_op)
 
         # compute metrics
@@ -798,7 +808,7 @@ class BaseRBM(EnergyBasedModel):
             feed_dict['input_data/{0}:0'.format(k)] = v
         return feed_dict
 
-    def _train_epoch(self, X):
+    def _train_epoch(self, X, pruning_schedule=None):
         results = [[] for _ in range(len(self._train_metrics_map))]
         for X_batch in batch_iter(X, self.batch_size,
                                   verbose=self.verbose):
@@ -817,6 +827,8 @@ class BaseRBM(EnergyBasedModel):
             else:
                 self._tf_session.run(self._train_op,
                                      feed_dict=self._make_tf_feed_dict(X_batch))
+            if pruning_schedule is not None and pruning_schedule.step(self.iter_) is not None:
+                self._apply_pruning_schedule(pruning_schedule)
 
         # aggregate and return metrics values
         results = [np.mean(r) if r else None for r in results]
@@ -872,7 +884,29 @@ class BaseRBM(EnergyBasedModel):
         #self._tf_val_writer.add_summary(feg_s, self.iter_)
         return feg
 
-    def _fit(self, X, X_val=None, *args, **kwargs):
+    def _apply_pruning_schedule(self, pruning_schedule):
+        """Prune weights according to the FI streamed from the negative phase so far,
+        zero them together with their momentum and update the prune mask."""
+        W_var = self._get_tf_vars('weights')['W']
+        dW_var = self._get_tf_vars('grads_accumulators')['dW']
+        masks, stats = self._get_tf_vars('masks'), self._get_tf_vars('fi_statistics')
+        W, dW, rf, prune, v_means, h_means, P = self._tf_session.run(
+            [W_var, dW_var, masks['rf_mask'], masks['prune_mask'],
+             stats['means'], stats['means_1'], stats['coactivations']])
+
+        # the running means are updated once per training step since they were created
+        fi = running_fi_estimates([v_means, h_means], [P], self.fi_damping, self.iter_)
+        keep, = pruning_schedule(self.iter_, [W], [rf * prune], fi)
+        masks['prune_mask'].load(prune * keep, self._tf_session)
+        W_var.load(W * keep, self._tf_session)
+        dW_var.load(dW * keep, self._tf_session)
+        if self.verbose:
+            write_during_training("iter {0}: pruning step {1}, active weights: {2}".format(
+                self.iter_, pruning_schedule.step(self.iter_), int(np.count_nonzero(keep))))
+
+    def _fit(self, X, X_val=None, pruning_schedule=None, *args, **kwargs):
+        """Train the RBM, pruning it gradually on the fly if a
+        `bm.utils.pruning.PruningSchedule` is given."""
         # load ops requested
         self._train_op = tf.compat.v1.get_collection('train_op')[0]
 
@@ -891,7 +925,7 @@ class BaseRBM(EnergyBasedModel):
                                       verbose=self.verbose):
             val_results = {}
             feg = None
-            train_results = self._train_epoch(X)
+            train_results = self._train_epoch(X, pruning_schedule=pruning_schedule)
 
             # run validation metrics if needed
             if X_val is not None and self.epoch_ % self.metrics_config['val_metrics_every_epoch'] == 0:
@@ -956,7 +990,7 @@ class BaseRBM(EnergyBasedModel):
         H = np.zeros((len(X), self.n_hidden), dtype=np_dtype)
         start = 0
         for X_b in batch_iter(X, batch_size=self.batch_size,
-                              verbose=self.verbose, desc='transform'):
+                              verbose=self.verbose, desc='transform', keep_order=True):
             H_b = self._transform_op.eval(feed_dict=self._make_tf_feed_dict(X_b))
             H[start:(start + self.batch_size)] = H_b
             start += self.batch_size
@@ -973,3 +1007,18 @@ class BaseRBM(EnergyBasedModel):
         #     self.n_samples_generated_ += n_gibbs_steps
         #     self._save_model()
         return v
+
+    @run_in_tf_session(update_seed=True)
+    def estimate_fi(self, n_gibbs_steps=100, n_runs=1000, chunk_size=10000, mask=None):
+        """Estimate the diagonal of the Fisher information of the weights
+        from `n_runs` independent Gibbs chains, drawn and accumulated
+        `chunk_size` chains at a time (see `FisherAccumulator`).
+        If `mask` is given, only active weights are estimated (compact form).
+        """
+        self._sample_v = tf.compat.v1.get_collection('sample_v')[0]
+        acc = FisherAccumulator((self.n_visible, self.n_hidden), chunk_size=chunk_size, masks=[mask])
+        for start in range(0, n_runs, chunk_size):
+            n = min(chunk_size, n_runs - start)
+            s = self._sample_v.eval(feed_dict=self._make_tf_feed_dict(n_gibbs_steps=n_gibbs_steps, n_runs=n))
+            acc.update(s)
+        return acc
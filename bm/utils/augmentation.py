@@ -1,6 +1,9 @@
 import numpy as np
 import scipy.ndimage as nd
 
+from .rng import RNG
+from .dataset import prefetch
+
 
 def shift(x, offset=(0, 0)):
     if len(x.shape) == 3:
@@ -14,3 +17,123 @@ def shift(x, offset=(0, 0)):
 def horizontal_mirror(x):
     y = np.fliplr(x[:,:,...])
     return y
+
+
+class BatchAugmenter(object):
+    """Randomly augment whole batches of flattened images at once.
+
+    Each image is shifted by up to `max_shift` pixels along both axes
+    (repeating the border pixels, like `shift` with integer offsets),
+    mirrored horizontally with probability `mirror_prob` (like
+    `horizontal_mirror`), and each of its pixels is flipped with
+    probability `flip_prob` (for binary inputs). Shifts and mirroring are
+    done by a single gather over the batch.
+
+    Parameters
+    ----------
+    v_shape : (H, W) or (H, W, C) positive int tuple
+        Shape of the images.
+    max_shift : non-negative int
+    mirror_prob : float in [0, 1]
+    flip_prob : float in [0, 1]
+    random_seed : None or int
+        Seed of the augmentations, which are reproducible for a given
+        sequence of batches.
+
+    Examples
+    --------
+    >>> X = np.arange(6).reshape((1, 6))
+    >>> BatchAugmenter((2, 3), mirror_prob=1.)(X).tolist()
+    [[2, 1, 0, 5, 4, 3]]
+    >>> X = np.eye(9, dtype=bool)[4:5]  # center pixel of a 3x3 image
+    >>> A = BatchAugmenter((3, 3), max_shift=1, random_seed=1337)(np.repeat(X, 1000, axis=0))
+    >>> int(A.sum(axis=1).min()), np.unique(A, axis=0).shape[0]
+    (1, 9)
+    >>> BatchAugmenter((3, 3), flip_prob=1.)(X).astype(int).tolist()
+    [[1, 1, 1, 1, 0, 1, 1, 1, 1]]
+    """
+    def __init__(self, v_shape, max_shift=0, mirror_prob=0., flip_prob=0., random_seed=None):
+        self.v_shape = tuple(v_shape) if len(v_shape) == 3 else (v_shape[0], v_shape[1], 1)
+        self.max_shift = max_shift
+        self.mirror_prob = mirror_prob
+        self.flip_prob = flip_prob
+        self.random_seed = random_seed
+        self._rng = RNG(seed=self.random_seed)
+
+    def __call__(self, X_batch):
+        X_batch = np.asarray(X_batch)
+        N = len(X_batch)
+        H, W, C = self.v_shape
+        rows, cols = np.tile(np.arange(H), (N, 1)), np.tile(np.arange(W), (N, 1))
+
+        if self.max_shift:
+            # pixel (i, j) of a shifted image is pixel (i - dy, j - dx) of the original
+            dy, dx = self._rng.randint(-self.max_shift, self.max_shift + 1, size=(2, N, 1))
+            rows, cols = np.clip(rows - dy, 0, H - 1), np.clip(cols - dx, 0, W - 1)
+        if self.mirror_prob:
+            mirror = self._rng.rand(N, 1) < self.mirror_prob
+            cols = np.where(mirror, cols[:, ::-1], cols)
+        if self.max_shift or self.mirror_prob:
+            images = X_batch.reshape((N, H, W, C))
+            X_batch = images[np.arange(N)[:, None, None], rows[:, :, None], cols[:, None, :]].reshape((N, -1))
+
+        if self.flip_prob:
+            flip = self._rng.rand(*X_batch.shape) < self.flip_prob
+            X_batch = X_batch ^ flip if X_batch.dtype == bool else np.where(flip, 1 - X_batch, X_batch)
+        return X_batch
+
+
+class AugmentedData(object):
+    """Training data `X` augmented batch by batch by `augmenter`
+    (e.g. a `BatchAugmenter`), to be passed to `fit` in place of `X`.
+
+    `batch_iter` draws its batches from `X` (an array or a dataset like
+    `bm.utils.dataset.BinaryDataset`) and augments them, in a background
+    thread that prepares up to `prefetch` batches in advance if `prefetch`
+    is positive. Indexing returns the original samples, e.g. to initialize
+    persistent chains.
+
+    Examples
+    --------
+    >>> from bm.utils.utils import batch_iter
+    >>> X = np.arange(12).reshape((4, 3))
+    >>> data = AugmentedData(X, lambda X_b: -X_b)
+    >>> [X_b.tolist() for X_b in batch_iter(data, batch_size=3)]
+    [[[0, -1, -2], [-3, -4, -5], [-6, -7, -8]], [[-9, -10, -11]]]
+    >>> len(data), data[:1].tolist()
+    (4, [[0, 1, 2]])
+    """
+    def __init__(self, X, augmenter, prefetch=2):
+        self.X = X
+        self.augmenter = augmenter
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return len(self.X)
+
+    @property
+    def shape(self):
+        return self.X.shape if hasattr(self.X, 'shape') else np.shape(self.X)
+
+    def __getitem__(self, key):
+        return self.X[key]
+
+    def _batches(self, batch_size, keep_order):
+        if hasattr(self.X, 'iter_batches'):
+            batches = self.X.iter_batches(batch_size, keep_order=keep_order)
+        else:
+            batches = (self.X[start:start + batch_size] for start in range(0, len(self.X), batch_size))
+        for X_b in batches:
+            yield self.augmenter(X_b)
+
+    def iter_batches(self, batch_size, keep_order=False):
+        batches = self._batches(batch_size, keep_order)
+        if self.prefetch:
+            batches = prefetch(batches, self.prefetch)
+        return batches
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from .testing import run_tests
+    run_tests(__file__)
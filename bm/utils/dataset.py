@@ -1,6 +1,11 @@
 import struct
 import pickle
 import sys
+import json
+import shutil
+import queue
+import hashlib
+import threading
 import os.path
 import numpy as np
 import matplotlib.pyplot as plt
@@ -8,16 +13,32 @@ import matplotlib.pyplot as plt
 from .rng import RNG
 
 
-def load_mnist(mode='train', path='.'):
+# element types of the idx format, by their code in the magic number
+_IDX_DTYPES = {0x08: np.uint8, 0x09: np.int8, 0x0B: '>i2', 0x0C: '>i4', 0x0D: '>f4', 0x0E: '>f8'}
+
+def load_idx(filepath):
+    """Memory-map the array stored in idx file `filepath` (read-only)."""
+    with open(filepath, 'rb') as f:
+        zeros, code, ndim = struct.unpack('>HBB', f.read(4))
+        if zeros != 0 or code not in _IDX_DTYPES:
+            raise ValueError('{0} is not an idx file'.format(filepath))
+        shape = struct.unpack('>' + 'I' * ndim, f.read(4 * ndim))
+    return np.memmap(filepath, dtype=_IDX_DTYPES[code], mode='r', offset=4 + 4 * ndim, shape=shape)
+
+def load_mnist(mode='train', path='.', dtype=None):
     """
     Load and return MNIST dataset.
 
+    The idx files are memory-mapped, so nothing is read or copied
+    unless `dtype` is given.
+
     Returns
     -------
     data : (n_samples, 784) np.ndarray
-        Data representing raw pixel intensities (in [0., 255.] range).
+        Data representing raw pixel intensities (in [0, 255] range),
+        read-only uint8 unless `dtype` is given.
     target : (n_samples,) np.ndarray
-        Labels vector (zero-based integers).
+        Labels vector (zero-based uint8 integers).
     """
     dirpath = os.path.join(path, 'mnist/')
     if mode == 'train':
@@ -29,48 +50,44 @@ def load_mnist(mode='train', path='.'):
     else:
         raise ValueError("`mode` must be 'train' or 'test'")
 
-    with open(fname_data, 'rb') as fdata:
-        magic, n_samples, n_rows, n_cols = struct.unpack(">IIII", fdata.read(16))
-        data = np.fromfile(fdata, dtype=np.uint8)
-        data = data.reshape(n_samples, n_rows * n_cols)
-
-    with open(fname_target, 'rb') as ftarget:
-        magic, n_samples = struct.unpack(">II", ftarget.read(8))
-        target = np.fromfile(ftarget, dtype=np.int8)
-
-    return data.astype(float), target
+    data = load_idx(fname_data)
+    data = data.reshape((data.shape[0], -1))
+    target = load_idx(fname_target)
+    if dtype is not None:
+        data = data.astype(dtype)
+    return data, target
 
-def load_cifar10(mode='train', path='.'):
+def load_cifar10(mode='train', path='.', dtype=None):
     """
     Load and return CIFAR-10 dataset.
 
     Returns
     -------
     data : (n_samples, 3 * 32 * 32) np.ndarray
-        Data representing raw pixel intensities (in [0., 255.] range).
+        Data representing raw pixel intensities (in [0, 255] range),
+        uint8 unless `dtype` is given.
     target : (n_samples,) np.ndarray
         Labels vector (zero-based integers).
     """
     dirpath = os.path.join(path, 'cifar-10-batches-py/')
-    batch_size = 10000
     if mode == 'train':
         fnames = ['data_batch_{0}'.format(i) for i in range(1, 5 + 1)]
     elif mode == 'test':
         fnames = ['test_batch']
     else:
         raise ValueError("`mode` must be 'train' or 'test'")
-    n_samples = batch_size * len(fnames)
-    data = np.zeros(shape=(n_samples, 3 * 32 * 32), dtype=float)
-    target = np.zeros(shape=(n_samples,), dtype=int)
-    start = 0
+    data, target = [], []
     for fname in fnames:
         fname = os.path.join(dirpath, fname)
         with open(fname, 'rb') as fdata:
-            _data = pickle.load(fdata)
-            data[start:(start + batch_size)] = np.asarray(_data['data'])
-            target[start:(start + batch_size)] = np.asarray(_data['labels'])
-        start += 10000
-    return data, target
+            _data = pickle.load(fdata, encoding='latin1')
+            data.append(_data['data'])
+            target.append(_data['labels'])
+    # the pickled batches are uint8 already, copy them only once
+    data = np.concatenate(data)
+    if dtype is not None:
+        data = data.astype(dtype)
+    return data, np.concatenate(target)
 
 def im_flatten(X):
     """Flatten batch of 3-channel images `X`
@@ -196,44 +213,312 @@ def plot_cifar10(X, y, samples_per_class=7,
     plt.subplots_adjust(wspace=0, hspace=0)
 
 
-def load_cifar_circles(path, radius):
-    sumimages = np.empty(shape=(0, 1024))
-    for fn in os.listdir(path)[:7]:
-        if fn.find('_batch') > -1:
-            print(fn)
-            with open(path + fn, 'rb') as f:
-                if sys.version_info[0] > 2:
-                    u = pickle._Unpickler(f)
-                    u.encoding = 'latin1'
-                    p = u.load()
-                else:
-                    p = unpickle(f)
-                sumimages = np.vstack((sumimages,
-                                       np.array([np.sum([d[1024 * c:(c + 1) * 1024] for c in range(3)], axis=0) for d in p['data']])))
-
-    imgmean = np.median(sumimages)
-    binimages = ((np.array([np.sign(d - imgmean) for d in sumimages]) + 1) / 2).astype(bool)
-    # how many pixels?
-    x, y = np.ogrid[0:32, 0:32]
-    x, y = x - 16, y - 16
-    num_pixels = np.sum(np.sqrt(1. * x * x + 1. * y * y) <= radius)
-    data = np.empty(shape=(0, num_pixels))
-    print(('number of pixels: ' + str(num_pixels)))
-    # cut out as many circles as possible
-    for x0 in np.arange(np.ceil(radius), 32 - np.ceil(radius), np.ceil(radius * 2)):
-        for y0 in np.arange(np.ceil(radius), 32 - np.ceil(radius), np.ceil(radius * 2)):
-            # slice out a patch
-            inds = np.zeros((32, 32), dtype=bool)
-            # circular patch
-            x, y = np.ogrid[0:32, 0:32]
-            x = x - x0
-            y = y - y0
-            inds[np.sqrt(1. * x * x + 1. * y * y) <= radius] = True
-            data = np.vstack((data, binimages[:, inds.flatten()]))
-    print(('data size:',data.shape))
+CIFAR10_BATCHES = ['data_batch_{0}'.format(i) for i in range(1, 6)] + ['test_batch']
+
+
+def _circle_indices(radius, size=32):
+    """(n_circles, n_pixels) flat pixel indices of non-overlapping circular patches
+    of `radius`, as many as fit into a `size` x `size` image, in C-order of
+    their centers."""
+    c = int(np.ceil(radius))
+    centers = np.arange(c, size - c, np.ceil(radius * 2)).astype(int)
+    # all patches lie completely inside the image, so they share their offsets
+    x, y = np.ogrid[-c:c + 1, -c:c + 1]
+    offsets = (x * size + y)[np.sqrt(1. * x * x + 1. * y * y) <= radius]
+    return (centers[:, None] * size + centers[None, :]).reshape((-1, 1)) + offsets
+
+
+def load_cifar_circles(path, radius, cache_path=None):
+    """Binarized circular patches of CIFAR-10 (all training and test images).
+
+    The channels of each image are summed and binarized by the median over
+    all images and pixels. Then the non-overlapping circles of `radius`
+    are cut out of all images at once.
+
+    The result is cached in `cache_path` (default: `path`/cache), and
+    later calls only memory-map it.
+
+    Returns
+    -------
+    data : (n_circles * n_images, n_pixels) bool np.ndarray
+        Read-only; the patches of all images at the first position, then
+        at the second, and so on.
+    """
+    if cache_path is None:
+        cache_path = os.path.join(path, 'cache')
+    filepaths = [os.path.join(path, fn) for fn in CIFAR10_BATCHES]
+
+    def make():
+        sumimages = []
+        for filepath in filepaths:
+            with open(filepath, 'rb') as f:
+                p = pickle.load(f, encoding='latin1')
+            sumimages.append(np.reshape(p['data'], (-1, 3, 1024)).sum(axis=1))
+        sumimages = np.concatenate(sumimages)
+        binimages = sumimages >= np.median(sumimages)
+
+        indices = _circle_indices(radius)
+        print(('number of pixels: ' + str(indices.shape[1])))
+        # gather all patches of all images in one go, ordered by position first
+        data = binimages[np.arange(len(binimages))[None, :, None], indices[:, None, :]]
+        return {'data': data.reshape((-1, indices.shape[1]))}
+
+    data = cached_arrays(cache_path, make, dict(name='cifar_circles', radius=radius), filepaths=filepaths)['data']
+    print(('data size:', data.shape))
     return data
 
 
+def file_checksum(filepath, chunk_size=1 << 20):
+    """SHA-1 hex digest of the contents of `filepath`."""
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_checksums(cache_path, filepaths):
+    """Checksums of `filepaths`, recomputed only for files whose size or
+    modification time changed since they were last recorded in `cache_path`."""
+    index_path = os.path.join(cache_path, 'checksums.json')
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    checksums, changed = [], False
+    for filepath in filepaths:
+        filepath = os.path.abspath(filepath)
+        st = os.stat(filepath)
+        stat = [st.st_size, st.st_mtime_ns]
+        if filepath not in index or index[filepath][0] != stat:
+            index[filepath] = [stat, file_checksum(filepath)]
+            changed = True
+        checksums.append(index[filepath][1])
+    if changed:
+        tmp_path = index_path + '.tmp{0}'.format(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    return checksums
+
+
+def cached_arrays(cache_path, make, params, filepaths=()):
+    """Arrays computed by `make`, cached on disk and memory-mapped.
+
+    The arrays are stored as .npy files in a subdirectory of `cache_path`
+    named after a hash of `params` and of the checksums of `filepaths`, so
+    that changing either recomputes them. Binary data is best returned as
+    bool arrays (one byte per value), which are used without any conversion.
+
+    Parameters
+    ----------
+    cache_path : str
+        Directory of the cache.
+    make : callable
+        `make()` -> dict[str] = np.ndarray, only called on cache misses.
+    params : JSON serializable
+        Everything `make` depends on besides the contents of `filepaths`.
+    filepaths : iterable of str
+        Source files `make` reads.
+
+    Returns
+    -------
+    arrays : dict[str] = np.memmap
+        Read-only memory maps of the cached arrays.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> calls = []
+    >>> def make():
+    ...     calls.append(1)
+    ...     return {'X': np.arange(6).reshape((2, 3)) > 2}
+    >>> path = tempfile.mkdtemp()
+    >>> cached_arrays(path, make, {'threshold': 2})['X'].astype(int).tolist()
+    [[0, 0, 0], [1, 1, 1]]
+    >>> X = cached_arrays(path, make, {'threshold': 2})['X']
+    >>> len(calls), X.dtype == bool, X.flags.writeable
+    (1, True, False)
+    """
+    filepaths = list(filepaths)
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_path)
+    key = json.dumps([params, _source_checksums(cache_path, filepaths)], sort_keys=True)
+    entry_path = os.path.join(cache_path, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+
+    if not os.path.exists(entry_path):
+        # write to a temporary directory first: concurrent or interrupted runs never see partial entries
+        tmp_path = entry_path + '.tmp{0}'.format(os.getpid())
+        os.makedirs(tmp_path)
+        for name, X in make().items():
+            np.save(os.path.join(tmp_path, name + '.npy'), X)
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:  # another process was faster
+            shutil.rmtree(tmp_path)
+
+    return {fn[:-len('.npy')]: np.load(os.path.join(entry_path, fn), mmap_mode='r')
+            for fn in os.listdir(entry_path) if fn.endswith('.npy')}
+
+
+class BinaryDataset(object):
+    """Binary data of (n_samples, n_features) stored on disk with each sample
+    bit-packed, and streamed from a memory map in chunks.
+
+    Can be passed to `fit`, `transform` and `log_proba` of the models in place
+    of an in-memory array: `batch_iter` reads it chunk by chunk, optionally in
+    random order, while a background thread reads the next `read_ahead` chunks.
+    Peak memory is thus bounded by `read_ahead` + 1 unpacked chunks. Indexing
+    (e.g. X[:100]) returns the unpacked samples as a bool np.ndarray.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the dataset, see `write`.
+    chunk_size : positive int
+        Number of samples read at once (rounded down to a multiple of the batch size).
+    shuffle : bool
+        Whether training visits the chunks, and the samples within each
+        chunk, in a new random order in each epoch.
+    random_seed : None or int
+        Seed of the random order.
+    read_ahead : non-negative int
+        Number of chunks read in the background.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> X = np.arange(20).reshape((10, 2)) % 3 == 0
+    >>> path = BinaryDataset.write(tempfile.mkdtemp(), X, chunk_size=4)
+    >>> data = BinaryDataset(path, chunk_size=4)
+    >>> len(data), data.shape
+    (10, (10, 2))
+    >>> data[3:5].tolist() == X[3:5].tolist()
+    True
+    >>> [len(b) for b in data.iter_batches(3)]
+    [3, 3, 3, 1]
+    >>> data = BinaryDataset(path, chunk_size=4, shuffle=True, random_seed=1337)
+    >>> S = np.concatenate(list(data.iter_batches(2)))
+    >>> sorted(map(tuple, S.astype(int))) == sorted(map(tuple, X.astype(int)))
+    True
+    """
+    def __init__(self, path, chunk_size=10000, shuffle=False, random_seed=None, read_ahead=2):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.shuffle = shuffle
+        self.random_seed = random_seed
+        self.read_ahead = read_ahead
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.n_features = json.load(f)['n_features']
+        self._bits = np.load(os.path.join(self.path, 'bits.npy'), mmap_mode='r')
+        self._rng = RNG(seed=self.random_seed)
+
+    @staticmethod
+    def write(path, X, chunk_size=10000):
+        """Store binary array-like `X` (e.g. a memory map) at `path` chunk by chunk, return `path`."""
+        if not os.path.exists(path):
+            os.makedirs(path)
+        n_samples, n_features = np.shape(X)
+        bits = np.lib.format.open_memmap(os.path.join(path, 'bits.npy'), mode='w+', dtype=np.uint8,
+                                         shape=(n_samples, (n_features + 7) // 8))
+        for start in range(0, n_samples, chunk_size):
+            bits[start:start + chunk_size] = np.packbits(np.asarray(X[start:start + chunk_size]) != 0, axis=1)
+        bits.flush()
+        del bits
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'n_features': int(n_features)}, f)
+        return path
+
+    def __len__(self):
+        return len(self._bits)
+
+    @property
+    def shape(self):
+        return (len(self), self.n_features)
+
+    def __getitem__(self, key):
+        bits = self._bits[key]
+        if bits.ndim == 1:
+            return np.unpackbits(bits, count=self.n_features).astype(bool)
+        return np.unpackbits(bits, axis=1, count=self.n_features).astype(bool)
+
+    def __array__(self, dtype=None):
+        X = self[:]
+        return X if dtype is None else X.astype(dtype)
+
+    def _chunks(self, chunk_size, keep_order):
+        starts = np.arange(0, len(self), chunk_size)
+        shuffle = self.shuffle and not keep_order
+        if shuffle:
+            self._rng.shuffle(starts)
+        for start in starts:
+            chunk = self[start:start + chunk_size]
+            if shuffle:
+                self._rng.shuffle(chunk)
+            yield chunk
+
+    def iter_batches(self, batch_size, keep_order=False):
+        """Iterate over batches of unpacked samples (the last one may be smaller).
+
+        If `keep_order`, always visit the samples in their stored order, as
+        needed for per-sample outputs, otherwise shuffle them if `shuffle`.
+        """
+        chunk_size = max(1, self.chunk_size // batch_size) * batch_size
+        chunks = self._chunks(chunk_size, keep_order)
+        if self.read_ahead:
+            chunks = prefetch(chunks, self.read_ahead)
+        for chunk in chunks:
+            for start in range(0, len(chunk), batch_size):
+                yield chunk[start:start + batch_size]
+
+
+def prefetch(it, n):
+    """Iterate over `it`, computing up to `n` items in advance in a background thread.
+
+    The thread stops as soon as the iteration ends, also when it is left
+    early (by `break`, an exception or `close()`).
+    """
+    q = queue.Queue(maxsize=n)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # give up once the consumer is gone, instead of blocking forever
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in it:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)
+        put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # release the items read ahead
+        while not q.empty():
+            q.get_nowait()
+        thread.join()
+
+
 if __name__ == '__main__':
     # run corresponding tests
     from .testing import run_tests
@@ -0,0 +1,895 @@
+import numpy as np
+from scipy.special import expit
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+
+def split_layers(samples, layer_sizes):
+    """Split concatenated samples of all layers into per-layer views.
+
+    Parameters
+    ----------
+    samples : (n_samples, sum(layer_sizes)) array-like
+        States of all units, as returned by `sample_gibbs`
+        (visible units first, then hidden layers in order).
+    layer_sizes : iterable of positive int
+
+    Returns
+    -------
+    layers : list of (n_samples, layer_sizes[i]) np.ndarray
+
+    Examples
+    --------
+    >>> X = np.arange(12).reshape((2, 6))
+    >>> [L.shape for L in split_layers(X, (1, 2, 3))]
+    [(2, 1), (2, 2), (2, 3)]
+    """
+    samples = np.asarray(samples)
+    bounds = np.cumsum([0] + list(layer_sizes))
+    if samples.shape[1] != bounds[-1]:
+        raise ValueError('`samples` have {0} columns, but layers have {1} units in total'.
+                         format(samples.shape[1], bounds[-1]))
+    return [samples[:, bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def active_indices(mask):
+    """Row and column indices of nonzero entries of `mask` (in C-order),
+    the compact index used by the estimators when a mask is given.
+
+    Examples
+    --------
+    >>> active_indices([[1, 0], [0, 1]])
+    (array([0, 1]), array([0, 1]))
+    """
+    return np.nonzero(np.asarray(mask))
+
+
+def scatter(values, indices, shape, fill_value=0.):
+    """Scatter compact `values` at `indices` = (rows, cols) into a dense array.
+
+    Examples
+    --------
+    >>> scatter([2., 3.], active_indices([[1, 0], [0, 1]]), (2, 2))
+    array([[2., 0.],
+           [0., 3.]])
+    """
+    dense = np.full(shape, fill_value, dtype=np.float64)
+    dense[indices] = values
+    return dense
+
+
+def rao_blackwellize(samples, layer_sizes, weights, biases, chunk_size=10000):
+    """Replace states of every other hidden layer by their conditional means.
+
+    In a layered Boltzmann machine with Bernoulli hidden units, the units of
+    odd layers (1st, 3rd, ... hidden layer) are independent given the states
+    of their neighbouring layers, and every weight connects an odd layer
+    to an even one. Hence E[x_i y_j] = E[x_i p(y_j = 1 | neighbours)] for all
+    weights, and substituting the conditional means keeps all estimates
+    of `FisherAccumulator` unbiased while lowering their variance.
+
+    Parameters
+    ----------
+    samples : (n_samples, sum(layer_sizes)) array-like
+        Binary states of all layers, visible units first.
+    layer_sizes : iterable of positive int
+    weights : list of (layer_sizes[i], layer_sizes[i + 1]) array-like
+    biases : list of (layer_sizes[i],) array-like
+        Biases of all layers, visible ones first.
+    chunk_size : positive int
+
+    Returns
+    -------
+    rb_samples : (n_samples, sum(layer_sizes)) np.ndarray
+
+    Examples
+    --------
+    >>> X = np.array([[1., 0., 1., 1.]])
+    >>> rao_blackwellize(X, (1, 2, 1), [np.zeros((1, 2)), np.zeros((2, 1))],
+    ...                  [np.zeros(1), np.zeros(2), np.zeros(1)])
+    array([[1. , 0.5, 0.5, 1. ]])
+    """
+    samples = np.asarray(samples)
+    layer_sizes = list(layer_sizes)
+    rb_samples = np.array(samples, dtype=np.float64)
+    for start in range(0, len(samples), chunk_size):
+        layers = split_layers(rb_samples[start:(start + chunk_size)], layer_sizes)
+        for k in range(1, len(layer_sizes), 2):
+            T = layers[k - 1].dot(weights[k - 1]) + biases[k]
+            if k + 1 < len(layer_sizes):
+                T += layers[k + 1].dot(np.transpose(weights[k]))
+            layers[k][:] = expit(T)  # views into `rb_samples`
+    return rb_samples
+
+
+class FisherAccumulator(object):
+    """Streaming estimator of the diagonal of the Fisher information (FI)
+    of the weights of a layered binary Boltzmann machine (RBM or DBM).
+
+    For binary units the FI of a weight w_ij connecting unit i of one layer
+    to unit j of the next layer is the variance of the co-activation x_i * y_j.
+    It thus depends only on the first moments <x_i> and the co-activations
+    <x_i y_j>, which are accumulated chunk by chunk with matrix products:
+
+    * variance estimate:  <x_i y_j> (1 - <x_i y_j>)
+    * heuristic estimate: <x_i><y_j> (1 - <x_i><y_j>), i.e. the same
+      quantity assuming both units fire independently.
+
+    Memory does not depend on the number of samples seen.
+
+    Parameters
+    ----------
+    layer_sizes : iterable of positive int
+        Number of units in each layer, from the visible layer to the topmost
+        hidden one (= order of columns in samples from `sample_gibbs`).
+    chunk_size : positive int
+        Maximum number of samples processed with one matrix product,
+        bounds the size of temporary arrays.
+    masks : None or iterable of None or (layer_sizes[i], layer_sizes[i + 1]) array-like
+        Effective masks (e.g. `rf_mask * prune_mask`) of the weight matrices.
+        If provided, only co-activations of active weights are accumulated
+        and estimates are returned in compact form, aligned with
+        `indices_[i]` = `active_indices(masks[i])`; use `scatter` or
+        `estimates(dense=True)` to get dense arrays.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> X = (rng.rand(1000, 5) > 0.5).astype(float)
+    >>> acc = FisherAccumulator((2, 3))
+    >>> acc.update(X[:300]).update(X[300:]).n_samples_
+    1000
+    >>> var_est, heu_est = acc.estimates()[0]
+    >>> var_est.shape
+    (2, 3)
+    >>> p = np.mean(X[:, :2, None] * X[:, None, 2:], axis=0)
+    >>> np.allclose(var_est, p * (1. - p))
+    True
+    >>> mask = np.array([[1, 0, 0], [0, 1, 1]])
+    >>> acc = FisherAccumulator((2, 3), masks=[mask]).update(X)
+    >>> var_est_active, _ = acc.estimates()[0]
+    >>> var_est_active.shape
+    (3,)
+    >>> np.allclose(acc.estimates(dense=True)[0][0], var_est * mask)
+    True
+    """
+    # below this fraction of active weights among connected units gathering
+    # the active co-activations is cheaper than a (reduced) matrix product
+    gather_fraction = 0.005
+
+    def __init__(self, layer_sizes, chunk_size=10000, masks=None):
+        self.layer_sizes = [int(n) for n in layer_sizes]
+        if len(self.layer_sizes) < 2:
+            raise ValueError('at least 2 layers are required, got {0}'.format(self.layer_sizes))
+        self.chunk_size = chunk_size
+        if masks is None:
+            masks = [None] * (len(self.layer_sizes) - 1)
+        masks = list(masks)
+        if len(masks) != len(self.layer_sizes) - 1:
+            raise ValueError('expected {0} masks, got {1}'.format(len(self.layer_sizes) - 1, len(masks)))
+        self.indices_ = [None if M is None else active_indices(M) for M in masks]
+
+        # units with at least one active weight and positions of active weights among them
+        self._connected = []
+        for ind in self.indices_:
+            if ind is None:
+                self._connected.append(None)
+                continue
+            rows, cols = np.unique(ind[0]), np.unique(ind[1])
+            self._connected.append((rows, cols, np.searchsorted(rows, ind[0]), np.searchsorted(cols, ind[1])))
+        self.reset()
+
+    def reset(self):
+        self.n_samples_ = 0
+        self._sums = [np.zeros(n) for n in self.layer_sizes]
+        self._coactivations = [np.zeros((self.layer_sizes[i], self.layer_sizes[i + 1]))
+                               if self.indices_[i] is None else np.zeros(len(self.indices_[i][0]))
+                               for i in range(len(self.layer_sizes) - 1)]
+        return self
+
+    def update(self, samples):
+        """Add a batch of samples of all layers, concatenated column-wise."""
+        samples = np.asarray(samples)
+        for start in range(0, len(samples), self.chunk_size):
+            chunk = samples[start:(start + self.chunk_size)]
+            self.update_layers(split_layers(chunk, self.layer_sizes))
+        return self
+
+    def update_layers(self, layers):
+        """Add a batch of samples given as a list of per-layer arrays."""
+        if len(layers) != len(self.layer_sizes):
+            raise ValueError('expected {0} layers, got {1}'.format(len(self.layer_sizes), len(layers)))
+        layers = [np.asarray(L, dtype=np.float64) for L in layers]
+        for i, L in enumerate(layers):
+            self._sums[i] += L.sum(axis=0)
+        for i in range(len(layers) - 1):
+            self._coactivations[i] += self._coactivation_sums(i, layers[i], layers[i + 1])
+        self.n_samples_ += len(layers[0])
+        return self
+
+    def _coactivation_sums(self, i, X, Y):
+        if self.indices_[i] is None:
+            return X.T.dot(Y)
+        rows, cols = self.indices_[i]
+        connected_rows, connected_cols, local_rows, local_cols = self._connected[i]
+        if len(rows) > self.gather_fraction * len(connected_rows) * len(connected_cols):
+            # matrix product restricted to connected units only
+            return X[:, connected_rows].T.dot(Y[:, connected_cols])[local_rows, local_cols]
+        # gather only active pairs, in blocks bounding the temporary arrays
+        sums = np.empty(len(rows))
+        block = max(1, self.chunk_size * 100 // max(1, len(X)))
+        for start in range(0, len(rows), block):
+            r, c = rows[start:(start + block)], cols[start:(start + block)]
+            sums[start:(start + block)] = np.einsum('ij,ij->j', X[:, r], Y[:, c])
+        return sums
+
+    def add_moments(self, sums, coactivations, n_samples):
+        """Add moments accumulated elsewhere (e.g. inside a TF graph).
+
+        Parameters
+        ----------
+        sums : list of (layer_sizes[i],) array-like
+            Sums of unit states of each layer over `n_samples` samples.
+        coactivations : list of (layer_sizes[i], layer_sizes[i + 1]) array-like
+            Sums of co-activations of units in adjacent layers
+            (only active entries are kept if masks were given).
+        n_samples : non-negative int
+
+        Examples
+        --------
+        >>> X = np.array([[1., 0., 1.], [1., 1., 0.]])
+        >>> acc = FisherAccumulator((1, 2)).add_moments([X[:, :1].sum(0), X[:, 1:].sum(0)],
+        ...                                             [X[:, :1].T.dot(X[:, 1:])], 2)
+        >>> np.allclose(acc.coactivations()[0], FisherAccumulator((1, 2)).update(X).coactivations()[0])
+        True
+        """
+        if len(sums) != len(self._sums) or len(coactivations) != len(self._coactivations):
+            raise ValueError('expected moments of {0} layers'.format(len(self.layer_sizes)))
+        for i, s in enumerate(sums):
+            self._sums[i] += np.asarray(s, dtype=np.float64)
+        for i, c in enumerate(coactivations):
+            c = np.asarray(c, dtype=np.float64)
+            if self.indices_[i] is not None:
+                c = c[self.indices_[i]]
+            self._coactivations[i] += c
+        self.n_samples_ += int(n_samples)
+        return self
+
+    def means(self):
+        """Mean activation of units of each layer."""
+        self._check_not_empty()
+        return [s / self.n_samples_ for s in self._sums]
+
+    def coactivations(self):
+        """Mean co-activations <x_i y_j> of units in adjacent layers."""
+        self._check_not_empty()
+        return [c / self.n_samples_ for c in self._coactivations]
+
+    def estimates(self, dense=False):
+        """Compute FI estimates for all weight matrices.
+
+        Parameters
+        ----------
+        dense : bool
+            If True, scatter compact estimates of masked weight matrices
+            back to their shape, with zeros for inactive weights.
+
+        Returns
+        -------
+        estimates : list of (var_est, heu_est)
+            One pair per weight matrix, going from the visible layer upwards.
+            Both arrays have shape (layer_sizes[i], layer_sizes[i + 1]), same as
+            the corresponding weight matrix (this is `var_est.reshape((nh, nv)).T`
+            in terms of the flat output of `FI_weights_var_heur_estimates`),
+            or (n_active,) for masked weight matrices unless `dense`.
+        """
+        means = self.means()
+        estimates = []
+        for i, P in enumerate(self.coactivations()):
+            var_est = P * (1. - P)
+            Q = self._pair_products(i, means[i], means[i + 1])
+            heu_est = Q * (1. - Q)
+            if dense and self.indices_[i] is not None:
+                shape = (self.layer_sizes[i], self.layer_sizes[i + 1])
+                var_est = scatter(var_est, self.indices_[i], shape)
+                heu_est = scatter(heu_est, self.indices_[i], shape)
+            estimates.append((var_est, heu_est))
+        return estimates
+
+    def standard_errors(self):
+        """Approximate standard errors of the FI estimates (delta method),
+        treating the accumulated samples as independent.
+
+        Co-activations and unit states are Bernoulli, so <x y> has variance
+        P(1 - P) / n and the variance estimate P(1 - P) has standard error
+        |1 - 2P| sqrt(P(1 - P) / n). For the heuristic estimate the errors of
+        the two means are combined assuming independence. For Rao-Blackwellized
+        samples (see `rao_blackwellize`) the errors are conservative.
+
+        Returns
+        -------
+        errors : list of (var_se, heu_se)
+            Same layout as `estimates()` (compact for masked weight matrices).
+
+        Examples
+        --------
+        >>> X = np.array([[1., 1.], [1., 0.], [0., 0.], [1., 1.]])
+        >>> (var_se, heu_se), = FisherAccumulator((1, 1)).update(X).standard_errors()
+        >>> var_se
+        array([[0.]])
+        """
+        n = self.n_samples_
+        means = self.means()
+        errors = []
+        for i, P in enumerate(self.coactivations()):
+            var_se = np.abs(1. - 2. * P) * np.sqrt(P * (1. - P) / n)
+            x_var = self._pair_products(i, means[i] * (1. - means[i]), np.square(means[i + 1]))
+            y_var = self._pair_products(i, np.square(means[i]), means[i + 1] * (1. - means[i + 1]))
+            Q = self._pair_products(i, means[i], means[i + 1])
+            heu_se = np.abs(1. - 2. * Q) * np.sqrt((x_var + y_var) / n)
+            errors.append((var_se, heu_se))
+        return errors
+
+    def _pair_products(self, i, x, y):
+        """x_i * y_j for all (active) weights of weight matrix `i`."""
+        if self.indices_[i] is None:
+            return np.outer(x, y)
+        rows, cols = self.indices_[i]
+        return x[rows] * y[cols]
+
+    def _check_not_empty(self):
+        if not self.n_samples_:
+            raise RuntimeError('no samples accumulated yet')
+
+
+def fi_estimates(samples, layer_sizes, chunk_size=10000, masks=None, dense=False):
+    """Compute variance and heuristic FI estimates of all weight matrices
+    from an array of samples, see `FisherAccumulator`.
+
+    Unlike stacking the samples of adjacent layers first, this works
+    on (views of) the concatenated samples directly, in chunks.
+
+    Examples
+    --------
+    >>> X = np.array([[1, 0, 1, 1], [1, 1, 0, 1]])
+    >>> (var_est1, heu_est1), (var_est2, heu_est2) = fi_estimates(X, (1, 2, 1))
+    >>> var_est1
+    array([[0.25, 0.25]])
+    >>> var_est2
+    array([[0.25],
+           [0.25]])
+    >>> (var_est1, _), (var_est2, _) = fi_estimates(X, (1, 2, 1), masks=[[[0, 1]], None])
+    >>> var_est1
+    array([0.25])
+    """
+    acc = FisherAccumulator(layer_sizes, chunk_size=chunk_size, masks=masks)
+    return acc.update(samples).estimates(dense=dense)
+
+
+def running_fi_estimates(means, coactivations, damping, n_updates):
+    """Compute variance and heuristic FI estimates of all weight matrices
+    from exponential running means of unit states and co-activations.
+
+    Running means m_t = `damping` m_{t-1} + (1 - `damping`) x_t started at
+    zero are biased towards zero by the factor 1 - `damping` ** t after t
+    updates, which is divided out first (as in Adam), so that the estimates
+    are usable long before 1 / (1 - `damping`) updates.
+
+    Parameters
+    ----------
+    means : list of (layer_sizes[i],) array-like
+        Running means of the states of each layer, visible units first.
+    coactivations : list of (layer_sizes[i], layer_sizes[i + 1]) array-like
+        Running means of the co-activations of adjacent layers.
+    damping : float in (0, 1)
+    n_updates : positive int
+        Number of updates of the running means since they were zero.
+
+    Returns
+    -------
+    estimates : list of (var_est, heu_est)
+        Same layout as `FisherAccumulator.estimates`.
+
+    Examples
+    --------
+    >>> d, t = 0.99, 10
+    >>> means = [np.full(2, 0.5 * (1. - d ** t)), np.full(3, 0.4 * (1. - d ** t))]
+    >>> (var_est, heu_est), = running_fi_estimates(means, [np.full((2, 3), 0.1 * (1. - d ** t))], d, t)
+    >>> print(np.allclose(var_est, 0.09), np.allclose(heu_est, 0.16))
+    True True
+    """
+    if n_updates < 1:
+        raise ValueError('running means need at least one update, got {0}'.format(n_updates))
+    correction = 1. - damping ** n_updates
+    means = [np.asarray(m) / correction for m in means]
+    estimates = []
+    for i, P in enumerate(coactivations):
+        P = np.asarray(P) / correction
+        Q = np.outer(means[i], means[i + 1])
+        estimates.append((P * (1. - P), Q * (1. - Q)))
+    return estimates
+
+
+def sequential_fi(blocks, layer_sizes, percentile, round_size=5000, max_samples=None,
+                  tol=0.01, z=1.96, masks=None, scales=None, use_var=True, chunk_size=10000):
+    """Estimate FI from rounds of samples until it is clear which
+    weights fall below the pruning threshold.
+
+    After each round of at least `round_size` samples, the threshold is
+    the `percentile` of the (scaled) estimates of the active weights of each
+    weight matrix, and a weight is undecided if its confidence interval
+    estimate +- `z` * standard error contains the threshold
+    (see `FisherAccumulator.standard_errors`). Sampling stops once at most
+    a fraction `tol` of the active weights of every weight matrix is undecided,
+    or `blocks` are exhausted, or `max_samples` are reached.
+
+    Samples from persistent chains are correlated, so the intervals are
+    optimistic if the chains are not thinned enough between blocks.
+
+    Parameters
+    ----------
+    blocks : iterable of (n, sum(layer_sizes)) array-like
+        Samples of all layers, e.g. from `DBM._iter_full_samples`.
+    layer_sizes : iterable of positive int
+    percentile : float in [0, 100]
+        Pruning threshold, as passed to `np.percentile`.
+    round_size : positive int
+        Minimum number of samples between two checks.
+    max_samples : None or positive int
+    tol : float in [0, 1]
+    z : positive float
+        Width of the confidence intervals in standard errors.
+    masks : see `FisherAccumulator`
+    scales : None or iterable of None or (layer_sizes[i], layer_sizes[i + 1]) array-like
+        Per-weight factors the estimates are multiplied with before
+        thresholding (e.g. squared weights).
+    use_var : bool
+        Whether to decide on the variance or the heuristic estimate.
+
+    Returns
+    -------
+    acc : FisherAccumulator
+        `acc.n_samples_` is the number of samples used.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> p = np.linspace(0.05, 0.5, 6)
+    >>> blocks = ((rng.rand(100, 6) < p).astype(float) for _ in range(1000))
+    >>> acc = sequential_fi(blocks, (3, 3), 50, round_size=1000, tol=0.2)
+    >>> acc.n_samples_ < 100000
+    True
+    """
+    acc = FisherAccumulator(layer_sizes, chunk_size=chunk_size, masks=masks)
+    n_weights = len(acc.layer_sizes) - 1
+    if scales is None:
+        scales = [None] * n_weights
+    scales = [None if S is None else (np.asarray(S) if acc.indices_[i] is None else np.asarray(S)[acc.indices_[i]])
+              for i, S in enumerate(scales)]
+
+    n_round = 0
+    for block in blocks:
+        acc.update(block)
+        n_round += len(block)
+        if max_samples is not None and acc.n_samples_ >= max_samples:
+            break
+        if n_round < round_size:
+            continue
+        n_round = 0
+
+        decided = True
+        for i, (estimates, errors) in enumerate(zip(acc.estimates(), acc.standard_errors())):
+            est, se = (estimates[0], errors[0]) if use_var else (estimates[1], errors[1])
+            if scales[i] is not None:
+                est, se = est * scales[i], se * np.abs(scales[i])
+            if est.size:
+                thr = np.percentile(est, percentile)
+                decided &= np.mean(np.abs(est - thr) <= z * se) <= tol
+        if decided:
+            break
+    return acc
+
+
+def fim_operator(samples, n_visible, mask=None, chunk_size=10000):
+    """Matrix-free Fisher information matrix (FIM) of a binary RBM.
+
+    The FIM w.r.t. parameters (vb, hb, W) is the covariance of the sufficient
+    statistics s(v, h) = (v, h, vec(v h^T)). Its product with a vector u is
+    computed from the samples in chunks as E[s (s.u)] - E[s] (E[s].u), so the
+    (nv + nh + nv * nh)^2 matrix is never formed and memory is linear in the
+    number of parameters.
+
+    Parameters
+    ----------
+    samples : (n_samples, n_visible + n_hidden) array-like
+        Samples of visible and hidden units, as returned by `sample_gibbs`.
+    n_visible : positive int
+    mask : None or (n_visible, n_hidden) array-like
+        If provided, weights where `mask` is 0 (pruned ones) are excluded:
+        their rows and columns of the FIM are treated as zeros.
+    chunk_size : positive int
+
+    Returns
+    -------
+    op : scipy.sparse.linalg.LinearOperator
+        Symmetric operator of shape (n_params, n_params) with parameters
+        ordered as vb, hb, W (in C-order of (n_visible, n_hidden)).
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> X = (rng.rand(500, 5) > 0.5).astype(float)
+    >>> S = np.hstack((X, (X[:, :2, None] * X[:, None, 2:]).reshape((500, 6))))
+    >>> F = np.cov(S, rowvar=False, bias=True)
+    >>> np.allclose(fim_operator(X, 2).matmat(np.eye(11)), F)
+    True
+    """
+    samples = np.asarray(samples)
+    n_hidden = samples.shape[1] - n_visible
+    V, H = split_layers(samples, (n_visible, n_hidden))
+    acc = FisherAccumulator((n_visible, n_hidden), chunk_size=chunk_size).update(samples)
+    mean_v, mean_h = acc.means()
+    mean_W = acc.coactivations()[0]
+    if mask is None:
+        mask = np.ones((n_visible, n_hidden))
+    mask = np.asarray(mask, dtype=bool).astype(np.float64)
+    n_params = n_visible + n_hidden + n_visible * n_hidden
+
+    def matvec(u):
+        u = np.ravel(u)
+        a = u[:n_visible]
+        b = u[n_visible:(n_visible + n_hidden)]
+        U = u[(n_visible + n_hidden):].reshape((n_visible, n_hidden)) * mask
+        mean_t = mean_v.dot(a) + mean_h.dot(b) + np.sum(mean_W * U)
+
+        out_v = np.zeros(n_visible)
+        out_h = np.zeros(n_hidden)
+        out_W = np.zeros((n_visible, n_hidden))
+        for start in range(0, len(samples), chunk_size):
+            Vc = V[start:(start + chunk_size)].astype(np.float64)
+            Hc = H[start:(start + chunk_size)].astype(np.float64)
+            t = Vc.dot(a) + Hc.dot(b) + np.einsum('ij,ij->i', Vc.dot(U), Hc) - mean_t
+            out_v += t.dot(Vc)
+            out_h += t.dot(Hc)
+            out_W += (Vc * t[:, None]).T.dot(Hc)
+        out_W *= mask
+        return np.concatenate((out_v, out_h, out_W.ravel())) / len(samples)
+
+    return LinearOperator((n_params, n_params), matvec=matvec, rmatvec=matvec, dtype=np.float64)
+
+
+def fim_eigenvectors(samples, n_visible, k=1, mask=None, chunk_size=10000, tol=0, maxiter=None):
+    """Compute the leading eigenvectors of the FIM of a binary RBM
+    with Lanczos iterations on `fim_operator`.
+
+    Parameters
+    ----------
+    samples, n_visible, mask, chunk_size :
+        See `fim_operator`.
+    k : positive int
+        Number of eigenvectors, must be less than the number of parameters.
+    tol, maxiter :
+        Passed to `scipy.sparse.linalg.eigsh`.
+
+    Returns
+    -------
+    eigvals : (k,) np.ndarray
+        Largest eigenvalues in decreasing order.
+    (vb, hb, W) : (n_visible, k), (n_hidden, k), (n_visible, n_hidden, k) np.ndarray
+        Corresponding eigenvectors split by parameter, same layout as `fim_eig`.
+        Signs are chosen such that entries of each eigenvector sum up
+        to a non-negative number.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> X = (rng.rand(500, 5) > 0.5).astype(float)
+    >>> S = np.hstack((X, (X[:, :2, None] * X[:, None, 2:]).reshape((500, 6))))
+    >>> eigvals, (vb, hb, W) = fim_eigenvectors(X, 2)
+    >>> W.shape
+    (2, 3, 1)
+    >>> print(np.isclose(eigvals[0], np.linalg.eigvalsh(np.cov(S, rowvar=False, bias=True))[-1]))
+    True
+    >>> eigvals, (vb, hb, W) = fim_eigenvectors(X, 2, mask=[[1, 1, 1], [1, 1, 0]])
+    >>> print(W[1, 2, 0] == 0.)
+    True
+    """
+    samples = np.asarray(samples)
+    n_hidden = samples.shape[1] - n_visible
+    op = fim_operator(samples, n_visible, mask=mask, chunk_size=chunk_size)
+    eigvals, vecs = eigsh(op, k=k, which='LA', v0=np.ones(op.shape[0]), tol=tol, maxiter=maxiter)
+    return _split_eigenvectors(eigvals, vecs, n_visible, n_hidden, mask)
+
+
+def _split_eigenvectors(eigvals, vecs, n_visible, n_hidden, mask=None):
+    """Sort eigenpairs in decreasing order, fix signs
+    and split eigenvectors into (vb, hb, W) blocks."""
+    order = np.argsort(eigvals)[::-1]
+    eigvals, vecs = eigvals[order], vecs[:, order]
+    vecs *= np.where(vecs.sum(axis=0) < 0., -1., 1.)
+    if mask is not None:
+        vecs[(n_visible + n_hidden):] *= np.asarray(mask, dtype=bool).reshape((-1, 1))
+    vb = vecs[:n_visible]
+    hb = vecs[n_visible:(n_visible + n_hidden)]
+    W = vecs[(n_visible + n_hidden):].reshape((n_visible, n_hidden, vecs.shape[1]))
+    return eigvals, (vb, hb, W)
+
+
+def iter_visible_states(W, vb, hb, block_size=4096):
+    """Enumerate all visible states of a Bernoulli RBM in blocks,
+    with their exact model probabilities and hidden conditional means
+    (hidden units are summed out analytically).
+
+    Parameters
+    ----------
+    W : (n_visible, n_hidden) array-like
+    vb : (n_visible,) array-like
+    hb : (n_hidden,) array-like
+    block_size : positive int
+        Number of visible states per block.
+
+    Yields
+    ------
+    V : (b, n_visible) np.ndarray
+        Visible states.
+    p : (b,) np.ndarray
+        Their probabilities p(v) under the model (sum up to 1 over all blocks).
+    H : (b, n_hidden) np.ndarray
+        Conditional means p(h = 1 | v).
+
+    Examples
+    --------
+    >>> blocks = list(iter_visible_states(np.zeros((3, 2)), np.zeros(3), np.zeros(2), block_size=3))
+    >>> [len(V) for V, _, _ in blocks]
+    [3, 3, 2]
+    >>> print(np.isclose(sum(p.sum() for _, p, _ in blocks), 1.))
+    True
+    """
+    W, vb, hb = (np.asarray(x, dtype=np.float64) for x in (W, vb, hb))
+    n_visible = W.shape[0]
+    if n_visible > 24:
+        raise ValueError('cannot enumerate 2^{0} visible states'.format(n_visible))
+    bits = np.arange(n_visible)[::-1]
+
+    def blocks():
+        for start in range(0, 2 ** n_visible, block_size):
+            idx = np.arange(start, min(start + block_size, 2 ** n_visible))
+            V = ((idx[:, None] >> bits) & 1).astype(np.float64)
+            T = V.dot(W) + hb
+            # log of unnormalized p(v), hidden units summed out
+            log_p = V.dot(vb) + np.logaddexp(0., T).sum(axis=1)
+            yield V, log_p, T
+
+    log_Z = np.logaddexp.reduce([np.logaddexp.reduce(log_p) for _, log_p, _ in blocks()])
+    for V, log_p, T in blocks():
+        yield V, np.exp(log_p - log_Z), expit(T)
+
+
+def exact_fi(W, vb, hb, block_size=4096, mask=None):
+    """Exact diagonal FI of the weights of a small Bernoulli RBM,
+    by enumerating all visible states (see `iter_visible_states`).
+
+    Returns
+    -------
+    acc : FisherAccumulator
+        Holding the exact model moments, so that `acc.estimates()` and
+        `acc.means()` have the same layout as for sampled estimates
+        (`acc.n_samples_` is 1 and standard errors are meaningless).
+
+    Examples
+    --------
+    >>> (var_est, heu_est), = exact_fi(np.zeros((2, 3)), np.zeros(2), np.zeros(3)).estimates()
+    >>> var_est
+    array([[0.1875, 0.1875, 0.1875],
+           [0.1875, 0.1875, 0.1875]])
+    """
+    W = np.asarray(W)
+    n_visible, n_hidden = W.shape
+    sums = [np.zeros(n_visible), np.zeros(n_hidden)]
+    coactivations = np.zeros((n_visible, n_hidden))
+    for V, p, H in iter_visible_states(W, vb, hb, block_size=block_size):
+        pV = p[:, None] * V
+        sums[0] += pV.sum(axis=0)
+        sums[1] += p.dot(H)
+        coactivations += pV.T.dot(H)
+    acc = FisherAccumulator((n_visible, n_hidden), masks=[mask])
+    return acc.add_moments(sums, [coactivations], 1)
+
+
+def exact_fim(W, vb, hb, block_size=4096):
+    """Exact FIM of a small Bernoulli RBM w.r.t. (vb, hb, W), in the
+    parameter order of `fim_operator`.
+
+    By the law of total covariance the FIM is the covariance over v of the
+    conditional means s(v) = (v, p, v p^T) of the sufficient statistics
+    plus the expected conditional covariance, which is nonzero only between
+    statistics of the same hidden unit j: a_k a_l p_j (1 - p_j) with a = (1, v).
+
+    Returns
+    -------
+    F : (n_params, n_params) np.ndarray
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> W, vb, hb = rng.randn(3, 2), rng.randn(3), rng.randn(2)
+    >>> F = exact_fim(W, vb, hb)
+    >>> F.shape
+    (11, 11)
+    >>> (var_est, _), = exact_fi(W, vb, hb).estimates()
+    >>> np.allclose(np.diag(F)[5:], var_est.ravel())
+    True
+    """
+    W = np.asarray(W)
+    n_visible, n_hidden = W.shape
+    n_params = n_visible + n_hidden + n_visible * n_hidden
+    moments = np.zeros((n_params, n_params))
+    means = np.zeros(n_params)
+    C = np.zeros((n_visible + 1, n_visible + 1, n_hidden))
+    for V, p, H in iter_visible_states(W, vb, hb, block_size=block_size):
+        S = np.hstack((V, H, (V[:, :, None] * H[:, None, :]).reshape((len(V), -1))))
+        moments += (S * p[:, None]).T.dot(S)
+        means += p.dot(S)
+        A = np.hstack((np.ones((len(V), 1)), V))
+        C += np.einsum('n,na,nb,nj->abj', p, A, A, H * (1. - H))
+    F = moments - np.outer(means, means)
+
+    # position of statistic a_k h_j in the parameter vector (k = 0 is the hidden bias)
+    pos = np.vstack((n_visible + np.arange(n_hidden),
+                     n_visible + n_hidden + np.arange(n_visible * n_hidden).reshape((n_visible, n_hidden))))
+    F[pos[:, None, :], pos[None, :, :]] += C
+    return F
+
+
+def exact_fim_eigenvectors(W, vb, hb, k=1, mask=None, block_size=4096):
+    """Leading eigenvectors of the exact FIM of a small Bernoulli RBM,
+    same output as `fim_eigenvectors`.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> W, vb, hb = rng.randn(3, 2), rng.randn(3), rng.randn(2)
+    >>> eigvals, (vb_vec, hb_vec, W_vec) = exact_fim_eigenvectors(W, vb, hb, k=2)
+    >>> W_vec.shape
+    (3, 2, 2)
+    >>> print(np.allclose(eigvals, np.linalg.eigvalsh(exact_fim(W, vb, hb))[::-1][:2]))
+    True
+    """
+    W = np.asarray(W)
+    n_visible, n_hidden = W.shape
+    F = exact_fim(W, vb, hb, block_size=block_size)
+    if mask is not None:
+        active = np.concatenate((np.ones(n_visible + n_hidden, dtype=bool),
+                                 np.asarray(mask, dtype=bool).ravel()))
+        F = F * active[:, None] * active[None, :]
+    eigvals, vecs = np.linalg.eigh(F)
+    return _split_eigenvectors(eigvals[-k:], vecs[:, -k:], n_visible, n_hidden, mask)
+
+
+def iter_block_fi(lower, upper, mask=None, batch_size=16, chunk_size=1000):
+    """Compute per-hidden-unit blocks of the FI of the weights between two layers.
+
+    The block of unit j of the upper layer is the covariance of the statistics
+    x_i * y_j of its incoming (active) weights, i.e. the FIM restricted to them.
+    Blocks are computed for batches of units with similar fan-in (padded to the
+    largest one in the batch) from the samples in chunks, so the cost is roughly
+    proportional to the number of samples times the sum of squared fan-ins.
+
+    Parameters
+    ----------
+    lower : (n_samples, n_lower) array-like
+        Samples of the lower layer (e.g. visible units).
+    upper : (n_samples, n_upper) array-like
+        Samples (or conditional means) of the upper layer.
+    mask : None or (n_lower, n_upper) array-like
+        If provided, only weights where `mask` is nonzero make up the blocks.
+    batch_size : positive int
+        Number of units whose blocks are computed at once.
+    chunk_size : positive int
+        Number of samples processed at once.
+
+    Yields
+    ------
+    units : (b,) np.ndarray
+        Indices of the units of the upper layer.
+    fan_in : (b, k) np.ndarray
+        Indices of units of the lower layer connected to them,
+        valid where `valid` is True.
+    valid : (b, k) bool np.ndarray
+    blocks : (b, k, k) np.ndarray
+        FI blocks, zero in padded rows and columns.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> X = (rng.rand(500, 3) > 0.5).astype(float)
+    >>> Y = (rng.rand(500, 2) > 0.5).astype(float)
+    >>> mask = np.array([[1, 1], [0, 1], [1, 1]])
+    >>> units, fan_in, valid, blocks = next(iter_block_fi(X, Y, mask=mask))
+    >>> units
+    array([0, 1])
+    >>> fan_in[valid]
+    array([0, 2, 0, 1, 2])
+    >>> np.allclose(blocks[1], np.cov(X * Y[:, 1:], rowvar=False, bias=True))
+    True
+    """
+    lower = np.asarray(lower)
+    upper = np.asarray(upper)
+    if mask is None:
+        mask = np.ones((lower.shape[1], upper.shape[1]), dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    fan_in_sizes = mask.sum(axis=0)
+    order = np.argsort(fan_in_sizes, kind='stable')
+    order = order[fan_in_sizes[order] > 0]
+
+    for start in range(0, len(order), batch_size):
+        units = order[start:(start + batch_size)]
+        k = fan_in_sizes[units].max()
+        # stable sort puts indices of connected units first, in increasing order
+        fan_in = np.argsort(~mask[:, units], axis=0, kind='stable')[:k].T
+        valid = np.arange(k) < fan_in_sizes[units][:, None]
+
+        S = np.zeros((len(units), k, k))
+        m = np.zeros((len(units), k))
+        for chunk in range(0, len(lower), chunk_size):
+            X = lower[chunk:(chunk + chunk_size)].astype(np.float64)
+            Y = upper[chunk:(chunk + chunk_size), units].astype(np.float64)
+            Z = X[:, fan_in] * Y[:, :, None] * valid  # (n_chunk, b, k)
+            S += np.matmul(Z.transpose(1, 2, 0), Z.transpose(1, 0, 2))
+            m += Z.sum(axis=0)
+        S /= len(lower)
+        m /= len(lower)
+        yield units, fan_in, valid, S - m[:, :, None] * m[:, None, :]
+
+
+def block_fi_saliencies(lower, upper, W, mask=None, damping=1e-4, batch_size=16, chunk_size=1000):
+    """Compute OBS-like pruning scores w_ij^2 / (2 [F_j^-1]_ii) from
+    per-hidden-unit FI blocks F_j, see `iter_block_fi`.
+
+    Unlike the FI diagonal, the score of a weight accounts for how well the
+    other incoming weights of the same unit can compensate for its removal.
+
+    Parameters
+    ----------
+    lower, upper, mask, batch_size, chunk_size :
+        See `iter_block_fi`.
+    W : (n_lower, n_upper) array-like
+        Current weights.
+    damping : non-negative float
+        Added to the diagonal of each block before inversion.
+
+    Returns
+    -------
+    saliencies : (n_lower, n_upper) np.ndarray
+        Zero where `mask` is zero.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> X = (rng.rand(500, 3) > 0.5).astype(float)
+    >>> Y = (rng.rand(500, 2) > 0.5).astype(float)
+    >>> mask = np.array([[1, 1], [0, 1], [1, 1]])
+    >>> saliencies = block_fi_saliencies(X, Y, np.ones((3, 2)), mask=mask)
+    >>> print(saliencies[1, 0])
+    0.0
+    >>> F = np.cov(X * Y[:, 1:], rowvar=False, bias=True) + 1e-4 * np.eye(3)
+    >>> np.allclose(saliencies[:, 1], 1. / (2. * np.diag(np.linalg.inv(F))))
+    True
+    """
+    W = np.asarray(W)
+    saliencies = np.zeros(W.shape)
+    for units, fan_in, valid, blocks in iter_block_fi(lower, upper, mask=mask,
+                                                      batch_size=batch_size, chunk_size=chunk_size):
+        # padded rows and columns get an identity block so that inversion is unaffected
+        eye = np.eye(blocks.shape[-1])
+        blocks = blocks + damping * eye + eye * ~valid[:, :, None]
+        diag_inv = np.diagonal(np.linalg.inv(blocks), axis1=1, axis2=2)
+        unit_idx = np.broadcast_to(units[:, None], fan_in.shape)
+        w = W[fan_in, unit_idx]
+        saliencies[fan_in[valid], unit_idx[valid]] = (np.square(w) / (2. * diag_inv))[valid]
+    return saliencies
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from .testing import run_tests
+    run_tests(__file__)
@@ -0,0 +1,163 @@
+import os
+import numpy as np
+
+
+class MaskLineage(object):
+    """Masks of active weights of a model over pruning sessions, stored on disk
+    as bit-packed, compressed differences to the previous session.
+
+    Masks are embedded into the weight matrices of the original (unpruned) model
+    using the original IDs of the remaining units, so that sessions with
+    different numbers of units are comparable and the difference of
+    consecutive sessions only contains the weights pruned in between. Every
+    `keyframe_every`-th session is stored completely, so that any session is
+    restored from at most `keyframe_every` files, without TF checkpoints.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the lineage, one 'session<k>.npz' file per session.
+        Sessions already stored there are continued.
+    keyframe_every : positive int
+        Distance between completely stored sessions.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> lineage = MaskLineage(tempfile.mkdtemp())
+    >>> _ = lineage.append([np.ones((3, 2))], [np.arange(3), np.arange(2)])
+    >>> _ = lineage.append([[[1, 0], [0, 1]]], [np.array([0, 2]), np.arange(2)])
+    >>> len(lineage), lineage.layer_sizes
+    (2, [3, 2])
+    >>> lineage.masks(1)[0].astype(int).tolist()
+    [[1, 0], [0, 1]]
+    >>> lineage.masks(1, full=True)[0].astype(int).tolist()
+    [[1, 0], [0, 0], [0, 1]]
+    >>> lineage.unit_ids(1)[0].tolist()
+    [0, 2]
+    """
+    def __init__(self, path, keyframe_every=10):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.n_sessions_ = 0
+        while os.path.exists(self._filepath(self.n_sessions_)):
+            self.n_sessions_ += 1
+        self.layer_sizes = None
+        if self.n_sessions_:
+            with np.load(self._filepath(0)) as f:
+                self.layer_sizes = f['layer_sizes'].tolist()
+        self._last = None # full masks of the last session, if known
+
+    def __len__(self):
+        return self.n_sessions_
+
+    def _filepath(self, k):
+        return os.path.join(self.path, 'session{0}.npz'.format(k))
+
+    def _is_keyframe(self, k):
+        return k % self.keyframe_every == 0
+
+    def _index(self, k):
+        if k < 0:
+            k += self.n_sessions_
+        if not 0 <= k < self.n_sessions_:
+            raise IndexError('session {0} not in lineage of {1} sessions'.format(k, self.n_sessions_))
+        return k
+
+    def _read(self, k):
+        with np.load(self._filepath(k)) as f:
+            n_layers = len(self.layer_sizes) - 1
+            bits = [np.unpackbits(f['mask_{0}'.format(i)], count=self.layer_sizes[i] * self.layer_sizes[i + 1])
+                    .reshape(self.layer_sizes[i], self.layer_sizes[i + 1]).astype(bool) for i in range(n_layers)]
+            unit_ids = [f['unit_ids_{0}'.format(i)] for i in range(n_layers + 1)]
+        return bits, unit_ids
+
+    def append(self, masks, unit_ids):
+        """Store the masks of the next session.
+
+        Parameters
+        ----------
+        masks : iterable of (n_i, n_{i+1}) array-like
+            Masks of active weights of each layer of the current model,
+            from the visible layer upwards.
+        unit_ids : iterable of (n_i,) int array-like
+            Original IDs of the current units of each layer. Those of the
+            first session define the sizes of the original model.
+
+        Returns
+        -------
+        k : int
+            Index of the stored session.
+        """
+        unit_ids = [np.asarray(ids, dtype=np.int64) for ids in unit_ids]
+        k = self.n_sessions_
+        if k == 0:
+            self.layer_sizes = [len(ids) for ids in unit_ids]
+        full = []
+        for i, M in enumerate(masks):
+            F = np.zeros((self.layer_sizes[i], self.layer_sizes[i + 1]), dtype=bool)
+            F[np.ix_(unit_ids[i], unit_ids[i + 1])] = np.asarray(M) != 0
+            full.append(F)
+
+        stored = full
+        if not self._is_keyframe(k):
+            if self._last is None:
+                self._last = self.masks(k - 1, full=True)
+            stored = [F ^ L for F, L in zip(full, self._last)]
+        data = {'mask_{0}'.format(i): np.packbits(S) for i, S in enumerate(stored)}
+        data.update(('unit_ids_{0}'.format(i), ids) for i, ids in enumerate(unit_ids))
+        data['layer_sizes'] = np.array(self.layer_sizes)
+
+        # write to a temporary file first: a crash never leaves a broken session behind
+        tmp_path = self._filepath(k) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **data)
+        os.replace(tmp_path, self._filepath(k))
+        self.n_sessions_ += 1
+        self._last = full
+        return k
+
+    def truncate(self, n_sessions):
+        """Forget all sessions from `n_sessions` on, e.g. of an interrupted run."""
+        for k in range(n_sessions, self.n_sessions_):
+            os.remove(self._filepath(k))
+        if n_sessions < self.n_sessions_:
+            self.n_sessions_ = n_sessions
+            self._last = None
+
+    def unit_ids(self, k):
+        """Original IDs of the units of each layer in session `k`."""
+        return self._read(self._index(k))[1]
+
+    def masks(self, k, full=False):
+        """Masks of active weights of each layer in session `k`.
+
+        Parameters
+        ----------
+        k : int
+            Index of the session, negative ones count from the end.
+        full : bool
+            If True, return the masks embedded into the weight matrices of
+            the original model, otherwise those of the model of session `k`.
+
+        Returns
+        -------
+        masks : list of bool np.ndarray
+        """
+        k = self._index(k)
+        start = k - k % self.keyframe_every
+        masks, unit_ids = self._read(start)
+        for j in range(start + 1, k + 1):
+            deltas, unit_ids = self._read(j)
+            masks = [M ^ D for M, D in zip(masks, deltas)]
+        if full:
+            return masks
+        return [M[np.ix_(unit_ids[i], unit_ids[i + 1])] for i, M in enumerate(masks)]
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from .testing import run_tests
+    run_tests(__file__)
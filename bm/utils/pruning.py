@@ -0,0 +1,759 @@
+import numpy as np
+from copy import copy
+
+from .fisher import block_fi_saliencies, fim_eigenvectors
+
+
+def connected_units(keep):
+    """Find the units on both sides of a weight matrix that keep at least
+    one active connection.
+
+    Parameters
+    ----------
+    keep : (n_lower, n_upper) array-like
+        Mask of active weights.
+
+    Returns
+    -------
+    lower, upper : (n_lower,), (n_upper,) bool np.ndarray
+
+    Examples
+    --------
+    >>> lower, upper = connected_units([[1, 0, 0], [0, 0, 0], [1, 0, 1]])
+    >>> lower.tolist(), upper.tolist()
+    ([True, False, True], [True, False, True])
+    """
+    keep = np.asarray(keep) != 0
+    return keep.any(axis=1), keep.any(axis=0)
+
+
+def surviving_units(keeps):
+    """Find the units of a layered BM that survive pruning of its weights.
+
+    A hidden unit survives if it is connected to each of its neighbouring
+    layers (units connected from one side only are dead ends). Visible
+    units hold the data and are never removed.
+
+    Parameters
+    ----------
+    keeps : iterable of (n_i, n_{i+1}) array-like
+        Masks of active weights, from the visible layer upwards.
+
+    Returns
+    -------
+    alive : list of (n_i,) bool np.ndarray
+        One entry per layer, including the visible one.
+
+    Examples
+    --------
+    >>> keep1 = [[1, 0, 1], [1, 0, 0]]
+    >>> keep2 = [[1, 0], [1, 0], [0, 0]]
+    >>> [a.tolist() for a in surviving_units([keep1, keep2])]
+    [[True, True], [True, False, False], [True, False]]
+    """
+    connected = [connected_units(K) for K in keeps]
+    alive = [np.ones(len(connected[0][0]), dtype=bool)]
+    for i, (_, upper) in enumerate(connected):
+        if i + 1 < len(connected):
+            upper = upper & connected[i + 1][0]
+        alive.append(upper)
+    return alive
+
+
+def remove_units(weights, keeps, biases, alive):
+    """Zero out pruned weights and drop removed units from weights, masks and biases.
+
+    Parameters
+    ----------
+    weights, keeps : iterables of (n_i, n_{i+1}) array-like
+        Weights and masks of active weights, from the visible layer upwards.
+    biases : iterable of (n_i,) array-like
+        Biases of all layers.
+    alive : iterable of (n_i,) bool array-like
+        Units to keep, e.g. from `surviving_units`.
+
+    Returns
+    -------
+    weights, keeps, biases : lists of np.ndarray
+        Reduced to the surviving units.
+
+    Examples
+    --------
+    >>> keeps = [[[1, 0], [1, 1]]]
+    >>> alive = [[True, True], [False, True]]
+    >>> W, K, b = remove_units([np.ones((2, 2))], keeps, [np.zeros(2), [1., 2.]], alive)
+    >>> W[0].tolist(), K[0].tolist(), b[1].tolist()
+    ([[0.0], [1.0]], [[False], [True]], [2.0])
+    """
+    alive = [np.asarray(a, dtype=bool) for a in alive]
+    new_weights, new_keeps = [], []
+    for i, (W, K) in enumerate(zip(weights, keeps)):
+        K = np.asarray(K) != 0
+        block = np.ix_(alive[i], alive[i + 1])
+        new_weights.append(np.where(K, W, 0.)[block])
+        new_keeps.append(K[block])
+    new_biases = [np.asarray(b)[a] for b, a in zip(biases, alive)]
+    return new_weights, new_keeps, new_biases
+
+
+def compact(weights, keeps, biases, unit_ids=None):
+    """Remove all units that are no longer connected to each of their
+    neighbouring layers, until none is left (removing a unit may
+    disconnect others).
+
+    Parameters
+    ----------
+    weights, keeps, biases :
+        See `remove_units`.
+    unit_ids : None or iterable of (n_i,) array-like
+        Original IDs of the units of each layer (default: their positions).
+
+    Returns
+    -------
+    weights, keeps, biases : lists of np.ndarray
+        Reduced to the surviving units.
+    unit_ids : list of np.ndarray
+        Original IDs of the surviving units of each layer.
+
+    Examples
+    --------
+    >>> keeps = [np.array([[1, 0]]), np.array([[1, 0], [0, 1]]), np.array([[1], [1]])]
+    >>> weights = [np.ones(K.shape) for K in keeps]
+    >>> biases = [np.zeros(n) for n in (1, 2, 2, 1)]
+    >>> _, keeps, _, unit_ids = compact(weights, keeps, biases)
+    >>> [ids.tolist() for ids in unit_ids]
+    [[0], [0], [0], [0]]
+    """
+    if unit_ids is None:
+        unit_ids = [np.arange(len(b)) for b in biases]
+    unit_ids = [np.asarray(ids) for ids in unit_ids]
+    while True:
+        alive = surviving_units(keeps)
+        weights, keeps, biases = remove_units(weights, keeps, biases, alive)
+        unit_ids = [ids[a] for ids, a in zip(unit_ids, alive)]
+        if all(a.all() for a in alive):
+            return weights, keeps, biases, unit_ids
+
+
+def restrict_state(state, keeps, alive):
+    """Restrict the training state of a DBM to its surviving units and weights,
+    so that a pruned DBM can continue where its parent stopped.
+
+    Parameters
+    ----------
+    state : dict
+        As returned by `DBM.get_training_state`: persistent particles 'v'
+        and 'H', momentum buffers 'dvb', 'dW' and 'dhb', and running means
+        of hidden activations 'q_means' and 'mu_means'.
+    keeps : iterable of (n_i, n_{i+1}) array-like
+        Masks of active weights; momentum of pruned weights is dropped.
+    alive : iterable of (n_i,) bool array-like
+        Units to keep, e.g. `np.isin(old_ids, new_ids)` for the unit IDs
+        before and after `compact`.
+
+    Returns
+    -------
+    state : dict
+        Same keys, reduced to the surviving units.
+
+    Examples
+    --------
+    >>> state = dict(v=np.ones((3, 2)), H=[np.arange(6.).reshape(3, 2)],
+    ...              dvb=np.ones(2), dW=[np.ones((2, 2))], dhb=[np.array([1., 2.])],
+    ...              q_means=[np.array([.1, .2])], mu_means=[np.array([.3, .4])])
+    >>> new = restrict_state(state, [[[1, 0], [0, 0]]], [[True, True], [True, False]])
+    >>> new['H'][0].tolist(), new['dW'][0].tolist(), new['mu_means'][0].tolist()
+    ([[0.0], [2.0], [4.0]], [[1.0], [0.0]], [0.3])
+    """
+    alive = [np.asarray(a, dtype=bool) for a in alive]
+    dW, _, (dvb, *dhb) = remove_units(state['dW'], keeps, [state['dvb']] + list(state['dhb']), alive)
+    return dict(v=state['v'][:, alive[0]],
+                H=[h[:, a] for h, a in zip(state['H'], alive[1:])],
+                dvb=dvb, dW=dW, dhb=dhb,
+                q_means=[q[a] for q, a in zip(state['q_means'], alive[1:])],
+                mu_means=[m[a] for m, a in zip(state['mu_means'], alive[1:])])
+
+
+def choose_storage(keep, rf_mask=None, previous='dense', max_local_density=0.05, max_sparse_density=0.2):
+    """Choose how to store a (compacted) weight matrix of a DBM.
+
+    Parameters
+    ----------
+    keep : array-like
+        Mask of active weights.
+    rf_mask : None or array-like
+        Receptive field mask of the layer, like `keep`. Layers with
+        receptive fields (not all ones) are always stored locally.
+    previous : {'dense', 'sparse', 'local'}
+        Storage of the layer before pruning; pruning only makes layers
+        sparser, so the result is never denser than this.
+    max_local_density : float in [0, 1]
+        Largest fraction of active weights for which storing and updating
+        only the active weights (see `DBM.local_layers`) is expected to beat
+        dense matrices.
+    max_sparse_density : float in [0, 1]
+        Largest fraction of active weights for which multiplying by a
+        sparse matrix of the active weights (see `DBM.sparse_layers`) is
+        expected to beat a dense matrix product.
+
+    Returns
+    -------
+    storage : {'dense', 'sparse', 'local'}
+
+    Examples
+    --------
+    >>> choose_storage(np.eye(100)), choose_storage(np.eye(10)), choose_storage(np.ones((10, 10)))
+    ('local', 'sparse', 'dense')
+    >>> choose_storage(np.ones((10, 10)), rf_mask=np.eye(10)), choose_storage(np.ones((10, 10)), previous='sparse')
+    ('local', 'sparse')
+    """
+    storages = ('dense', 'sparse', 'local')
+    keep = np.asarray(keep) != 0
+    density = np.count_nonzero(keep) / max(1, keep.size)
+    if rf_mask is not None and not np.all(rf_mask):
+        storage = 'local'
+    elif density <= max_local_density:
+        storage = 'local'
+    elif density <= max_sparse_density:
+        storage = 'sparse'
+    else:
+        storage = 'dense'
+    return max(storage, previous, key=storages.index)
+
+
+def random_keep(mask, fraction, candidates=None):
+    """Randomly prune `fraction` of the active weights.
+
+    Parameters
+    ----------
+    mask : array-like
+        Mask of active weights.
+    fraction : float in [0, 1]
+        Fraction of active weights to prune.
+    candidates : None or array-like
+        Mask of weights eligible for pruning (default: all active ones).
+        At most all candidates are pruned.
+
+    Returns
+    -------
+    keep : bool np.ndarray
+
+    Examples
+    --------
+    >>> np.random.seed(1337)
+    >>> keep = random_keep(np.ones((4, 5)), 0.25)
+    >>> int(keep.sum())
+    15
+    """
+    mask = np.asarray(mask) != 0
+    if candidates is None:
+        candidates = mask
+    candidates = np.flatnonzero(mask & (np.asarray(candidates) != 0))
+    n_prune = min(int(fraction * np.count_nonzero(mask)), len(candidates))
+    keep = mask.copy()
+    keep.flat[np.random.choice(candidates, n_prune, replace=False)] = False
+    return keep
+
+
+def percentile_keep(scores, mask, fraction, prune_all_zeros=True):
+    """Prune the active weights whose score is within the lowest `fraction`.
+
+    If there are too many weights with a score of zero for a percentile
+    to be meaningful (more than `fraction` times the nonzero ones), either
+    all of them are pruned or a random `fraction` of the active weights
+    is selected among them.
+
+    Parameters
+    ----------
+    scores : array-like
+        Importance of each weight.
+    mask : array-like
+        Mask of active weights.
+    fraction : float in [0, 1]
+        Fraction of active weights to prune.
+    prune_all_zeros : bool
+        Whether to prune all weights with zero score if there are too many.
+
+    Returns
+    -------
+    keep : bool np.ndarray
+    threshold : float
+        Weights scoring at most `threshold` are pruned (0 if the zeros were).
+
+    Examples
+    --------
+    >>> scores = np.array([[0.1, 0.5], [0.3, 0.9]])
+    >>> keep, threshold = percentile_keep(scores, np.ones((2, 2)), 0.5)
+    >>> keep.tolist()
+    [[False, True], [False, True]]
+    >>> keep, threshold = percentile_keep([[0., 0.], [0.3, 0.9]], np.ones((2, 2)), 0.3)
+    >>> keep.tolist(), threshold
+    ([[False, False], [True, True]], 0.0)
+    """
+    scores = np.asarray(scores)
+    mask = np.asarray(mask) != 0
+    active = scores[mask]
+    n_zero = np.count_nonzero(active == 0)
+    if n_zero > fraction * (len(active) - n_zero):
+        if prune_all_zeros:
+            return mask & (scores > 0.), 0.
+        return random_keep(mask, fraction, candidates=(scores == 0.)), 0.
+    threshold = np.percentile(active, 100. * fraction)
+    return mask & (scores > threshold), threshold
+
+
+def _layer_of(indices, offsets):
+    return np.searchsorted(offsets, indices, side='right') - 1
+
+
+def global_keep(scores, masks, fraction, normalize=None, quotas=None):
+    """Prune the `fraction` of active weights of all layers with the lowest
+    scores, selected with a single partial sort (`np.argpartition`).
+
+    Parameters
+    ----------
+    scores : iterable of array-like
+        Importance of each weight, one array per layer.
+    masks : iterable of array-like
+        Masks of active weights.
+    fraction : float in [0, 1]
+        Fraction of all active weights to prune.
+    normalize : None, 'mean' or 'max'
+        Divide the scores of each layer by the mean or maximum of the
+        absolute scores of its active weights before ranking, so that
+        layers with a different scale compete on equal terms.
+    quotas : None or iterable of float in [0, 1]
+        Maximum fraction of the active weights of each layer that may be
+        pruned. The remaining budget goes to the other layers.
+
+    Returns
+    -------
+    keeps : list of bool np.ndarray
+    thresholds : list of float
+        Largest (unnormalized) pruned score of each layer, NaN if none.
+
+    Examples
+    --------
+    >>> scores = [np.array([[1., 5.], [2., 6.]]), np.array([[3., 4., 7., 8.]])]
+    >>> masks = [np.ones((2, 2)), np.ones((1, 4))]
+    >>> keeps, thresholds = global_keep(scores, masks, 0.5)
+    >>> [K.astype(int).tolist() for K in keeps], thresholds
+    ([[[0, 1], [0, 1]], [[0, 0, 1, 1]]], [2.0, 4.0])
+    >>> keeps, thresholds = global_keep(scores, masks, 0.5, quotas=(1., 0.25))
+    >>> [K.astype(int).tolist() for K in keeps], thresholds
+    ([[[0, 0], [0, 1]], [[0, 1, 1, 1]]], [5.0, 3.0])
+    """
+    if normalize not in (None, 'mean', 'max'):
+        raise ValueError("`normalize` must be None, 'mean' or 'max', got {0!r}".format(normalize))
+    masks = [np.asarray(M) != 0 for M in masks]
+    raw = [np.asarray(S, dtype=float)[M] for S, M in zip(scores, masks)]
+    values = []
+    for v in raw:
+        if normalize is not None and len(v):
+            scale = np.mean(np.abs(v)) if normalize == 'mean' else np.max(np.abs(v))
+            if scale > 0:
+                v = v / scale
+        values.append(v)
+
+    sizes = np.array([len(v) for v in values])
+    k = int(fraction * sizes.sum())
+    caps = sizes if quotas is None else np.minimum(sizes, (np.asarray(quotas) * sizes).astype(int))
+    if k > caps.sum():
+        raise ValueError('cannot prune {0} weights with quotas {1}'.format(k, quotas))
+
+    # layers whose quota is exhausted prune their own lowest `caps[i]` weights,
+    # the others compete for the rest; this needs at most one extra round per layer
+    pruned = [None] * len(values)
+    free = list(range(len(values)))
+    while True:
+        k_free = k - sum(caps[i] for i in range(len(values)) if i not in free)
+        offsets = np.cumsum([0] + [sizes[i] for i in free])
+        selected = np.argpartition(np.concatenate([values[i] for i in free]), k_free - 1)[:k_free] \
+                   if k_free > 0 else np.zeros(0, dtype=int)
+        layer = _layer_of(selected, offsets)
+        counts = np.bincount(layer, minlength=len(free))
+        over = [i for i, n in zip(free, counts) if n > caps[i]]
+        if not over:
+            for j, i in enumerate(free):
+                pruned[i] = selected[layer == j] - offsets[j]
+            break
+        for i in over:
+            pruned[i] = np.argpartition(values[i], caps[i] - 1)[:caps[i]] if caps[i] > 0 else np.zeros(0, dtype=int)
+            free.remove(i)
+
+    keeps, thresholds = [], []
+    for M, v, p in zip(masks, raw, pruned):
+        keep = M.copy()
+        keep.flat[np.flatnonzero(M)[p]] = False
+        keeps.append(keep)
+        thresholds.append(float(np.max(v[p])) if len(p) else np.nan)
+    return keeps, thresholds
+
+
+class FICriterion(object):
+    """Prune the weights with the lowest Fisher information (FI).
+
+    Criteria are called with the current weights `W`, the mask of active
+    weights, the FI estimates `fi` = (variance, heuristic), both dense,
+    and the states of the `lower` and `upper` units from which they were
+    estimated. They return the mask of weights to keep and the score
+    threshold used for pruning (NaN if not defined).
+
+    Parameters
+    ----------
+    fraction : float in [0, 1]
+        Fraction of active weights pruned per session.
+    use_var : bool
+        Whether to use the variance or the heuristic estimate.
+    times_w : bool
+        Whether to multiply the FI by the squared weights.
+    prune_all_zeros : bool
+        See `percentile_keep`.
+    block : bool
+        Whether to score weights by OBS-like saliencies from per-unit FI
+        blocks (see `block_fi_saliencies`) instead of the FI diagonal.
+        Saliencies already include the squared weights.
+    """
+    def __init__(self, fraction, use_var=True, times_w=False, prune_all_zeros=True, block=False):
+        self.fraction = fraction
+        self.use_var = use_var
+        self.times_w = times_w
+        self.prune_all_zeros = prune_all_zeros
+        self.block = block
+
+    @property
+    def needs_states(self):
+        """Whether the criterion needs the sampled unit states, not only FI estimates."""
+        return self.block
+
+    def scores(self, W, mask, fi, lower, upper):
+        if self.block:
+            return block_fi_saliencies(lower, upper, W, mask=mask)
+        scores = fi[0] if self.use_var else fi[1]
+        if self.times_w:
+            scores = scores * np.square(W)
+        return scores
+
+    def __call__(self, W, mask, fi, lower, upper):
+        return percentile_keep(self.scores(W, mask, fi, lower, upper), mask,
+                               self.fraction, prune_all_zeros=self.prune_all_zeros)
+
+
+class AntiFICriterion(FICriterion):
+    """Prune the weights with the *highest* FI (control experiment).
+
+    Examples
+    --------
+    >>> fi = np.array([[0.1, 0.5], [0.3, 0.9]])
+    >>> keep, threshold = AntiFICriterion(0.25)(None, np.ones((2, 2)), (fi, fi), None, None)
+    >>> keep.tolist()
+    [[True, True], [True, False]]
+    """
+    def __call__(self, W, mask, fi, lower, upper):
+        scores = self.scores(W, mask, fi, lower, upper)
+        mask = np.asarray(mask) != 0
+        threshold = np.percentile(scores[mask], 100. * (1. - self.fraction))
+        return mask & (scores <= threshold), threshold
+
+
+class RandomCriterion(object):
+    """Prune a random `fraction` of the active weights."""
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def __call__(self, W, mask, fi, lower, upper):
+        return random_keep(mask, self.fraction), np.nan
+
+
+class WeightMagnitudeCriterion(object):
+    """Prune the active weights with the smallest magnitude.
+
+    Weights of magnitude zero are pruned at random if there are too many
+    of them, see `percentile_keep`.
+    """
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def scores(self, W, mask, fi, lower, upper):
+        return np.abs(W)
+
+    def __call__(self, W, mask, fi, lower, upper):
+        return percentile_keep(self.scores(W, mask, fi, lower, upper), mask,
+                               self.fraction, prune_all_zeros=False)
+
+
+class EigenvectorCriterion(object):
+    """Prune the weights with the smallest entries in the leading
+    eigenvectors of the Fisher information matrix (FIM).
+
+    The FIM of each weight matrix and the biases of its two layers is
+    estimated from the sampled states of the `lower` and `upper` units,
+    as for an RBM (see `fim_eigenvectors`), i.e. ignoring the other layers
+    of a DBM. A weight scores sum_k lambda_k u_k^2 over the `k` leading
+    eigenpairs (lambda_k, u_k), so for k = 1 weights are ranked by the
+    magnitude of their entry in the first eigenvector.
+
+    Parameters
+    ----------
+    fraction : float in [0, 1]
+        Fraction of active weights pruned per session.
+    k : positive int
+        Number of eigenvectors.
+    prune_all_zeros : bool
+        See `percentile_keep`.
+
+    Examples
+    --------
+    >>> rng = np.random.RandomState(1337)
+    >>> lower = (rng.rand(500, 2) < [0.2, 0.7]).astype(float)
+    >>> upper = (rng.rand(500, 3) < 0.5).astype(float)
+    >>> mask = np.array([[1, 1, 1], [1, 1, 0]])
+    >>> keep, threshold = EigenvectorCriterion(0.4)(None, mask, None, lower, upper)
+    >>> int(keep.sum()), bool(keep[1, 2])
+    (3, False)
+    """
+    needs_states = True
+
+    def __init__(self, fraction, k=1, prune_all_zeros=True):
+        self.fraction = fraction
+        self.k = k
+        self.prune_all_zeros = prune_all_zeros
+
+    def scores(self, W, mask, fi, lower, upper):
+        eigvals, (_, _, U) = fim_eigenvectors(np.hstack((lower, upper)), np.shape(lower)[1],
+                                              k=self.k, mask=mask)
+        return np.square(U).dot(np.maximum(eigvals, 0.))
+
+    def __call__(self, W, mask, fi, lower, upper):
+        return percentile_keep(self.scores(W, mask, fi, lower, upper), mask,
+                               self.fraction, prune_all_zeros=self.prune_all_zeros)
+
+
+class GlobalCriterion(object):
+    """Rank the active weights of all layers together by the scores of a
+    per-layer criterion and prune the lowest `fraction` of them, see
+    `global_keep`.
+
+    Called with lists of weights, masks, FI estimates and unit states of all
+    layers (`cross_layer` = True), returns lists of masks and thresholds.
+
+    Parameters
+    ----------
+    criterion : object
+        Criterion with a `scores(W, mask, fi, lower, upper)` method,
+        e.g. `FICriterion` or `WeightMagnitudeCriterion`.
+    fraction : None or float in [0, 1]
+        Fraction of all active weights pruned per session
+        (default: `criterion.fraction`).
+    normalize, quotas :
+        See `global_keep`.
+    """
+    cross_layer = True
+
+    def __init__(self, criterion, fraction=None, normalize=None, quotas=None):
+        self.criterion = criterion
+        self.fraction = criterion.fraction if fraction is None else fraction
+        self.normalize = normalize
+        self.quotas = quotas
+
+    @property
+    def needs_states(self):
+        return getattr(self.criterion, 'needs_states', False)
+
+    def __call__(self, weights, masks, fi, layers):
+        scores = [self.criterion.scores(weights[i], masks[i], fi[i], layers[i], layers[i + 1])
+                  for i in range(len(masks))]
+        return global_keep(scores, masks, self.fraction, normalize=self.normalize, quotas=self.quotas)
+
+
+def unit_scores(scores, masks, aggregate='sum'):
+    """Aggregate weight scores per hidden unit over the active weights
+    connecting it to both of its neighbouring layers.
+
+    Parameters
+    ----------
+    scores : iterable of (n_i, n_{i+1}) array-like
+        Importance of each weight, from the visible layer upwards.
+    masks : iterable of (n_i, n_{i+1}) array-like
+        Masks of active weights.
+    aggregate : 'sum' or 'mean'
+        Total score of a unit or its mean over its active weights.
+
+    Returns
+    -------
+    unit_scores : list of (n_i,) np.ndarray
+        One entry per hidden layer. Units without active weights score 0.
+
+    Examples
+    --------
+    >>> scores = [np.array([[1., 2.], [3., 4.]]), np.array([[1.], [1.]])]
+    >>> masks = [np.array([[1, 1], [0, 1]]), np.ones((2, 1))]
+    >>> [u.tolist() for u in unit_scores(scores, masks)]
+    [[2.0, 7.0], [2.0]]
+    >>> [u.tolist() for u in unit_scores(scores, masks, aggregate='mean')]
+    [[1.0, 2.3333333333333335], [1.0]]
+    """
+    if aggregate not in ('sum', 'mean'):
+        raise ValueError("`aggregate` must be 'sum' or 'mean', got {0!r}".format(aggregate))
+    masks = [np.asarray(M) != 0 for M in masks]
+    scores = [np.where(M, S, 0.) for S, M in zip(scores, masks)]
+    totals, degrees = [], []
+    for i in range(len(masks)):
+        total, degree = scores[i].sum(axis=0), masks[i].sum(axis=0)
+        if i + 1 < len(masks):
+            total = total + scores[i + 1].sum(axis=1)
+            degree = degree + masks[i + 1].sum(axis=1)
+        totals.append(total)
+        degrees.append(degree)
+    if aggregate == 'sum':
+        return totals
+    return [t / np.maximum(d, 1) for t, d in zip(totals, degrees)]
+
+
+class UnitCriterion(object):
+    """Prune whole hidden units instead of single weights.
+
+    The weight scores of a per-layer criterion are aggregated per hidden
+    unit over both adjacent layers (see `unit_scores`), and the `fraction`
+    of connected units with the lowest score is removed from each hidden
+    layer together with all their weights. The pruned DBM then has fewer
+    hidden units rather than sparser weight matrices, which speeds up
+    sampling, mean-field updates and training.
+
+    Parameters
+    ----------
+    criterion : object
+        Criterion with a `scores(W, mask, fi, lower, upper)` method,
+        e.g. `FICriterion` or `WeightMagnitudeCriterion`.
+    fraction : None or float in [0, 1]
+        Fraction of (connected) hidden units pruned from each layer per
+        session (default: `criterion.fraction`).
+    aggregate : 'sum' or 'mean'
+        See `unit_scores`.
+
+    Examples
+    --------
+    >>> crit = UnitCriterion(WeightMagnitudeCriterion(0.5))
+    >>> weights = [np.array([[1., 2.], [3., 4.]]), np.array([[1.], [1.]])]
+    >>> keeps, thresholds = crit(weights, [np.ones((2, 2)), np.ones((2, 1))], [None] * 2, [None] * 3)
+    >>> [K.astype(int).tolist() for K in keeps], thresholds
+    ([[[0, 1], [0, 1]], [[0], [1]]], [5.0, nan])
+    """
+    cross_layer = True
+
+    def __init__(self, criterion, fraction=None, aggregate='sum'):
+        self.criterion = criterion
+        self.fraction = criterion.fraction if fraction is None else fraction
+        self.aggregate = aggregate
+
+    @property
+    def needs_states(self):
+        return getattr(self.criterion, 'needs_states', False)
+
+    def __call__(self, weights, masks, fi, layers):
+        n = len(masks)
+        masks = [np.asarray(M) != 0 for M in masks]
+        scores = [self.criterion.scores(weights[i], masks[i], fi[i], layers[i], layers[i + 1])
+                  for i in range(n)]
+        keeps = [M.copy() for M in masks]
+        thresholds = []
+        for i, u in enumerate(unit_scores(scores, masks, aggregate=self.aggregate)):
+            connected = np.flatnonzero(masks[i].any(axis=0))
+            k = int(self.fraction * len(connected))
+            if k == 0:
+                thresholds.append(np.nan)
+                continue
+            pruned = connected[np.argpartition(u[connected], k - 1)[:k]]
+            keeps[i][:, pruned] = False
+            if i + 1 < n:
+                keeps[i + 1][pruned, :] = False
+            thresholds.append(float(np.max(u[pruned])))
+        return keeps, thresholds
+
+
+class PruningSchedule(object):
+    """Prune weights gradually while a model is trained.
+
+    Every `every` training iterations after `start`, `n_steps` times in
+    total, a pruning criterion is applied to the current weights and to FI
+    estimates streamed from the persistent particles (see `DBM.fit`). The
+    fraction pruned at each step follows the cubic schedule of [1]: large
+    steps early, while the model can still adapt, and small ones at the end,
+    so that a `target` fraction of the initially active weights is removed
+    after the last step.
+
+    Parameters
+    ----------
+    criterion : object
+        Per-layer or cross-layer criterion with a `fraction` attribute,
+        which is replaced by the fraction of each step. Criteria that need
+        the states of the units (`FICriterion` with `block`) are not supported.
+    target : float in [0, 1)
+        Fraction of the initially active weights pruned after all steps.
+    every : positive int
+        Number of training iterations between two steps.
+    n_steps : positive int
+        Number of pruning steps.
+    start : non-negative int
+        Iteration after which the first interval begins.
+
+    References
+    ----------
+    [1] M. Zhu and S. Gupta. To prune, or not to prune: exploring the
+        efficacy of pruning for model compression. arXiv preprint
+        arXiv:1710.01878. 2017.
+
+    Examples
+    --------
+    >>> schedule = PruningSchedule(WeightMagnitudeCriterion(None), 0.5, every=100, n_steps=3)
+    >>> [schedule.step(it) for it in (50, 100, 150, 300, 400)]
+    [None, 1, None, 3, None]
+    >>> remaining = np.prod([1. - schedule.fraction(k) for k in (1, 2, 3)])
+    >>> round(float(remaining), 6)
+    0.5
+    >>> W = np.array([[0.1, -2., 0.3], [4., -0.5, 0.6]])
+    >>> keeps = schedule(100, [W], [np.ones(W.shape)], [None])
+    >>> keeps[0].astype(int).tolist()
+    [[0, 1, 0], [1, 1, 1]]
+    """
+    def __init__(self, criterion, target, every=1000, n_steps=10, start=0):
+        self.criterion = criterion
+        self.target = target
+        self.every = every
+        self.n_steps = n_steps
+        self.start = start
+
+    def step(self, iter_):
+        """Number of the pruning step due at iteration `iter_` (None if none)."""
+        if iter_ <= self.start or (iter_ - self.start) % self.every:
+            return None
+        k = (iter_ - self.start) // self.every
+        return k if k <= self.n_steps else None
+
+    def sparsity(self, k):
+        """Fraction of the initially active weights pruned after `k` steps."""
+        return self.target * (1. - (1. - float(k) / self.n_steps) ** 3)
+
+    def fraction(self, k):
+        """Fraction of the remaining weights pruned at step `k`."""
+        return (self.sparsity(k) - self.sparsity(k - 1)) / (1. - self.sparsity(k - 1))
+
+    def __call__(self, iter_, weights, masks, fi):
+        """Masks of the weights to keep after iteration `iter_`,
+        or None if no pruning step is due."""
+        k = self.step(iter_)
+        if k is None:
+            return None
+        criterion = copy(self.criterion)
+        criterion.fraction = self.fraction(k)
+        if getattr(criterion, 'cross_layer', False):
+            keeps, _ = criterion(weights, masks, fi, [None] * (len(weights) + 1))
+        else:
+            keeps = [criterion(W, M, f, None, None)[0] for W, M, f in zip(weights, masks, fi)]
+        return keeps
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from .testing import run_tests
+    run_tests(__file__)
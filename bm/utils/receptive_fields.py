@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# masks built so far in this process, by `receptive_field_mask` arguments
+_cache = {}
+
+
+def _window_membership(size, filter_size, stride, padding):
+    """(size, n_windows) bool array, whether pixel i lies in window j along one axis."""
+    if padding == 'same':
+        # windows centered on every `stride`-th pixel, clipped at the borders
+        starts = np.arange(0, size, stride) - filter_size // 2
+    elif padding == 'valid':
+        # windows lying completely inside the image
+        starts = np.arange(0, size - filter_size + 1, stride)
+    else:
+        raise ValueError("`padding` must be 'same' or 'valid', got {0!r}".format(padding))
+    pixels = np.arange(size)[:, None]
+    return (pixels >= starts) & (pixels < starts + filter_size)
+
+
+def receptive_field_mask(v_shape, filter_shape, stride=1, padding='same', double_rf=False):
+    """Weight mask connecting each hidden unit to a local window of the
+    visible image only (its receptive field).
+
+    Masks are cached per process, since the same receptive fields are used
+    by every RBM of a model and of all its pruned versions.
+
+    Parameters
+    ----------
+    v_shape : (H, W, ...) positive int tuple
+        Shape of the visible image; the visible units are its pixels in C-order.
+    filter_shape : (h, w) positive int tuple
+        Shape of the receptive fields.
+    stride : positive int
+        Distance between the windows of neighbouring hidden units.
+    padding : 'same' or 'valid'
+        With 'same', the windows are centered on every `stride`-th pixel and
+        clipped at the image borders (with `stride` = 1 there is one hidden
+        unit per pixel). With 'valid', they lie completely inside the image.
+    double_rf : bool
+        Whether each receptive field is used by two consecutive hidden units.
+
+    Returns
+    -------
+    mask : (H * W, n_windows) bool np.ndarray
+        Read-only; the hidden units are ordered like the window positions,
+        in C-order (times two, if `double_rf`).
+
+    Examples
+    --------
+    >>> mask = receptive_field_mask((3, 3), (3, 3))
+    >>> mask.shape
+    (9, 9)
+    >>> mask[:, 0].reshape((3, 3)).astype(int).tolist()
+    [[1, 1, 0], [1, 1, 0], [0, 0, 0]]
+    >>> receptive_field_mask((4, 4), (2, 2), stride=2, padding='valid')[:, 1].reshape((4, 4)).astype(int).tolist()
+    [[0, 0, 1, 1], [0, 0, 1, 1], [0, 0, 0, 0], [0, 0, 0, 0]]
+    >>> receptive_field_mask((3, 3), (3, 3), double_rf=True).shape
+    (9, 18)
+    """
+    key = (tuple(v_shape[:2]), tuple(filter_shape), stride, padding, bool(double_rf))
+    if key not in _cache:
+        rows = _window_membership(v_shape[0], filter_shape[0], stride, padding)
+        cols = _window_membership(v_shape[1], filter_shape[1], stride, padding)
+        # pixel (r, c) lies in window (i, j) iff r lies in i and c in j
+        mask = (rows[:, None, :, None] & cols[None, :, None, :]).reshape(rows.shape[0] * cols.shape[0], -1)
+        if double_rf:
+            mask = np.repeat(mask, 2, axis=1)
+        mask.flags.writeable = False
+        _cache[key] = mask
+    return _cache[key]
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from .testing import run_tests
+    run_tests(__file__)
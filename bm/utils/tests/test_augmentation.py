@@ -0,0 +1,27 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from bm.utils.rng import RNG
+from bm.utils.augmentation import shift, horizontal_mirror, BatchAugmenter
+
+
+class TestBatchAugmenter(object):
+    def test_matches_single_image_helpers(self):
+        X = RNG(seed=1).rand(50, 5 * 7)
+        A = BatchAugmenter((5, 7), max_shift=2, mirror_prob=0.5, random_seed=1337)(X)
+        # same draws as the augmenter
+        rng = RNG(seed=1337)
+        dy, dx = rng.randint(-2, 3, size=(2, 50, 1))
+        mirror = rng.rand(50, 1) < 0.5
+        for n in range(len(X)):
+            y = shift(X[n].reshape((5, 7)), offset=(dy[n, 0], dx[n, 0]))
+            if mirror[n, 0]:
+                y = horizontal_mirror(y)
+            assert_allclose(A[n], y.ravel())
+
+    def test_reproducible(self):
+        X = RNG(seed=2).rand(20, 16) < 0.5
+        augment = lambda: BatchAugmenter((4, 4), max_shift=1, mirror_prob=0.5, flip_prob=0.1, random_seed=7)(X)
+        A = augment()
+        assert A.dtype == bool
+        assert (A == augment()).all()
@@ -0,0 +1,28 @@
+import itertools
+import threading
+import numpy as np
+
+from bm.utils.dataset import prefetch
+
+
+class TestPrefetch(object):
+    def test_threads_stop_when_left_early(self):
+        n_threads = threading.active_count()
+        for _ in range(5):
+            batches = prefetch((np.zeros(10) for _ in itertools.count()), 2)
+            next(batches)
+            batches.close()
+        for _ in range(5):
+            for x in prefetch(iter(range(100)), 3):
+                if x == 3:
+                    break
+        assert threading.active_count() == n_threads
+
+    def test_items_and_errors(self):
+        assert list(prefetch(iter(range(5)), 2)) == list(range(5))
+        try:
+            list(prefetch((1 // x for x in (1, 0)), 2))
+        except ZeroDivisionError:
+            pass
+        else:
+            assert False, 'the error of the producer must be raised'
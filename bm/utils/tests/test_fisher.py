@@ -0,0 +1,64 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy.special import expit
+
+from bm.utils.fisher import (fi_estimates, rao_blackwellize,
+                             exact_fi, exact_fim, fim_operator)
+
+
+def gibbs_samples(W, vb, hb, n_samples, rng, n_steps=50):
+    """Independent Gibbs chains of a small Bernoulli RBM."""
+    v = (rng.rand(n_samples, len(vb)) < 0.5).astype(float)
+    for _ in range(n_steps):
+        h = (rng.rand(n_samples, len(hb)) < expit(v.dot(W) + hb)).astype(float)
+        v = (rng.rand(n_samples, len(vb)) < expit(h.dot(W.T) + vb)).astype(float)
+    h = (rng.rand(n_samples, len(hb)) < expit(v.dot(W) + hb)).astype(float)
+    return np.hstack((v, h))
+
+
+class TestFisher(object):
+    def __init__(self):
+        self.n_visible = 6
+        self.n_hidden = 4
+        rng = np.random.RandomState(1337)
+        self.W = rng.randn(self.n_visible, self.n_hidden)
+        self.vb = 0.5 * rng.randn(self.n_visible)
+        self.hb = 0.5 * rng.randn(self.n_hidden)
+
+    def estimate(self, samples, rao_blackwell):
+        layer_sizes = (self.n_visible, self.n_hidden)
+        if rao_blackwell:
+            samples = rao_blackwellize(samples, layer_sizes, [self.W], [self.vb, self.hb])
+        (var_est, heu_est), = fi_estimates(samples, layer_sizes)
+        return var_est
+
+    def test_sampled_estimates_converge_to_exact(self):
+        samples = gibbs_samples(self.W, self.vb, self.hb, 50000, np.random.RandomState(42))
+        (var_exact, heu_exact), = exact_fi(self.W, self.vb, self.hb).estimates()
+        (var_est, heu_est), = fi_estimates(samples, (self.n_visible, self.n_hidden))
+        assert_allclose(var_est, var_exact, atol=0.01)
+        assert_allclose(heu_est, heu_exact, atol=0.01)
+
+        F_exact = exact_fim(self.W, self.vb, self.hb)
+        F = fim_operator(samples, self.n_visible).matmat(np.eye(len(F_exact)))
+        assert_allclose(F, F_exact, atol=0.015)
+
+    def test_rao_blackwell_variance_reduction(self):
+        rng = np.random.RandomState(42)
+        plain, rb = [], []
+        for _ in range(50):
+            samples = gibbs_samples(self.W, self.vb, self.hb, 500, rng)
+            plain.append(self.estimate(samples, rao_blackwell=False))
+            rb.append(self.estimate(samples, rao_blackwell=True))
+        plain, rb = np.asarray(plain), np.asarray(rb)
+
+        # same expectation ...
+        assert_allclose(rb.mean(axis=0), plain.mean(axis=0), atol=0.02)
+        # ... but clearly lower variance (about half for this RBM)
+        assert rb.var(axis=0).sum() < 0.7 * plain.var(axis=0).sum()
+
+
+if __name__ == '__main__':
+    # run corresponding tests
+    from bm.utils.testing import run_tests
+    run_tests(__file__)
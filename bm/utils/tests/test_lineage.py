@@ -0,0 +1,50 @@
+import shutil
+import tempfile
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from bm.utils.lineage import MaskLineage
+
+
+class TestMaskLineage(object):
+    def setup_method(self, method):
+        self.path = tempfile.mkdtemp()
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.path)
+
+    def test_random_access_across_keyframes(self):
+        rng = np.random.RandomState(1337)
+        sizes = [20, 15, 10]
+        full = [rng.rand(sizes[0], sizes[1]) < 0.5, rng.rand(sizes[1], sizes[2]) < 0.5]
+        unit_ids = [np.arange(n) for n in sizes]
+        lineage = MaskLineage(self.path, keyframe_every=3)
+        history = []
+        for k in range(8):
+            if k:
+                full = [F & (rng.rand(*F.shape) < 0.8) for F in full]
+                unit_ids = [ids if i == 0 else ids[rng.rand(len(ids)) < 0.9] for i, ids in enumerate(unit_ids)]
+            masks = [F[np.ix_(unit_ids[i], unit_ids[i + 1])] for i, F in enumerate(full)]
+            lineage.append(masks, unit_ids)
+            history.append((masks, unit_ids))
+
+        # a new instance reads the lineage from disk
+        lineage = MaskLineage(self.path, keyframe_every=3)
+        assert len(lineage) == 8
+        for k in (7, 0, 4, 3, -1):
+            masks, unit_ids = history[k]
+            for M, N in zip(lineage.masks(k), masks):
+                assert_array_equal(M, N)
+            for ids, jds in zip(lineage.unit_ids(k), unit_ids):
+                assert_array_equal(ids, jds)
+
+    def test_truncate_and_continue(self):
+        lineage = MaskLineage(self.path)
+        for k in range(3):
+            lineage.append([np.eye(4) * (k + 1 < np.arange(4))], [np.arange(4), np.arange(4)])
+        lineage.truncate(2)
+        lineage = MaskLineage(self.path)
+        assert len(lineage) == 2
+        lineage.append([np.ones((4, 4))], [np.arange(4), np.arange(4)])
+        assert_array_equal(lineage.masks(2)[0], True)
+        assert_array_equal(lineage.masks(1)[0], np.diag([0, 0, 0, 1]))
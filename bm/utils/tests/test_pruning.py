@@ -0,0 +1,94 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from bm.utils.pruning import (surviving_units, remove_units, compact, restrict_state,
+                              global_keep, UnitCriterion, WeightMagnitudeCriterion,
+                              PruningSchedule)
+
+
+class TestPruning(object):
+    def test_surviving_units_match_per_unit_loops(self):
+        rng = np.random.RandomState(1337)
+        keep1 = rng.rand(40, 30) < 0.05
+        keep2 = rng.rand(30, 20) < 0.05
+        alive = surviving_units([keep1, keep2])
+
+        left_intermediates = [i for i in range(30) if sum(keep1[:, i] != 0) and sum(keep2[i] != 0)]
+        left_hiddens = [i for i in range(20) if sum(keep2[:, i] != 0)]
+        assert_array_equal(np.flatnonzero(alive[0]), np.arange(40))
+        assert_array_equal(np.flatnonzero(alive[1]), left_intermediates)
+        assert_array_equal(np.flatnonzero(alive[2]), left_hiddens)
+
+        W1, W2 = rng.randn(40, 30), rng.randn(30, 20)
+        biases = [rng.randn(40), rng.randn(30), rng.randn(20)]
+        (V1, V2), (K1, K2), (vb, hb1, hb2) = remove_units([W1, W2], [keep1, keep2], biases, alive)
+        assert_array_equal(V2, (W2 * keep2)[left_intermediates][:, left_hiddens])
+        assert_array_equal(K1, keep1[:, left_intermediates])
+        assert_array_equal(hb1, biases[1][left_intermediates])
+        assert V1.shape == (40, len(left_intermediates))
+
+    def test_global_keep_matches_sorting(self):
+        rng = np.random.RandomState(1337)
+        scores = [rng.rand(40, 30), 10. * rng.rand(30, 20)]
+        masks = [rng.rand(40, 30) < 0.5, rng.rand(30, 20) < 0.5]
+        sizes = [M.sum() for M in masks]
+        k = int(0.2 * sum(sizes))
+
+        # all layers together: the k lowest scores overall
+        keeps, _ = global_keep(scores, masks, 0.2)
+        threshold = np.sort(np.concatenate([S[M] for S, M in zip(scores, masks)]))[k - 1]
+        for S, M, K in zip(scores, masks, keeps):
+            assert_array_equal(K, M & (S > threshold))
+
+        # quota on layer 1: its lowest 5%, the rest from layer 2
+        keeps, _ = global_keep(scores, masks, 0.2, quotas=(0.05, 1.))
+        n1 = int(0.05 * sizes[0])
+        assert_array_equal(keeps[0], masks[0] & (scores[0] > np.sort(scores[0][masks[0]])[n1 - 1]))
+        assert_array_equal(keeps[1], masks[1] & (scores[1] > np.sort(scores[1][masks[1]])[k - n1 - 1]))
+
+    def test_unit_criterion_shrinks_hidden_layers(self):
+        rng = np.random.RandomState(1337)
+        weights = [rng.randn(40, 30), rng.randn(30, 20)]
+        masks = [np.ones((40, 30)), np.ones((30, 20))]
+        keeps, _ = UnitCriterion(WeightMagnitudeCriterion(0.1))(weights, masks, [None] * 2, [None] * 3)
+        alive = surviving_units(keeps)
+        (W1, W2), _, _ = remove_units(weights, keeps, [np.zeros(40), np.zeros(30), np.zeros(20)], alive)
+        assert W1.shape == (40, 27)
+        assert W2.shape == (27, 18)
+
+        # the removed intermediate units have the lowest summed |w| over both layers
+        totals = np.abs(weights[0]).sum(axis=0) + np.abs(weights[1]).sum(axis=1)
+        assert_array_equal(np.flatnonzero(~alive[1]), np.sort(np.argsort(totals)[:3]))
+
+    def test_restrict_state_follows_compact(self):
+        rng = np.random.RandomState(1337)
+        keeps = [rng.rand(40, 30) < 0.1, rng.rand(30, 20) < 0.1]
+        weights = [rng.randn(40, 30), rng.randn(30, 20)]
+        biases = [rng.randn(40), rng.randn(30), rng.randn(20)]
+        W, K, b, unit_ids = compact(weights, keeps, biases)
+        alive = [np.isin(np.arange(n), ids) for n, ids in zip((40, 30, 20), unit_ids)]
+
+        state = dict(v=rng.rand(5, 40), H=[rng.rand(5, 30), rng.rand(5, 20)],
+                     dvb=biases[0], dW=weights, dhb=biases[1:],
+                     q_means=[rng.rand(30), rng.rand(20)], mu_means=[rng.rand(30), rng.rand(20)])
+        new = restrict_state(state, keeps, alive)
+        for i in range(2):
+            assert_array_equal(new['dW'][i], W[i])
+            assert_array_equal(new['dhb'][i], b[i + 1])
+            assert new['H'][i].shape == (5, len(unit_ids[i + 1]))
+            assert_array_equal(new['q_means'][i], state['q_means'][i][unit_ids[i + 1]])
+        assert_array_equal(new['v'], state['v'])
+
+    def test_pruning_schedule_reaches_target(self):
+        rng = np.random.RandomState(1337)
+        weights = [rng.randn(40, 30), rng.randn(30, 20)]
+        masks = [np.ones((40, 30), dtype=bool), np.ones((30, 20), dtype=bool)]
+        schedule = PruningSchedule(WeightMagnitudeCriterion(None), 0.8, every=10, n_steps=5, start=100)
+        for it in range(1, 200):
+            keeps = schedule(it, weights, masks, [None] * 2)
+            if keeps is not None:
+                masks = keeps
+        for W, M in zip(weights, masks):
+            assert abs(M.mean() - 0.2) < 0.01
+            # the largest weights survive
+            assert np.abs(W[M]).min() >= np.abs(W[~M]).max()
@@ -0,0 +1,39 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from bm.utils.receptive_fields import receptive_field_mask
+
+
+def rf_mask_loops(v_shape, filter_shape, double_rf=False):
+    # per-unit loops as previously used in `BaseRBM.__init__`
+    fx, fy = filter_shape
+    augmented_image = np.zeros((v_shape[0] + 2 * (fx // 2), v_shape[1] + 2 * (fy // 2)))
+    augmented_image[fx // 2:v_shape[0] + fx // 2, fy // 2:v_shape[1] + fy // 2] = 1
+    h_masks = []
+    for idx in range(fx // 2, v_shape[0] + fx // 2):
+        for idy in range(fy // 2, v_shape[1] + fy // 2):
+            len_x, len_y = fx // 2 + fx % 2, fy // 2 + fy % 2
+            h_mask = np.zeros(augmented_image.shape, dtype=bool)
+            h_mask[idx - fx // 2:idx + len_x, idy - fy // 2:idy + len_y] = \
+                augmented_image[idx - fx // 2:idx + len_x, idy - fy // 2:idy + len_y]
+            h_mask = h_mask[fx // 2:fx // 2 + v_shape[0], fy // 2:fy // 2 + v_shape[1]]
+            h_masks.append(h_mask.flatten())
+            if double_rf:
+                h_masks.append(h_mask.flatten())
+    return np.array(h_masks).T
+
+
+class TestReceptiveFieldMask(object):
+    def test_matches_per_unit_loops(self):
+        for v_shape, filter_shape, double_rf in (((20, 20), (5, 5), False), ((7, 9), (4, 3), True),
+                                                 ((6, 6), (2, 2), False)):
+            assert_array_equal(receptive_field_mask(v_shape, filter_shape, double_rf=double_rf),
+                               rf_mask_loops(v_shape, filter_shape, double_rf=double_rf))
+
+    def test_stride_and_padding(self):
+        mask = receptive_field_mask((32, 32), (8, 8), stride=4, padding='valid')
+        assert mask.shape == (32 * 32, 7 * 7)
+        assert_array_equal(mask.sum(axis=0), 64)
+        mask = receptive_field_mask((32, 32), (5, 5), stride=2)
+        assert mask.shape == (32 * 32, 16 * 16)
+        assert receptive_field_mask((32, 32), (5, 5), stride=2) is mask
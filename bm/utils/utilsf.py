@@ -10,10 +10,14 @@ progress_bar = tqdm_notebook if _is_in_ipython() else tqdm
 def write_during_training(s):
     tqdm.write(s)
 
-def batch_iter(X, batch_size=10, verbose=False, desc='epoch'):
+def batch_iter(X, batch_size=10, verbose=False, desc='epoch', keep_order=False):
     """Divide input data into batches, with optional
     progress bar.
 
+    `X` may also be a dataset streamed from disk (see
+    `bm.utils.dataset.BinaryDataset`), which is shuffled if it was created
+    so, unless `keep_order` (needed when results are stored per sample).
+
     Examples
     --------
     >>> X = np.arange(36).reshape((12, 3))
@@ -32,6 +36,13 @@ def batch_iter(X, batch_size=10, verbose=False, desc='epoch'):
     [[30 31 32]
      [33 34 35]]
     """
+    if hasattr(X, 'iter_batches'):
+        gen = X.iter_batches(batch_size, keep_order=keep_order)
+        if verbose: gen = progress_bar(gen, total=(len(X) + batch_size - 1) // batch_size,
+                                       leave=False, ncols=64, desc=desc)
+        for X_b in gen:
+            yield X_b
+        return
     X = np.asarray(X)
     N = len(X)
     n_batches = N / batch_size + (N % batch_size > 0)
@@ -12,6 +12,7 @@ from bm.utils.dataset import *
 from bm.init_BMs import * # helper functions to initialize, fit and load RBMs and 2 layer DBM
 from rbm_utils.stutils import *
 from rbm_utils.fimdiag import * # functions to compute the diagonal of the FIM for RBMs
+from bm.utils.fisher import fim_eigenvectors, exact_fi, exact_fim_eigenvectors
 from copy import deepcopy
 import argparse
 
@@ -47,7 +48,7 @@ def save_res(results_path, params=None, indices_hiddens=None, samples=None, mask
     if samples is not None:
         np.save(results_path+'samples.npy', np.array(samples).astype(np.bool))
 
-def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
+def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3, exact=False, save_samples=None):
 
     # check that we have access to a GPU 
     if tf.test.gpu_device_name():
@@ -83,6 +84,28 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
 
     nv = X_train.shape[1] # visible layer size = pixels in radius of CIFAR circles
     nh = n_hidden # number of hidden units
+
+    def estimate_fi(s, n_hidden, w, params):
+        '''
+        variance and heuristic FI estimates of the weights in the flat layout of FI_weights_var_heur_estimates,
+        computed exactly from params by enumerating all visible states if exact, otherwise from samples s.
+        '''
+        if exact:
+            (var_est, heu_est), = exact_fi(params['W'], params['vb'], params['hb']).estimates()
+            return var_est.T.ravel(), heu_est.T.ravel()
+        return FI_weights_var_heur_estimates(s, nv, n_hidden, w)
+
+    if save_samples is None:
+        save_samples = not exact
+
+    def sample(model):
+        '''
+        samples from the model, for FI estimates and to save them with the results (e.g. to evaluate their quality).
+        None if neither needs them, i.e. if FI is exact and samples are not saved.
+        '''
+        if exact and not save_samples:
+            return None
+        return model.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
     session = 0 # before pruning
     n_sessions = n_pruning_session # number of pruning sessions
 
@@ -91,7 +114,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
     if not os.path.exists(top_folder):
         os.makedirs(top_folder)
     
-    model_path = os.path.join(top_folder, pruning_criterion+'{}v'.format(nv)+'{}h'.format(nh))
+    model_path = os.path.join(top_folder, pruning_criterion+('_exact' if exact else '')+'{}v'.format(nv)+'{}h'.format(nh))
     assert not os.path.exists(model_path), "model path already exists - abort"
     os.mkdir(model_path)
 
@@ -138,9 +161,9 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
         w_before = rbm.get_tf_params(scope='weights')
         m = rbm.get_tf_params(scope='masks')
         p_mask = m['prune_mask']
-        s = rbm.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
+        s = sample(rbm)
 
-        var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w_before['W'])
+        var_est, heu_est = estimate_fi(s, nh, w_before['W'], w_before)
 
         cur_res_path = os.path.join(results_path, 'session{}_untrained_'.format(session))
         save_res(cur_res_path, params=w_before, samples=s, mask=p_mask ,fi=var_est)
@@ -151,9 +174,9 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
         w_after = rbm.get_tf_params(scope='weights')
         config = tf.ConfigProto(device_count = {'GPU': 1})
         rbm._tf_session_config = config
-        s = rbm.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
+        s = sample(rbm)
 
-        var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w_after['W'])
+        var_est, heu_est = estimate_fi(s, nh, w_after['W'], w_after)
 
         cur_res_path = os.path.join(results_path, 'session{}_trained_'.format(session))
         save_res(cur_res_path, params=w_after, samples=s, fi=var_est)
@@ -210,12 +233,12 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
     w_after = deepcopy(w_from_model)
     config = tf.ConfigProto(device_count = {'GPU': 1})
     rbm._tf_session_config = config
-    s = rbm.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
+    s = sample(rbm)
     m = rbm.get_tf_params(scope='masks')
     p_mask = m['prune_mask']
     cur_res_path = os.path.join(results_path, 'session{}_trained_'.format(session))
 
-    var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w_after['W'])
+    var_est, heu_est = estimate_fi(s, nh, w_after['W'], w_after)
 
     save_res(cur_res_path, params=w_after, samples=s, fi=var_est)
 
@@ -238,7 +261,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             print('Weight pruning according to diagonal values of the FIM for each weight')
 
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fi_weights = var_est.reshape((nh,nv)).T * temp_mask
 
@@ -258,7 +281,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             print('Weight pruning according to squared diagonal values of the FIM for each weight')
 
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fim_diag = var_est.reshape((nh,nv)).T * temp_mask
 
@@ -280,7 +303,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             print('Weight pruning according to heuristic estimates of the FIM for each weight')
 
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fim_diag = var_est.reshape((nh,nv)).T * temp_mask # we save this each time
 
@@ -299,15 +322,17 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
         elif pruning_criterion == 'FIM_EIGENVECTOR':
             # prune according to weight-specific entry of first eigenvector
             print('Weight pruning according to first eigenvector of FIM')
-            fim = rbm_fim_numpy(s.astype(bool), nv) # nv = number of visible units
-            fim_eigvals, vec = fim_eig(fim, nv, return_eigenvectors=True)
+            if exact: # enumerate all visible states, no sampling error
+                fim_eigvals, vec = exact_fim_eigenvectors(w, vb, hb, k=1, mask=temp_mask)
+            else: # matrix-free Lanczos on sample-based FIM-vector products, pruned weights excluded
+                fim_eigvals, vec = fim_eigenvectors(s, nv, k=1, mask=temp_mask) # nv = number of visible units
             fim_visbias, fim_hidbias, fim_weights = vec
 
             fi_weights = fim_weights[:,:,0] # take first eigenvector
             fi_weights = np.reshape(np.array(fi_weights), (nv,nh)) * temp_mask
 
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fim_diag = var_est.reshape((nh,nv)).T * temp_mask # we save this each time
 
@@ -325,7 +350,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             # prune according to absolute weight magnitude
             print('Weight pruning according to absolute weight magnitude')
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fim_diag = var_est.reshape((nh,nv)).T * temp_mask # we save this each time
 
@@ -347,7 +372,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
 
             print("Prune", percentile, " percent of weights with highest FI (anti-FI pruning)")
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fi_weights = var_est.reshape((nh,nv)).T * temp_mask
             fim_diag = deepcopy(fi_weights)
@@ -366,7 +391,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             print("Randomly prune ", percentile, " percent of weights.")
 
             if sess >0: # in session 0 we take the fi computed above
-                var_est, heu_est = FI_weights_var_heur_estimates(s, nv, nh, w)
+                var_est, heu_est = estimate_fi(s, nh, w, w_after)
 
             fi_weights = var_est.reshape((nh,nv)).T * temp_mask
             fim_diag = deepcopy(fi_weights) # we save this to look at it over time
@@ -438,7 +463,7 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
             device_count = {'GPU': 1})
         rbm_pruned._tf_session_config = config
 
-        s = rbm_pruned.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
+        s = sample(rbm_pruned)
 
         cur_res_path = os.path.join(results_path, 'session{}_untrained_'.format(sess+1))
         save_res(cur_res_path, params=w_before, indices_hiddens=np.array(indices_of_left_hiddens), samples=s, mask=p_mask, fi=fim_diag)
@@ -449,9 +474,9 @@ def main(pruning_criterion, percentile=50, n_hidden=70, n_pruning_session=3):
         w_after = rbm_pruned.get_tf_params(scope='weights')
         config = tf.ConfigProto(device_count = {'GPU': 1})
         rbm_pruned._tf_session_config = config
-        s = rbm_pruned.sample_gibbs(n_gibbs_steps=200, save_model=False, n_runs=n_train)
+        s = sample(rbm_pruned)
 
-        var_est, heu_est = FI_weights_var_heur_estimates(s, nv, active_nh, w)
+        var_est, heu_est = estimate_fi(s, active_nh, w, w_after)
 
         fi_weights = var_est.reshape((active_nh,nv)).T * p_mask
 
@@ -490,7 +515,9 @@ if __name__ == '__main__':
     parser.add_argument('percentile', default=50, nargs='?', help='Percentage of weights removed in each iteration', type=int, choices=range(1, 100))
     parser.add_argument('n_hidden', default=70, nargs='?', help='Number of hidden units', type=check_positive)
     parser.add_argument('n_pruning_session', default=3, nargs='?', help='Number of pruning sessions', type=check_positive)
+    parser.add_argument('--exact', action='store_true', help='Compute FI exactly by enumerating all visible states instead of sampling')
+    parser.add_argument('--save_samples', action='store_true', default=None, help='Sample and save samples with the results also with --exact')
 
     args = parser.parse_args()
 
-    main(args.pruning_criterion, args.percentile, args.n_hidden, args.n_pruning_session)
\ No newline at end of file
+    main(args.pruning_criterion, args.percentile, args.n_hidden, args.n_pruning_session, args.exact, args.save_samples)
\ No newline at end of file
@@ -16,6 +16,7 @@ from bm.utils import *
 from bm.utils.plot_utils import im_plot
 from rbm_utils.stutils import *
 from rbm_utils.fimdiag import * # functions to compute the diagonal of the FIM for RBMs
+from bm.utils.fisher import fi_estimates
 from copy import deepcopy
 from shutil import copy
 import argparse
@@ -37,50 +38,54 @@ class Struct:
         self.__dict__.update(entries)
 
 def _crop_MNIST(X):
-    X_20 = []
-    for img in X:
-        img_re = np.reshape(img, (28, 28))
-        crop_img = img_re[4:24, 4:24]
-        X_20.append(crop_img.flatten())  
-    return X_20
+    # central 20x20 pixels of all images at once
+    return np.reshape(X, (-1, 28, 28))[:, 4:24, 4:24].reshape((-1, 400))
 
 def _binarize_by_mean(X):
-    imgmean_total = np.mean(X) 
-    bin_X_train = ((np.array([np.sign(d - imgmean_total) for d in X]) + 1) / 2).astype(bool)
-    return bin_X_train
+    # pixels brighter than or as bright as the mean over all images and pixels
+    return X >= np.mean(X)
 
-def preprocess_MNIST(image_path=None):
+def preprocess_MNIST(image_path=None, cache_path=None):
+    """Shuffled, cropped (20x20) and binarized MNIST as read-only bool arrays.
+
+    The result is cached in `cache_path` (default: `image_path`/cache) as
+    .npy files and memory-mapped, so that only the first call reads the
+    idx files; it is recomputed whenever these change.
+    """
     if image_path is None: 
         image_path = os.path.join('..', 'data')
+    if cache_path is None:
+        cache_path = os.path.join(image_path, 'cache')
 
     # check that image data is available
-    try:
-        X_train, y_train = load_mnist(mode='train', path=image_path)
-        X_test, y_test = load_mnist(mode='test', path=image_path)
-        pass
-    except(FileNotFoundError, IOError):
+    filenames = ('train-images-idx3-ubyte', 'train-labels-idx1-ubyte',
+                 't10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte')
+    filepaths = [os.path.join(image_path, 'mnist', fn) for fn in filenames]
+    if not all(os.path.exists(fp) for fp in filepaths):
         print("Cannot find MNIST image data, please run data/fetch_mnist.sh first")
-        raise
+        raise FileNotFoundError(filepaths[0])
 
-    X_train /= 255.
-    X_test /= 255.
+    def make():
+        X_train, y_train = load_mnist(mode='train', path=image_path)
+        X_test, y_test = load_mnist(mode='test', path=image_path)
 
-    RNG(seed=42).shuffle(X_train)
-    RNG(seed=42).shuffle(y_train)
+        # the idx files are mapped read-only: shuffle by indexing, in the same order
+        # as shuffling in place with RNG(seed=42)
+        order = RNG(seed=42).permutation(len(X_train))
 
-    # crop and binarize
-    X_train = _crop_MNIST(X_train)
-    X_test = _crop_MNIST(X_test)
+        # crop and binarize
+        return dict(X_train=_binarize_by_mean(_crop_MNIST(X_train)[order]), y_train=y_train[order],
+                    X_test=_binarize_by_mean(_crop_MNIST(X_test)), y_test=y_test)
 
-    bin_X_train = _binarize_by_mean(X_train)
-    bin_X_test = _binarize_by_mean(X_test)
+    data = cached_arrays(cache_path, make, dict(name='MNIST', shuffle_seed=42, crop=[4, 24], binarize='mean'),
+                         filepaths=filepaths)
 
     # distribution/balance of digit classes
     #dig_class, dig_counts = np.unique(y_train, return_counts=True)
     #dig = dict(zip(dig_class, dig_counts))
     #print('Class distribution of training data', dig)
     
-    return (bin_X_train, y_train), (bin_X_test, y_test)
+    return (data['X_train'], data['y_train']), (data['X_test'], data['y_test'])
 
 def get_classifier_trained_on_raw_digits(path=None):
     # retrieve logistic regression classifier trained on 20x20 binary MNIST
@@ -225,6 +230,7 @@ def get_initial_args(model_path=None):
     args['rbm1_dirpath'] = os.path.join(model_path,'MNIST_DBM_Layer1/')
     args['rbm2_dirpath'] = os.path.join(model_path,'MNIST_DBM_Layer2/')
     args['double_rf'] = False
+    args['local_layers'] = (True, False)  # store only the receptive fields of the first DBM layer
 
     # RBM 2 related
     args['increase_n_gibbs_steps_every'] = 20
@@ -314,15 +320,12 @@ def evaluate_initial_DBM(dbm, model_path=None, n_samples=60000, sample_every=200
     vb = weights['vb']
 
     temp_mask1 = rf_mask1 * prune_mask1
-    samples = np.hstack((s_v, s_h1))
-    var_est1, _ = FI_weights_var_heur_estimates(samples, nv, nh1, W1) # call without mask 
-    fi_weights1 = var_est1.reshape((nh1,nv)).T * temp_mask1
+    (var_est1, heu_est1), (var_est2, heu_est2) = fi_estimates(samples, (nv, nh1, nh2), masks=(rf_mask1 * prune_mask1, rf_mask2 * prune_mask2), dense=True) # FI of active weights of both layers in one pass
+    fi_weights1 = var_est1 * temp_mask1
     fi_weights1[rf_mask1==0]=np.nan # to distinguish non-existing weights from 0 weights
 
     temp_mask2 = rf_mask2 * prune_mask2
-    samples = np.hstack((s_h1, s_h2))
-    var_est2, _ = FI_weights_var_heur_estimates(samples, nh1, nh2, W2) # call without mask 
-    fi_weights2 = var_est2.reshape((nh2,nh1)).T * temp_mask2
+    fi_weights2 = var_est2 * temp_mask2
 
     np.save(os.path.join(model_path, 'RBM1_initial_FI_weights.npy'), fi_weights1)
     np.save(os.path.join(model_path, 'RBM2_initial_FI_weights.npy'), fi_weights2)
@@ -0,0 +1,52 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import os
+import env
+import numpy as np
+import argparse
+from bm.utils.pruning import EigenvectorCriterion, GlobalCriterion
+from pruning.session import PruningSession
+
+np.random.seed(42)
+
+# if machine has multiple GPUs only use first one
+#os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
+#os.environ["CUDA_VISIBLE_DEVICES"]="0"
+
+def make_criterion(perc=10):
+    # number of leading eigenvectors of the FIM of each layer
+    K = 1
+
+    # rank the weights of both layers together (scores normalized per layer) instead of pruning each layer by perc
+    GLOBAL = False
+
+    print("Pruning based on the leading eigenvectors of the FIM of each layer.")
+    criterion = EigenvectorCriterion(perc/100, k=K)
+    if GLOBAL:
+        criterion = GlobalCriterion(criterion, normalize='mean')
+    return criterion
+
+def main(perc=10, n_sessions=10, estimator=None, rao_blackwell=False):
+    criterion = make_criterion(perc)
+    model_path = os.path.join('..', 'models', 'MNIST', f'eigenvector_{perc}perc_{n_sessions}sessions')
+    PruningSession(criterion, model_path, n_sessions=n_sessions, script_path=__file__,
+                   estimator=estimator, rao_blackwell=rao_blackwell).run()
+
+if __name__ == '__main__':
+
+    def check_positive(value):
+        ivalue = int(value)
+        if ivalue <= 0:
+            raise argparse.ArgumentTypeError('Not a positive integer.')
+        return ivalue
+
+    parser = argparse.ArgumentParser(description = 'DBM Pruning')
+    parser.add_argument('percentile', default=10, nargs='?', help='Percentage of weights removed in each iteration', type=int, choices=range(1, 100))
+    parser.add_argument('n_pruning_session', default=10, nargs='?', help='Number of pruning sessions', type=check_positive)
+    parser.add_argument('--estimator', default=None, choices=PruningSession.estimators, help='How the FI is estimated (default: depends on the criterion)')
+    parser.add_argument('--rao_blackwell', action='store_true', help='Estimate the FI from conditional means of the first hidden layer')
+
+    args = parser.parse_args()
+
+    main(args.percentile, args.n_pruning_session, args.estimator, args.rao_blackwell)
@@ -0,0 +1,59 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import os
+import env
+import numpy as np
+import argparse
+from bm.utils.pruning import FICriterion, PruningSchedule
+from pruning.MNIST_Baselines import * # provides data, initial DBM and evaluation helpers
+
+np.random.seed(42)
+
+# if machine has multiple GPUs only use first one
+#os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
+#os.environ["CUDA_VISIBLE_DEVICES"]="0"
+
+def main(perc=90, n_steps=10, epochs=10):
+    print("Pruning the weights with the lowest variance FI times squared weight, gradually during training.")
+    model_path = os.path.join('..', 'models', 'MNIST', f'gradual_varianceFI_{perc}perc_{n_steps}steps')
+    assert not os.path.exists(model_path), "model path already exists - abort"
+    res_path = os.path.join(model_path, 'res')
+    os.makedirs(res_path)
+
+    (X_train, y_train), (X_test, y_test) = preprocess_MNIST()
+
+    # continue training a copy of the initial DBM, leave time to recover after the last step
+    dbm = get_initial_DBM()
+    dbm.max_epoch = epochs
+    dbm.prune(model_path=os.path.join(model_path, 'MNIST_PrunedDBM/'))
+    every = epochs * len(X_train) // dbm.batch_size // (n_steps + 1)
+    schedule = PruningSchedule(FICriterion(None, use_var=True, times_w=True), perc/100, every=every, n_steps=n_steps)
+    dbm.fit(X_train, pruning_schedule=schedule)
+
+    masks = dbm.get_tf_params(scope='masks')
+    n_active = [np.count_nonzero(masks['rf_mask'] * masks['prune_mask']),
+                np.count_nonzero(masks['rf_mask_1'] * masks['prune_mask_1'])]
+    print("Active weights in layer 1 and 2:", n_active)
+    np.save(os.path.join(res_path, 'n_active_weights.npy'), n_active)
+
+    acc = compute_accuracy_on_hidden_layer_representations(dbm)
+    print("classification accuracy of LogReg classifier", acc)
+    np.save(os.path.join(res_path, 'AccLogReg.npy'), acc)
+
+if __name__ == '__main__':
+
+    def check_positive(value):
+        ivalue = int(value)
+        if ivalue <= 0:
+            raise argparse.ArgumentTypeError('Not a positive integer.')
+        return ivalue
+
+    parser = argparse.ArgumentParser(description = 'Gradual DBM Pruning during training')
+    parser.add_argument('percentile', default=90, nargs='?', help='Percentage of weights removed in total', type=int, choices=range(1, 100))
+    parser.add_argument('n_pruning_steps', default=10, nargs='?', help='Number of pruning steps', type=check_positive)
+    parser.add_argument('epochs', default=10, nargs='?', help='Number of training epochs', type=check_positive)
+
+    args = parser.parse_args()
+
+    main(args.percentile, args.n_pruning_steps, args.epochs)
@@ -0,0 +1,37 @@
+import env
+import timeit
+import numpy as np
+from bm.utils.pruning import connected_units
+
+
+def connected_units_loop(keep):
+    # per-unit loops as previously used in the MNIST pruning scripts
+    n_lower, n_upper = keep.shape
+    indices_of_left_hiddens = []
+    for i in range(n_upper):
+        if sum(keep[:,i]!=0):
+            indices_of_left_hiddens.append(i)
+    indices_of_left_visibles = []
+    for i in range(n_lower):
+        if sum(keep[i]!=0):
+            indices_of_left_visibles.append(i)
+    return indices_of_left_visibles, indices_of_left_hiddens
+
+
+def main(density=0.1, repeat=5):
+    rng = np.random.RandomState(42)
+    for shape in ((400, 676), (676, 676)):
+        keep = rng.rand(*shape) < density
+        keep[:, rng.rand(shape[1]) < 0.2] = False # some dead units
+
+        lower, upper = connected_units(keep)
+        assert connected_units_loop(keep) == (list(np.flatnonzero(lower)), list(np.flatnonzero(upper)))
+
+        t_loop = min(timeit.repeat(lambda: connected_units_loop(keep), number=1, repeat=repeat))
+        t_vec = min(timeit.repeat(lambda: connected_units(keep), number=10, repeat=repeat)) / 10
+        print("{0}x{1}: loops {2:.2f} ms, vectorized {3:.3f} ms ({4:.0f}x faster)".format(
+              shape[0], shape[1], 1e3 * t_loop, 1e3 * t_vec, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    main()
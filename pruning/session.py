@@ -0,0 +1,422 @@
+import os
+import env
+import tensorflow as tf
+import numpy as np
+import pathlib
+from shutil import copy, rmtree
+from sklearn.linear_model import LogisticRegression
+from bm.init_BMs import * # helper functions to initialize, fit and load RBMs and 2 layer DBM
+from bm.utils.fisher import FisherAccumulator, rao_blackwellize, split_layers
+from bm.utils.pruning import connected_units, compact, choose_storage
+from bm.utils.lineage import MaskLineage
+from bm.utils.augmentation import AugmentedData
+from pruning.MNIST_Baselines import * # provides Struct, data and classifier helpers
+
+
+class PruningSession(object):
+    """Iteratively prune the two-layer MNIST DBM with a pluggable criterion.
+
+    In each session both layers are pruned based on the same FI estimates,
+    units left without connections to one of their neighbouring layers are
+    removed, and the smaller DBM is evaluated before and after retraining.
+    The current parameters and FI estimates are kept in memory between sessions.
+    The masks and original unit IDs of every session are recorded in a
+    `bm.utils.lineage.MaskLineage` in `model_path`/res/masks.
+
+    Parameters
+    ----------
+    criterion : callable
+        `criterion(W, mask, fi, lower, upper)` -> (keep, threshold) applied
+        to each layer, or, if `criterion.cross_layer` is set,
+        `criterion(weights, masks, fi, layers)` -> (keeps, thresholds)
+        applied to all layers at once; see `bm.utils.pruning`.
+    model_path : str
+        Where pruned models and results are saved. If it holds the
+        checkpoint of an interrupted run, the run is resumed after the
+        last complete checkpoint, otherwise it must not exist yet.
+    n_sessions : positive int
+        Number of pruning sessions.
+    sample_every : positive int
+        Number of Gibbs steps between samples.
+    retrain_epochs : positive int
+        Number of epochs to retrain the DBM after each pruning.
+    script_path : None or str
+        Script defining the experiment, copied next to the results.
+    data : None or ((X_train, y_train), (X_test, y_test))
+        Preprocessed MNIST (default: from `preprocess_MNIST`),
+        e.g. read-only memory maps shared by several runs.
+    logreg_digits : None or classifier
+        Classifier trained on raw digits
+        (default: from `get_classifier_trained_on_raw_digits`).
+    initial_params : None or dict
+        Weights ('W', 'W_1', 'vb', 'hb', 'hb_1') and masks ('rf_mask',
+        'rf_mask_1', 'prune_mask', 'prune_mask_1') of the initial DBM, e.g.
+        read-only memory maps shared by several runs (default: read from
+        the initial DBM returned by `get_initial_DBM`).
+    initial_config : None or dict
+        Hyperparameters of the initial DBM as saved in its params.json.
+        If given with `initial_params`, each run builds its own copy of the
+        initial DBM from them without reading the initial DBM from disk
+        (default: read them from disk).
+    initial_state : None or dict
+        Training state of the initial DBM (see `DBM.get_training_state`),
+        continued by the copy built from `initial_config` if `warm_start`.
+    warm_start : bool
+        Whether each pruned DBM continues the persistent chains, momentum
+        buffers and running means of hidden activations of its parent,
+        restricted to the remaining units (see `DBM.prune`).
+    augmenter : None or callable
+        Augmentation of the training batches during retraining, e.g. a
+        `bm.utils.augmentation.BatchAugmenter`.
+    n_threads : None or positive int
+        Size of the intra- and inter-op thread pools of TF
+        (default: chosen by TF), e.g. to share the CPUs between several runs.
+    estimator : None or {'samples', 'streaming', 'in_graph', 'sequential'}
+        How the FI is estimated from (at most) as many samples as training instances:
+
+        * 'samples': from all samples at once (`DBM.sample_gibbs`), which are
+          kept in memory for criteria that need the unit states (`needs_states`);
+        * 'streaming': block by block (`DBM.estimate_fi`), without ever
+          holding all samples in memory;
+        * 'in_graph': from moments accumulated inside the TF sampling loop,
+          without transferring any samples to the host. Sample quality is
+          not evaluated then;
+        * 'sequential': block by block, only until the weights below the
+          pruning percentile of each layer are stable (`DBM.estimate_fi_sequential`).
+          The number of samples drawn is recorded in the results ('n_samples').
+
+        Default: 'samples' if the criterion needs the unit states, 'streaming' otherwise.
+    rao_blackwell : bool
+        Whether the FI is estimated with the conditional means of the first
+        hidden layer instead of its sampled states (see `rao_blackwellize`),
+        for lower variance from the same number of samples. Criteria that need
+        the unit states still get the sampled ones. Not available with 'in_graph'.
+    """
+    estimators = ('samples', 'streaming', 'in_graph', 'sequential')
+
+    def __init__(self, criterion, model_path, n_sessions=10, sample_every=200,
+                 retrain_epochs=10, script_path=None, data=None, logreg_digits=None, initial_params=None,
+                 warm_start=True, augmenter=None, n_threads=None, estimator=None, rao_blackwell=False,
+                 initial_config=None, initial_state=None):
+        needs_states = getattr(criterion, 'needs_states', False)
+        if estimator is None:
+            estimator = 'samples' if needs_states else 'streaming'
+        if estimator not in self.estimators:
+            raise ValueError("`estimator` must be one of {0}, got {1!r}".format(self.estimators, estimator))
+        if needs_states and estimator != 'samples':
+            raise ValueError("the criterion needs the sampled unit states, use estimator='samples'")
+        if rao_blackwell and estimator == 'in_graph':
+            raise ValueError("`rao_blackwell` is not supported with estimator='in_graph'")
+        self.criterion = criterion
+        self.model_path = model_path
+        self.res_path = os.path.join(model_path, 'res')
+        self.state_path = os.path.join(self.res_path, 'state.npz')
+        self.lineage_path = os.path.join(self.res_path, 'masks')
+        self.n_sessions = n_sessions
+        self.sample_every = sample_every
+        self.retrain_epochs = retrain_epochs
+        self.script_path = script_path
+        self.data = data
+        self.logreg_digits = logreg_digits
+        self.initial_params = initial_params
+        self.initial_config = initial_config
+        self.initial_state = initial_state
+        self.warm_start = warm_start
+        self.augmenter = augmenter
+        self.n_threads = n_threads
+        self.estimator = estimator
+        self.rao_blackwell = rao_blackwell
+
+    def setup(self):
+        # check that we have access to a GPU and that we only use one!
+        if tf.test.gpu_device_name():
+            print('Default GPU Device: {}'.format(tf.test.gpu_device_name()))
+        else:
+            print("Consider installing GPU version of TF and running sampling from DBMs on GPU.")
+
+        if self.logreg_digits is None:
+            self.logreg_digits = get_classifier_trained_on_raw_digits()
+
+        if self.data is None:
+            print("\nPreparing data ...\n\n")
+            self.data = preprocess_MNIST()
+        (self.X_train, self.y_train), (self.X_test, self.y_test) = self.data
+
+        if os.path.exists(self.state_path):
+            return self.resume()
+
+        assert not os.path.exists(self.model_path), "model path already exists - abort"
+        os.makedirs(self.res_path)
+        copy(pathlib.Path(__file__).absolute(), os.path.join(self.res_path, 'session.py'))
+        if self.script_path is not None:
+            copy(pathlib.Path(self.script_path).absolute(), os.path.join(self.res_path, 'script.py'))
+
+        self.load_initial_state()
+        self.unit_ids = [np.arange(n) for n in self.layer_sizes] # original IDs of the current units
+        self.lineage = MaskLineage(self.lineage_path)
+        self.lineage.append(self.masks, self.unit_ids)
+        self.sample()
+
+        shape = (self.n_sessions, 2)
+        self.results = {
+            'AccLogReg': np.zeros(shape), # accuracy of log reg
+            'n_active_weights_L1': np.zeros(shape),
+            'n_active_weights_L2': np.zeros(shape),
+            'n_hid_units_L1': np.zeros(shape),
+            'n_hid_units_L2': np.zeros(shape),
+            'pruning_thresholds': np.full(shape, np.nan), # score thresholds of layer 1 and 2
+            'unconnected_v': np.zeros((self.n_sessions, self.layer_sizes[0]), dtype=bool),
+            'n_samples': np.zeros(shape, dtype=int), # number of samples the FI is estimated from
+        }
+        self.save_results()
+        self.save_checkpoint(-1, 1) # the initial DBM counts as retrained session "0"
+        return 0, 0
+
+    def model_dirpaths(self, session):
+        return {'dbm_dirpath': os.path.join(self.model_path, 'MNIST_PrunedDBM_both_Sess{}/'.format(session))}
+
+    def save_checkpoint(self, it, checkpoint):
+        """Atomically record that `checkpoint` of session `it` is complete,
+        together with everything needed to resume after it (the models are on disk)."""
+        state = {'res/' + k: v for k, v in self.results.items()}
+        _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+        state.update(stage=np.array([it, checkpoint]), rng_keys=keys,
+                     rng_state=np.array([pos, has_gauss, cached_gaussian]))
+
+        # write to a temporary file first: a crash leaves the previous checkpoint intact
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def resume(self):
+        """Restore the state after the last complete checkpoint, return the next (session, checkpoint) to run."""
+        with np.load(self.state_path) as state:
+            it, checkpoint = (int(x) for x in state['stage'])
+            self.results = {k[len('res/'):]: state[k] for k in state.files if k.startswith('res/')}
+            pos, has_gauss, cached_gaussian = state['rng_state']
+            np.random.set_state(('MT19937', state['rng_keys'], int(pos), int(has_gauss), cached_gaussian))
+        self.results.setdefault('n_samples', np.zeros((self.n_sessions, 2), dtype=int))
+        print("\nResume after checkpoint", checkpoint + 1, "of pruning session", it + 1)
+
+        # sessions 0, ..., it + 1 are complete, a later one was interrupted while pruning
+        self.lineage = MaskLineage(self.lineage_path)
+        self.lineage.truncate(it + 2)
+        self.unit_ids = self.lineage.unit_ids(it + 1)
+
+        if it < 0:
+            self.load_initial_state()
+        else:
+            self.load_state(load_dbm_withoutRBMs(Struct(**self.model_dirpaths(it + 1))))
+
+        if checkpoint == 0: # continue (or restart) retraining of the saved DBM
+            return it, 1
+        if it + 1 == self.n_sessions:
+            return it + 1, 0
+
+        # discard leftovers of an interrupted next session, it is pruned again
+        for dirpath in self.model_dirpaths(it + 2).values():
+            if os.path.exists(dirpath):
+                rmtree(dirpath)
+        self.sample()
+        return it + 1, 0
+
+    def tf_config(self):
+        """Config of the TF sessions of the DBM: one GPU, `n_threads` CPU threads."""
+        return tf.ConfigProto(device_count={'GPU': 1},
+                              intra_op_parallelism_threads=self.n_threads or 0,
+                              inter_op_parallelism_threads=self.n_threads or 0)
+
+    def load_initial_state(self):
+        """Load the initial DBM, with the parameters from `initial_params` if given."""
+        if self.initial_params is None:
+            return self.load_state(get_initial_DBM())
+        if self.initial_config is None:
+            # only the hyperparameters are read, the graph is restored when it is first used
+            dbm = load_dbm_withoutRBMs(Struct(**get_initial_args()))
+            return self.load_state(dbm, params=self.initial_params)
+        # a copy of the initial DBM as session "0" of this run, built from memory only
+        dbm_dirpath = self.model_dirpaths(0)['dbm_dirpath']
+        dbm = DBM.from_params(self.initial_config, dbm_dirpath)
+        dbm._tf_session_config = self.tf_config()
+        dbm.prune(model_path=dbm_dirpath, warm_start=self.warm_start and self.initial_state is not None,
+                  params=self.initial_params, state=self.initial_state)
+        self.load_state(dbm)
+
+    def load_state(self, dbm, params=None):
+        """Read parameters and masks of `dbm` (or `params`, if given) into memory."""
+        self.dbm = dbm
+        self.dbm._tf_session_config = self.tf_config()
+        weights = params if params is not None else dbm.get_tf_params(scope='weights')
+        self.weights = [weights['W'], weights['W_1']]
+        self.biases = [weights['vb'], weights['hb'], weights['hb_1']]
+        masks = params if params is not None else dbm.get_tf_params(scope='masks')
+        self.params = dict(weights, **masks) # dense, as `DBM.prune` expects them
+        self.rf_masks = [masks['rf_mask'], masks['rf_mask_1']]
+        self.masks = [masks['rf_mask'] * masks['prune_mask'], masks['rf_mask_1'] * masks['prune_mask_1']]
+        self.layer_sizes = [len(b) for b in self.biases]
+
+    def sample(self, score=False):
+        """Estimate the FI of all active weights and the mean activity of all layers
+        from as many samples as training instances, see `estimator`. If `score`,
+        also classify the visible samples with `logreg_digits` (unless they stay in the TF graph)."""
+        #run on gpu
+        self.dbm._tf_session_config = self.tf_config()
+        n_runs = len(self.X_train)
+        probs = []
+        def score_block(samples):
+            probs.append(self.logreg_digits.predict_proba(samples[:, :self.layer_sizes[0]]))
+        on_block = score_block if score and self.estimator != 'in_graph' else None
+
+        print("Computing FI for weights of both layers")
+        if self.estimator == 'samples':
+            samples = self.dbm.sample_gibbs(n_gibbs_steps=self.sample_every, save_model=False, n_runs=n_runs)
+            self.layers = split_layers(samples, self.layer_sizes)
+            if self.rao_blackwell:
+                samples = rao_blackwellize(samples, self.layer_sizes, self.weights, self.biases)
+            acc = FisherAccumulator(self.layer_sizes, masks=self.masks).update(samples)
+            if on_block is not None:
+                on_block(samples)
+        elif self.estimator == 'sequential':
+            self.layers = [None] * len(self.layer_sizes)
+            criterion = getattr(self.criterion, 'criterion', self.criterion) # per-layer scores of cross-layer criteria
+            scales = [np.square(W) for W in self.weights] if getattr(criterion, 'times_w', False) else None
+            acc = self.dbm.estimate_fi_sequential(100. * self.criterion.fraction, n_gibbs_steps=self.sample_every,
+                                                  max_runs=n_runs, masks=self.masks, scales=scales,
+                                                  use_var=getattr(criterion, 'use_var', True),
+                                                  rao_blackwell=self.rao_blackwell, on_block=on_block)
+            print("FI estimated from", acc.n_samples_, "samples")
+        else:
+            self.layers = [None] * len(self.layer_sizes)
+            acc = self.dbm.estimate_fi(n_gibbs_steps=self.sample_every, n_runs=n_runs, masks=self.masks,
+                                       in_graph=self.estimator == 'in_graph', rao_blackwell=self.rao_blackwell,
+                                       on_block=on_block)
+        self.fi = acc.estimates(dense=True) # FI of active weights of both layers in one pass
+        self.means = acc.means()
+        self.n_samples = acc.n_samples_
+        self.digit_probs = np.concatenate(probs) if probs else None
+
+    def prune_layers(self):
+        """Apply the criterion to the weights of all layers, return masks of weights to keep and thresholds."""
+        if getattr(self.criterion, 'cross_layer', False):
+            print("\nRank weights of all layers together")
+            keeps, thresholds = self.criterion(self.weights, self.masks, self.fi, self.layers)
+        else:
+            keeps, thresholds = zip(*[self.criterion(self.weights[i], self.masks[i], self.fi[i], self.layers[i], self.layers[i + 1])
+                                      for i in range(len(self.masks))])
+
+        keeps = [(np.asarray(K) != 0) & (M != 0) for K, M in zip(keeps, self.masks)]
+        for i, (K, M) in enumerate(zip(keeps, self.masks)):
+            n_active = np.count_nonzero(M)
+            n_pruned = n_active - np.count_nonzero(K)
+            print("Layer", i + 1, ":", n_pruned, "weights of a total of", n_active, "are pruned: ",
+                  n_pruned / n_active, "of all weights. Score threshold:", thresholds[i])
+        return keeps, thresholds
+
+    def prune(self, it):
+        """Prune both layers and initialize the smaller DBM."""
+        session = it + 1
+        print("\n################## Pruning session", session, "##################")
+
+        keeps, self.results['pruning_thresholds'][it] = self.prune_layers()
+
+        lost_visibles = ~connected_units(keeps[0])[0]
+        self.results['unconnected_v'][it] = lost_visibles
+        print(np.count_nonzero(lost_visibles), "unconnected visible units:", np.flatnonzero(lost_visibles))
+
+        # only keep hidden units that still have connections to both their neighboring layers (repeatedly), otherwise they are dead ends
+        _, (keep1, keep2), _, unit_ids = compact(self.weights, keeps, self.biases, self.unit_ids)
+        for i in (1, 2):
+            print(len(unit_ids[i]), "hidden units in layer", i, "are still connected.",
+                  len(self.unit_ids[i]) - len(unit_ids[i]), "are removed.")
+        alive = [np.isin(old, new) for old, new in zip(self.unit_ids, unit_ids)]
+        self.unit_ids = unit_ids
+
+        # pick the storage of each layer of the pruned DBM, never denser than before
+        previous = ['local' if l else 'sparse' if s else 'dense'
+                    for l, s in zip(self.dbm.local_layers, self.dbm.sparse_layers)]
+        rf_masks = [R[np.ix_(alive[i], alive[i + 1])] for i, R in enumerate(self.rf_masks)]
+        storage = [choose_storage(K, rf_mask=R, previous=p) for K, R, p in zip((keep1, keep2), rf_masks, previous)]
+        print("Storage of weights:", storage)
+
+        print("Shapes of new weights:", keep1.shape, keep2.shape)
+        if self.warm_start:
+            print("\nContinue particles, momentum and hidden means of the previous DBM...")
+        self.dbm.max_epoch = self.retrain_epochs
+        self.dbm.prune(keeps, keep_units=alive, model_path=self.model_dirpaths(session)['dbm_dirpath'],
+                       warm_start=self.warm_start, storage=storage, params=self.params)
+        self.load_state(self.dbm)
+        self.lineage.append(self.masks, self.unit_ids)
+
+    def evaluate(self, it, checkpoint):
+        """Sample from the current DBM, save FI, sample quality and accuracy of hidden representations."""
+        session = it + 1
+        stage = ('before_retrain', 'retrained')[checkpoint]
+        stage_fi = ('before_retrain', 'after_retrain')[checkpoint]
+        print("\nPruning session", session, "checkpoint", checkpoint + 1, "\n")
+
+        self.sample(score=True)
+        for name, means in zip(('v', 'h1', 'h2'), self.means):
+            np.save(os.path.join(self.res_path, 'mean_activity_{}_both_Sess{}_{}'.format(name, session, stage)), means)
+
+        for i in range(2):
+            n_active = np.count_nonzero(self.masks[i])
+            print(n_active, "active weights in layer", i + 1)
+            self.results['n_active_weights_L{}'.format(i + 1)][it, checkpoint] = n_active
+            self.results['n_hid_units_L{}'.format(i + 1)][it, checkpoint] = self.layer_sizes[i + 1]
+            np.save(os.path.join(self.res_path, 'FI_weights_RBM{}_{}_sess{}'.format(i + 1, stage_fi, session)), self.fi[i][0])
+        self.results['n_samples'][it, checkpoint] = self.n_samples
+
+        if self.digit_probs is not None:
+            self.evaluate_samples(session, checkpoint)
+
+        print("\nEvaluate hidden unit representations...")
+        final_train = self.dbm.transform(self.X_train)
+        final_test = self.dbm.transform(self.X_test)
+
+        print("\nTrain LogReg classifier on final hidden layer...")
+        logreg_hid = LogisticRegression(multi_class='multinomial', solver='sag', max_iter=800, n_jobs=2, random_state=4444)
+        logreg_hid.fit(final_train, self.y_train)
+        logreg_acc = logreg_hid.score(final_test, self.y_test)
+        print("classification accuracy of LogReg classifier", logreg_acc)
+        self.results['AccLogReg'][it, checkpoint] = logreg_acc
+
+        self.save_results()
+
+    def evaluate_samples(self, session, checkpoint):
+        """Save how much the visible samples look like digits, according to `logreg_digits`."""
+        print("\nEvaluate samples similarity to digits...")
+        pred_probs_samples = self.digit_probs
+        probs = pred_probs_samples.max(axis=1)
+        print("Mean quality of samples", np.mean(probs), "Std: ", np.std(probs))
+
+        ind_winner_pred_samples = np.argmax(pred_probs_samples, axis=1)
+        sample_class, sample_counts = np.unique(ind_winner_pred_samples, return_counts=True)
+        print("sample counts per class", dict(zip(sample_class, sample_counts)))
+
+        mean_qual_d = np.array([np.mean(probs[ind_winner_pred_samples == c]) for c in sample_class])
+        print("Weighted (per class frequency) mean quality of samples", np.mean(mean_qual_d))
+        np.save(os.path.join(self.res_path, 'ProbsWinDig_sess{}_checkpoint{}'.format(session, checkpoint + 1)),
+                [sample_class, mean_qual_d, sample_counts])
+
+    def save_results(self):
+        for name, res in self.results.items():
+            np.save(os.path.join(self.res_path, name + '.npy'), res)
+
+    def run(self):
+        start, checkpoint = self.setup()
+        for it in range(start, self.n_sessions):
+            if checkpoint == 0:
+                self.prune(it)
+                self.evaluate(it, checkpoint=0)
+                self.save_checkpoint(it, 0)
+
+            print("\nRetraining of DBM after pruning both layers...")
+            X_train = self.X_train if self.augmenter is None else AugmentedData(self.X_train, self.augmenter)
+            self.dbm.fit(X_train)
+            self.load_state(self.dbm)
+            self.evaluate(it, checkpoint=1)
+            self.save_checkpoint(it, 1)
+            checkpoint = 0
@@ -0,0 +1,261 @@
+import warnings
+warnings.filterwarnings("ignore")
+
+import os
+import env
+import itertools
+import importlib
+import traceback
+import json
+import shutil
+import multiprocessing
+import numpy as np
+import argparse
+
+# name -> script defining the criterion by `make_criterion(perc)`
+CRITERIA = {
+    'varianceFI': 'MNIST_PruneDBM_VarianceFI',
+    'heuristicFI': 'MNIST_PruneDBM_HeuristicFI',
+    'antiFI': 'MNIST_PruneDBM_AntiFI',
+    'random': 'MNIST_PruneDBM_Random',
+    'w': 'MNIST_PruneDBM_W',
+    'eigenvector': 'MNIST_PruneDBM_Eigenvector',
+}
+
+# shared parameters of the classifier on raw digits and of the initial DBM
+SHARED_LOGREG = ('coef_', 'intercept_', 'classes_')
+SHARED_DBM = ('W', 'W_1', 'vb', 'hb', 'hb_1', 'rf_mask', 'rf_mask_1', 'prune_mask', 'prune_mask_1')
+# training state of the initial DBM (see `DBM.get_training_state`), per-layer entries with suffixes as above
+SHARED_STATE = ('v', 'dvb')
+SHARED_LAYER_STATE = ('H', 'dW', 'dhb', 'q_means', 'mu_means')
+N_LAYERS = 2
+
+
+def run_name(criterion, perc, n_sessions):
+    return f'{criterion}_{perc}perc_{n_sessions}sessions'
+
+
+def is_resumable(model_path, n_sessions):
+    """Whether `model_path` holds the checkpoint of an unfinished run."""
+    state_path = os.path.join(model_path, 'res', 'state.npz')
+    if not os.path.exists(state_path):
+        return False
+    with np.load(state_path) as state:
+        return tuple(state['stage']) != (n_sessions - 1, 1)
+
+
+def _layer_name(name, i):
+    return name if i == 0 else '{0}_{1}'.format(name, i)
+
+
+def shared_filenames():
+    """Names of the files of the shared inputs."""
+    names = ['logreg_' + name + '.npy' for name in SHARED_LOGREG]
+    names += ['dbm_' + name + '.npy' for name in SHARED_DBM]
+    names += ['dbm_state_' + name + '.npy' for name in SHARED_STATE]
+    names += ['dbm_state_' + _layer_name(name, i) + '.npy' for name in SHARED_LAYER_STATE for i in range(N_LAYERS)]
+    return names + ['dbm_params.json']
+
+
+def _mtime(path):
+    """Last modification of `path` or of any file below it, None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    mtimes = [os.path.getmtime(path)]
+    for dirpath, _, filenames in os.walk(path):
+        mtimes += [os.path.getmtime(os.path.join(dirpath, fn)) for fn in filenames]
+    return max(mtimes)
+
+
+def is_up_to_date(shared_path, sources):
+    """Whether all shared inputs exist and are newer than all `sources`."""
+    shared = [_mtime(os.path.join(shared_path, fn)) for fn in shared_filenames()]
+    sources = [_mtime(path) for path in sources]
+    if None in shared or None in sources:
+        return False
+    return min(shared) >= max(sources)
+
+
+def prepare_shared_inputs(shared_path):
+    """Preprocess MNIST, train the initial DBM and the classifier on raw
+    digits if needed, and store their parameters, the training state and
+    hyperparameters of the DBM as files for memory mapping.
+    Nothing is rewritten if these are newer than the classifier and the DBM.
+
+    The data needs no copy: `preprocess_MNIST` already memory maps its cache."""
+    from pruning.MNIST_Baselines import (preprocess_MNIST, get_classifier_trained_on_raw_digits, get_initial_DBM,
+                                         get_initial_args)
+
+    preprocess_MNIST()
+    sources = (os.path.join('..', 'models', 'MNIST', 'logreg_MNIST.pkl'), get_initial_args()['dbm_dirpath'])
+    if is_up_to_date(shared_path, sources):
+        print("Shared inputs are up to date")
+        return
+    logreg_digits = get_classifier_trained_on_raw_digits()
+    dbm = get_initial_DBM()
+    params = dict(dbm.get_tf_params(scope='weights'), **dbm.get_tf_params(scope='masks'))
+    state = dbm.get_training_state()
+    if not os.path.exists(shared_path):
+        os.makedirs(shared_path)
+    for name in SHARED_LOGREG:
+        np.save(os.path.join(shared_path, 'logreg_' + name + '.npy'), getattr(logreg_digits, name))
+    for name in SHARED_DBM:
+        np.save(os.path.join(shared_path, 'dbm_' + name + '.npy'), params[name])
+    for name in SHARED_STATE:
+        np.save(os.path.join(shared_path, 'dbm_state_' + name + '.npy'), state[name])
+    for name in SHARED_LAYER_STATE:
+        for i, x in enumerate(state[name]):
+            np.save(os.path.join(shared_path, 'dbm_state_' + _layer_name(name, i) + '.npy'), x)
+    shutil.copyfile(dbm._params_filepath, os.path.join(shared_path, 'dbm_params.json'))
+
+
+def load_shared_inputs(shared_path):
+    """Read-only memory maps of the data, the classifier on raw digits and
+    the parameters and training state of the initial DBM, shared between
+    all runs on the node, and the hyperparameters of the initial DBM."""
+    from sklearn.linear_model import LogisticRegression
+    from pruning.MNIST_Baselines import preprocess_MNIST
+
+    logreg_digits = LogisticRegression(multi_class='multinomial')
+    for name in SHARED_LOGREG:
+        setattr(logreg_digits, name, np.load(os.path.join(shared_path, 'logreg_' + name + '.npy'), mmap_mode='r'))
+    initial_params = {name: np.load(os.path.join(shared_path, 'dbm_' + name + '.npy'), mmap_mode='r')
+                      for name in SHARED_DBM}
+
+    def load_state(name):
+        return np.load(os.path.join(shared_path, 'dbm_state_' + name + '.npy'), mmap_mode='r')
+    initial_state = {name: load_state(name) for name in SHARED_STATE}
+    initial_state.update({name: [load_state(_layer_name(name, i)) for i in range(N_LAYERS)]
+                          for name in SHARED_LAYER_STATE})
+    with open(os.path.join(shared_path, 'dbm_params.json'), 'r') as f:
+        initial_config = json.load(f)
+    return preprocess_MNIST(), logreg_digits, initial_params, initial_config, initial_state
+
+
+def _run(job):
+    criterion, perc, n_sessions, root, shared_path, estimator, rao_blackwell, n_threads = job
+    name = run_name(criterion, perc, n_sessions)
+    try:
+        from pruning.session import PruningSession
+
+        script = importlib.import_module('pruning.' + CRITERIA[criterion])
+        data, logreg_digits, initial_params, initial_config, initial_state = load_shared_inputs(shared_path)
+        np.random.seed(42)
+        session = PruningSession(script.make_criterion(perc), os.path.join(root, name), n_sessions=n_sessions,
+                                 script_path=script.__file__, data=data, logreg_digits=logreg_digits,
+                                 initial_params=initial_params, initial_config=initial_config,
+                                 initial_state=initial_state, n_threads=n_threads,
+                                 estimator=estimator, rao_blackwell=rao_blackwell)
+        session.run()
+        return name, session.results, None
+    except Exception:
+        return name, None, traceback.format_exc()
+
+
+def n_workers(n_runs, n_cpus=None, memory=None, memory_per_run=8.):
+    """Number of runs that fit into the CPU and memory (in GB) budgets of the node."""
+    if n_cpus is None:
+        n_cpus = os.cpu_count() or 1
+    if memory is None:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024.**3
+    return max(1, min(n_runs, n_cpus, int(memory // memory_per_run)))
+
+
+def sweep(criteria, percs=(10,), n_sessions=(10,), root=None, n_cpus=None, memory=None, memory_per_run=8.,
+          estimator=None, rao_blackwell=False):
+    """Run a grid of pruning experiments on a local process pool.
+
+    Shared read-only inputs are prepared once (and kept while up to date),
+    including everything needed to build a copy of the initial DBM without
+    reading it from disk. Each run then gets a fresh process (TF graphs are
+    not shared between runs), and the CPUs are split evenly between the TF
+    thread pools of the concurrent runs. Interrupted runs are resumed,
+    finished ones are skipped. The results of all runs are collected in
+    `root`/sweep_results.npz as '<run name>/<result>' entries.
+
+    Parameters
+    ----------
+    criteria : iterable of str
+        Keys of `CRITERIA`, see `make_criterion` of the corresponding scripts.
+    percs : iterable of int
+        Percentages of weights removed per session.
+    n_sessions : iterable of positive int
+        Numbers of pruning sessions.
+    root : None or str
+        Where the models of all runs are saved (default: ../models/MNIST).
+    n_cpus, memory, memory_per_run :
+        Budgets of the node, see `n_workers`.
+    estimator, rao_blackwell :
+        How the FI is estimated in all runs, see `PruningSession`.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of runs that failed, by run name.
+    """
+    if root is None:
+        root = os.path.join('..', 'models', 'MNIST')
+    shared_path = os.path.join(root, 'sweep_shared')
+
+    jobs = []
+    for criterion, perc, n in itertools.product(criteria, percs, n_sessions):
+        if criterion not in CRITERIA:
+            raise ValueError('unknown criterion {0!r}, choose from {1}'.format(criterion, sorted(CRITERIA)))
+        model_path = os.path.join(root, run_name(criterion, perc, n))
+        if os.path.exists(model_path) and not is_resumable(model_path, n):
+            print("Skip", run_name(criterion, perc, n), "- model path already exists")
+            continue
+        jobs.append((criterion, perc, n, root, shared_path, estimator, rao_blackwell))
+    if n_cpus is None:
+        n_cpus = os.cpu_count() or 1
+
+    # fresh interpreters: TF must not be forked, and the parent stays lightweight
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        pool.apply(prepare_shared_inputs, (shared_path,))
+
+    results, failed = {}, {}
+    if jobs:
+        n = n_workers(len(jobs), n_cpus=n_cpus, memory=memory, memory_per_run=memory_per_run)
+        n_threads = max(1, n_cpus // n)
+        print("Running", len(jobs), "pruning experiments on", n, "processes with", n_threads, "threads each")
+        with ctx.Pool(n, maxtasksperchild=1) as pool:
+            for name, res, error in pool.imap_unordered(_run, [job + (n_threads,) for job in jobs]):
+                if error is None:
+                    print("Finished", name)
+                    results.update({name + '/' + k: v for k, v in res.items()})
+                else:
+                    print("Failed", name, "\n", error)
+                    failed[name] = error
+
+    path = os.path.join(root, 'sweep_results.npz')
+    if os.path.exists(path):
+        with np.load(path) as previous:
+            results = dict({k: previous[k] for k in previous.files}, **results)
+    np.savez(path, **results)
+    return failed
+
+
+if __name__ == '__main__':
+
+    def check_positive(value):
+        ivalue = int(value)
+        if ivalue <= 0:
+            raise argparse.ArgumentTypeError('Not a positive integer.')
+        return ivalue
+
+    parser = argparse.ArgumentParser(description = 'Sweep of DBM Pruning experiments')
+    parser.add_argument('--criteria', nargs='+', default=sorted(CRITERIA), choices=sorted(CRITERIA), help='Pruning criteria')
+    parser.add_argument('--percentiles', nargs='+', default=[10], type=int, choices=range(1, 100), help='Percentages of weights removed in each iteration')
+    parser.add_argument('--n_pruning_sessions', nargs='+', default=[10], type=check_positive, help='Numbers of pruning sessions')
+    parser.add_argument('--n_cpus', default=None, type=check_positive, help='Number of CPUs to use (default: all)')
+    parser.add_argument('--memory', default=None, type=float, help='Memory budget in GB (default: all)')
+    parser.add_argument('--memory_per_run', default=8., type=float, help='Memory needed by a single run in GB')
+    parser.add_argument('--estimator', default=None, choices=('samples', 'streaming', 'in_graph', 'sequential'), help='How the FI is estimated (default: depends on the criterion)')
+    parser.add_argument('--rao_blackwell', action='store_true', help='Estimate the FI from conditional means of the first hidden layer')
+
+    args = parser.parse_args()
+
+    sweep(args.criteria, args.percentiles, args.n_pruning_sessions, n_cpus=args.n_cpus,
+          memory=args.memory, memory_per_run=args.memory_per_run, estimator=args.estimator,
+          rao_blackwell=args.rao_blackwell)
@@ -0,0 +1,61 @@
+import os
+import sys
+import numpy as np
+from shutil import rmtree
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose
+
+# the pruning scripts import `env` to find the packages of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm.dbm import DBM
+from bm.rbm import BernoulliRBM
+from bm.utils.lineage import MaskLineage
+from pruning.session import PruningSession
+
+
+class KeepDiagonal(object):
+    """Keep all weights of the first layer and the diagonal of the second."""
+    cross_layer = True
+
+    def __call__(self, weights, masks, fi, layers):
+        return [np.ones_like(weights[0]), np.eye(*weights[1].shape)], [0., 0.]
+
+
+class TestPruningSession(object):
+    def setup_method(self):
+        self.path = mkdtemp()
+        self.n_visible, self.n_hidden = 6, 30
+
+    def teardown_method(self):
+        rmtree(self.path)
+
+    def make_session(self, sparse_layers):
+        rbms = [BernoulliRBM(n_visible=n_visible, n_hidden=self.n_hidden, random_seed=1337,
+                             model_path=os.path.join(self.path, 'rbm_{0}/'.format(i))).init()
+                for i, n_visible in enumerate((self.n_visible, self.n_hidden))]
+        dbm = DBM(rbms=rbms, n_particles=4, sparse_layers=sparse_layers, random_seed=1337,
+                  model_path=os.path.join(self.path, 'dbm/')).init()
+
+        session = PruningSession(KeepDiagonal(), os.path.join(self.path, 'pruned'), n_sessions=1)
+        session.load_state(dbm)
+        session.unit_ids = [np.arange(n) for n in session.layer_sizes]
+        session.lineage = MaskLineage(os.path.join(self.path, 'masks'))
+        session.results = {'pruning_thresholds': np.zeros((1, 2)),
+                           'unconnected_v': np.zeros((1, self.n_visible), dtype=bool)}
+        session.fi, session.layers = None, [None] * 3
+        return session
+
+    def test_prune_to_local(self):
+        for sparse_layers in ((False, False), (False, True)):
+            session = self.make_session(sparse_layers)
+            W, W_1 = session.weights
+            session.prune(0)
+
+            assert list(session.dbm.local_layers) == [False, True]
+            assert list(session.dbm.sparse_layers) == [False, False]
+            assert_allclose(session.weights[0], W)
+            assert_allclose(session.weights[1], W_1 * np.eye(self.n_hidden))
+            assert_allclose(session.masks[1], np.eye(self.n_hidden))
+            rmtree(self.path)
+            os.makedirs(self.path)